@@ -1,8 +1,10 @@
+from collections import deque
+
 from rich.pretty import pprint
 
 from src.graph import graph
 from src.state import AgentState
-from langchain_core.messages import HumanMessage, AIMessage, trim_messages
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, trim_messages
 from src.config import Config
 
 
@@ -13,20 +15,17 @@ class ConversationManager:
         self.thread_id = thread_id
         self.config = {"configurable": {"thread_id": thread_id}}
 
-    def ask(self, query: str) -> str:
-        """提问并获取答案"""
+        # 本地维护最近的对话历史，maxlen 自动丢弃最旧的消息，避免每轮都读取 checkpoint
+        self._messages: deque[BaseMessage] = deque(maxlen=Config.MAX_HISTORY_MESSAGES)
 
-        # 获取当前状态（包含历史）
+        # 已有会话时从 checkpoint 预热一次
         current_state = graph.get_state(self.config)
-
         if current_state.values:
-            messages = current_state.values.get("messages", [])
-        else:
-            messages = []
+            self._messages.extend(current_state.values.get("messages", []))
 
-        # 限制历史长度
-        if len(messages) > Config.MAX_HISTORY_MESSAGES:
-            messages = messages[-Config.MAX_HISTORY_MESSAGES:]
+    def ask(self, query: str) -> str:
+        """提问并获取答案"""
+        messages = list(self._messages)
 
         # 创建新状态
         initial_state = AgentState(
@@ -39,12 +38,18 @@ class ConversationManager:
         )
 
         # 执行
-        result = None
-        for event in graph.stream(initial_state, self.config, stream_mode="values"):
-            step = event.get("current_step", "")
-            if step:
-                print(f"  {step}")
-            result = event
+        # stream_mode="updates" 只产出每个节点的更新，合并后得到最终结果
+        result = {}
+        for event in graph.stream(initial_state, self.config, stream_mode="updates"):
+            for update in event.values():
+                update = update or {}
+                step = update.get("current_step", "")
+                if step:
+                    print(f"  {step}")
+                result.update(update)
+
+        # 只追加本轮新增的问答（HumanMessage + AIMessage）
+        self._messages.extend(result.get("messages", [])[-2:])
 
         return result["final_answer"]
 
@@ -20,19 +20,23 @@ def run_with_streaming(query: str, thread_id: str = "demo"):
     print(f"问题: {query}")
     print(f"{'=' * 60}\n")
 
-    # 流式执行
-    for event in graph.stream(initial_state, config, stream_mode="values"):
-        step = event.get("current_step", "")
-        if step:
-            print(f"{step}")
+    # 流式执行（只接收每个节点的增量更新）
+    for event in graph.stream(initial_state, config, stream_mode="updates"):
+        for update in event.values():
+            step = (update or {}).get("current_step", "")
+            if step:
+                print(f"{step}")
+
+    # 最终结果从 checkpoint 读取一次
+    result = graph.get_state(config).values
 
     # 打印最终答案
     print(f"\n{'=' * 60}")
     print("答案:")
-    print(event["final_answer"])
+    print(result["final_answer"])
     print(f"{'=' * 60}\n")
 
-    return event
+    return result
 
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+"""
+相同请求合并（request coalescing）
+
+高并发下同一个热门问题（如"什么是 RAG"）可能在极短时间内被重复提交。
+合并层按 key 记录正在执行的计算：
+- 同 key 的请求到达时，如果已有计算在执行，直接等待它的结果
+- 计算完成后结果再保留一个短窗口（默认 50ms），窗口内到达的相同请求直接复用
+
+计算以独立的 Task 运行，不属于任何一个请求：发起计算的请求被取消（客户端断开）时，
+其余等待方照常拿到结果；只有所有等待方都离开后才取消计算。
+
+只合并计算本身，会话状态由调用方各自处理（如把结果写入各自的 thread），
+有会话历史的请求结果不能共享。
+
+使用方式：
+    coalescer = RequestCoalescer()
+    result = await coalescer.run(key, lambda: graph.ainvoke(state, config))
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class RequestCoalescer:
+    """把相同 key 的并发请求合并为一次执行"""
+
+    def __init__(self, window: float = 0.05):
+        """
+        Args:
+            window: 请求完成后结果继续复用的时间（秒）
+        """
+        self.window = window
+        self.inflight: Dict[Hashable, asyncio.Task] = {}
+        # 执行中的计算 -> 仍在等待它的请求数
+        self._waiters: Dict[asyncio.Task, int] = {}
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行 factory() 并返回结果；相同 key 的请求共享同一次执行
+
+        Args:
+            key: 请求标识，相同 key 视为相同请求
+            factory: 无参协程工厂，只有首个请求会调用
+        """
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.inflight[key] = task
+            self._waiters[task] = 0
+            task.add_done_callback(lambda t: self._on_done(key, t))
+
+        if not task.done():
+            self._waiters[task] += 1
+        try:
+            # shield：某个等待方被取消时不影响计算本身和其他等待方
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                self._waiters[task] -= 1
+                if self._waiters[task] == 0:
+                    # 所有等待方都已离开，不再继续计算
+                    task.cancel()
+            raise
+
+    def _on_done(self, key: Hashable, task: asyncio.Task):
+        self._waiters.pop(task, None)
+        if task.cancelled() or task.exception() is not None:
+            # 失败结果不缓存，立即移除，后续请求重新执行
+            self._expire(key, task)
+        else:
+            asyncio.get_running_loop().call_later(self.window, self._expire, key, task)
+
+    def _expire(self, key: Hashable, task: asyncio.Task):
+        """窗口结束后移除结果（只移除自己那一份，避免误删新一轮请求）"""
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
@@ -8,7 +8,8 @@ FastAPI 服务器 - 提供 RESTful API 和 SSE 流式输出
 API 端点：
     POST /ask         - 普通问答（返回完整结果）
     POST /ask/stream  - 流式问答（SSE 实时输出）
-    POST /documents   - 上传文档到知识库
+    POST /documents   - 上传文档到知识库（后台导入，返回 job_id）
+    GET  /documents/jobs/{job_id} - 查询文档导入进度
     GET  /documents   - 列出已索引文档
     DELETE /documents - 清空知识库
     GET  /health      - 健康检查
@@ -22,9 +23,11 @@ if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
 import asyncio
-import json
+import orjson
 import uuid
+import shutil
 import tempfile
+from collections import OrderedDict
 from typing import Optional, List
 from contextlib import asynccontextmanager
 
@@ -33,9 +36,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from src.graph_advanced import graph_advanced, create_initial_state
+from src.graph_advanced import create_advanced_graph, create_initial_state
 from src.rag.rag_manager import RAGManager
 from src.config import Config
+from src.persistence import build_async_checkpointer
+from src.api._coalesce import RequestCoalescer
 
 
 # ============ Pydantic 模型 ============
@@ -58,10 +63,13 @@ class AskResponse(BaseModel):
     thread_id: str
 
 
-class DocumentInfo(BaseModel):
-    """文档信息"""
+class IngestJobInfo(BaseModel):
+    """文档导入任务"""
+    job_id: str
     filename: str
-    chunks: int
+    status: str  # queued / running / completed / failed
+    chunks: Optional[int] = None
+    error: Optional[str] = None
 
 
 class HealthResponse(BaseModel):
@@ -76,10 +84,15 @@ class HealthResponse(BaseModel):
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     print("🚀 Smart Search Assistant API 启动中...")
-    # 预热 RAG 管理器
-    RAGManager.get_instance()
-    print("✅ 服务就绪")
-    yield
+    # 预热 RAG 管理器，并用假数据跑一次模型推理，避免首个请求冷启动
+    rag = RAGManager.get_instance()
+    await asyncio.to_thread(rag.warmup)
+    # 使用异步持久化器编译 Graph，请求中直接 ainvoke/astream，
+    # 同步节点由 LangGraph 自行放到线程池执行，无需包装整个 Graph 调用
+    async with build_async_checkpointer("checkpoints_advanced.db") as checkpointer:
+        app.state.graph = create_advanced_graph(checkpointer=checkpointer)
+        print("✅ 服务就绪")
+        yield
     print("👋 服务关闭")
 
 
@@ -113,6 +126,16 @@ async def health_check():
     )
 
 
+# 合并并发的相同无状态问答请求
+ask_coalescer = RequestCoalescer()
+
+
+async def _invoke_with_thread(state, config):
+    """执行 Graph，并带上本次使用的 thread_id"""
+    result = await app.state.graph.ainvoke(state, config)
+    return config["configurable"]["thread_id"], result
+
+
 @app.post("/ask", response_model=AskResponse)
 async def ask(request: AskRequest):
     """
@@ -120,7 +143,7 @@ async def ask(request: AskRequest):
 
     返回完整的回答结果，适合对延迟不敏感的场景
     """
-    thread_id = request.thread_id or str(uuid.uuid4())
+    thread_id = request.thread_id or uuid.uuid4().hex
     config = {"configurable": {"thread_id": thread_id}}
 
     state = create_initial_state(
@@ -130,9 +153,18 @@ async def ask(request: AskRequest):
     )
 
     try:
-        result = await asyncio.to_thread(
-            graph_advanced.invoke, state, config
-        )
+        if request.thread_id is None:
+            # 无状态请求：相同问题在短时间内只执行一次 Graph
+            key = (request.query, request.use_multi_query, request.max_loops)
+            computed_thread_id, result = await ask_coalescer.run(
+                key, lambda: _invoke_with_thread(state, config)
+            )
+            if computed_thread_id != thread_id:
+                # 复用了其他请求的计算结果：写入本请求自己的 thread（作为 answer 节点的输出，
+                # 即已执行完毕），会话互相隔离，后续追问只看到自己的历史
+                await app.state.graph.aupdate_state(config, result, as_node="answer")
+        else:
+            result = await app.state.graph.ainvoke(state, config)
 
         return AskResponse(
             answer=result.get("final_answer", ""),
@@ -147,6 +179,51 @@ async def ask(request: AskRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# 节点名 -> (进度描述, 进度百分比)
+NODE_PROGRESS = {
+    "decide": ("🤔 判断搜索类型...", 10),
+    "expand": ("🔄 扩展查询...", 20),
+    "local_rag": ("🔍 执行搜索...", 40),
+    "web_search": ("🔍 执行搜索...", 40),
+    "hybrid_search": ("🔍 执行搜索...", 40),
+    "skip_search": ("💭 无需搜索...", 40),
+    "reflector": ("🧐 评估结果...", 60),
+    "refine": ("🔄 改进搜索...", 70),
+    "answer": ("✍️ 生成答案...", 90),
+}
+
+def _sse(event: str, data: dict) -> bytes:
+    """编码一条 SSE 事件（orjson 直接输出 UTF-8 字节，无需再 encode）"""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+# 进度事件内容固定，导入时预先编码为 SSE 字节串，请求时直接推送
+STEP_EVENTS = {
+    node_name: _sse("step", {"step": desc, "progress": progress, "node": node_name})
+    for node_name, (desc, progress) in NODE_PROGRESS.items()
+}
+
+
+async def _stream_updates(state: dict, config: dict):
+    """
+    逐个产出 (事件类型, 节点名, 数据)
+
+    - ("update", 节点名, 节点更新)：节点执行完成
+    - ("token", 节点名, 文本片段)：answer 节点生成的 token
+    """
+    async for mode, payload in app.state.graph.astream(
+        state, config, stream_mode=["updates", "messages"]
+    ):
+        if mode == "updates":
+            for node_name, update in payload.items():
+                yield "update", node_name, update or {}
+        else:
+            chunk, metadata = payload
+            node_name = metadata.get("langgraph_node", "")
+            if node_name == "answer" and chunk.content:
+                yield "token", node_name, chunk.content
+
+
 @app.post("/ask/stream")
 async def ask_stream(request: AskRequest):
     """
@@ -156,7 +233,10 @@ async def ask_stream(request: AskRequest):
 
     SSE 事件格式：
         event: step
-        data: {"step": "🔄 正在扩展查询...", "progress": 20}
+        data: {"step": "🔄 扩展查询...", "progress": 20, "node": "expand"}
+
+        event: token
+        data: {"content": "..."}   # 答案生成过程中逐段推送
 
         event: answer
         data: {"answer": "...", "sources": [...]}
@@ -164,7 +244,7 @@ async def ask_stream(request: AskRequest):
         event: done
         data: {"status": "completed"}
     """
-    thread_id = request.thread_id or str(uuid.uuid4())
+    thread_id = request.thread_id or uuid.uuid4().hex
 
     async def event_generator():
         config = {"configurable": {"thread_id": thread_id}}
@@ -174,27 +254,25 @@ async def ask_stream(request: AskRequest):
             max_loops=request.max_loops
         )
 
-        steps = [
-            ("decide", "🤔 判断搜索类型...", 10),
-            ("expand", "🔄 扩展查询...", 20),
-            ("search", "🔍 执行搜索...", 40),
-            ("reflect", "🧐 评估结果...", 60),
-            ("answer", "✍️ 生成答案...", 80),
-        ]
-
         try:
             # 发送开始事件
-            yield f"event: start\ndata: {json.dumps({'thread_id': thread_id, 'query': request.query})}\n\n"
-
-            # 模拟步骤进度（实际可以通过回调获取）
-            for step_name, step_desc, progress in steps:
-                yield f"event: step\ndata: {json.dumps({'step': step_desc, 'progress': progress})}\n\n"
-                await asyncio.sleep(0.1)
-
-            # 执行实际查询
-            result = await asyncio.to_thread(
-                graph_advanced.invoke, state, config
-            )
+            yield _sse("start", {"thread_id": thread_id, "query": request.query})
+
+            # 执行实际查询，每个节点完成时推送真实进度
+            result = dict(state)
+            async for kind, node_name, data in _stream_updates(state, config):
+                if kind == "token":
+                    yield _sse("token", {"content": data})
+                    continue
+
+                update = data
+                result.update(update)
+                step_event = STEP_EVENTS.get(node_name)
+                if step_event is None:
+                    # 未登记的节点（如后续新增）才在运行时序列化
+                    step_desc = update.get("current_step", node_name)
+                    step_event = _sse("step", {"step": step_desc, "progress": None, "node": node_name})
+                yield step_event
 
             # 发送答案
             answer_data = {
@@ -205,13 +283,13 @@ async def ask_stream(request: AskRequest):
                 "reflection_result": result.get("reflection_result", ""),
                 "expanded_queries": result.get("expanded_queries", [])
             }
-            yield f"event: answer\ndata: {json.dumps(answer_data, ensure_ascii=False)}\n\n"
+            yield _sse("answer", answer_data)
 
             # 发送完成事件
-            yield f"event: done\ndata: {json.dumps({'status': 'completed', 'thread_id': thread_id})}\n\n"
+            yield _sse("done", {"status": "completed", "thread_id": thread_id})
 
         except Exception as e:
-            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            yield _sse("error", {"error": str(e)})
 
     return StreamingResponse(
         event_generator(),
@@ -223,15 +301,50 @@ async def ask_stream(request: AskRequest):
     )
 
 
-@app.post("/documents", response_model=DocumentInfo)
+# 文档导入任务状态（进程内存储）：job_id -> IngestJobInfo，按创建顺序排列
+ingest_jobs: "OrderedDict[str, IngestJobInfo]" = OrderedDict()
+# 最多保留的任务数：超出时从最早的任务开始淘汰已结束（completed / failed）的任务，
+# 排队中 / 运行中的任务不淘汰
+MAX_INGEST_JOBS = 256
+
+
+def _register_job(job: IngestJobInfo):
+    """登记导入任务，超出上限时淘汰最早结束的任务"""
+    ingest_jobs[job.job_id] = job
+    if len(ingest_jobs) > MAX_INGEST_JOBS:
+        finished = [jid for jid, j in ingest_jobs.items() if j.status in ("completed", "failed")]
+        for jid in finished[:len(ingest_jobs) - MAX_INGEST_JOBS]:
+            del ingest_jobs[jid]
+
+
+def _ingest_and_cleanup(tmp_path: str, job_id: str):
+    """后台任务：导入文档并清理临时文件"""
+    job = ingest_jobs[job_id]
+    job.status = "running"
+    try:
+        rag = RAGManager.get_instance()
+        job.chunks = rag.add_document(tmp_path)
+        job.status = "completed"
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        # 清理临时文件
+        os.unlink(tmp_path)
+
+
+@app.post("/documents", response_model=IngestJobInfo, status_code=202)
 async def upload_document(
-    file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = None
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...)
 ):
     """
     上传文档到知识库
 
     支持格式：.pdf, .txt, .md
+
+    文档保存后立即返回 202 和 job_id，切分 + Embedding 在后台执行，
+    通过 GET /documents/jobs/{job_id} 查询导入进度
     """
     # 验证文件类型
     allowed_extensions = ('.pdf', '.txt', '.md')
@@ -241,25 +354,30 @@ async def upload_document(
             detail=f"不支持的文件类型，仅支持: {', '.join(allowed_extensions)}"
         )
 
-    # 保存到临时文件
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp_path = tmp.name
-
+    # 分块流式写入临时文件，内存占用与文件大小无关；写入失败（或请求被取消）时删除临时文件
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1])
     try:
-        rag = RAGManager.get_instance()
-        chunks = rag.add_document(tmp_path)
-
-        return DocumentInfo(
-            filename=file.filename,
-            chunks=chunks
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        os.unlink(tmp_path)
+        with tmp:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, tmp, 1 << 20)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+    tmp_path = tmp.name
+
+    job_id = uuid.uuid4().hex
+    job = IngestJobInfo(job_id=job_id, filename=file.filename, status="queued")
+    _register_job(job)
+    background_tasks.add_task(_ingest_and_cleanup, tmp_path, job_id)
+    return job
+
+
+@app.get("/documents/jobs/{job_id}", response_model=IngestJobInfo)
+async def get_ingest_job(job_id: str):
+    """查询文档导入任务状态"""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return job
 
 
 @app.get("/documents")
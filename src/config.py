@@ -1,61 +1,133 @@
 import os
+from dataclasses import dataclass
+from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
-class Config:
-    """配置类"""
+@dataclass(frozen=True, slots=True)
+class _Config:
+    """配置类（导入时构建一次，只读）"""
     # API Keys
-    DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
-    MINIMAX_API_KEY = os.getenv("MINIMAX_API_KEY")
-    TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")  # 可选
-
-    MINIMAX_API_KEY = os.getenv("MINIMAX_API_KEY")
+    DASHSCOPE_API_KEY: Optional[str] = os.getenv("DASHSCOPE_API_KEY")
+    MINIMAX_API_KEY: Optional[str] = os.getenv("MINIMAX_API_KEY")
+    TAVILY_API_KEY: Optional[str] = os.getenv("TAVILY_API_KEY")  # 可选
 
     # 模型配置
     #deepseek-r1模型
-    DEEPSEEK_MODEL_NAME = "deepseek-r1"
-    DEEPSEEK_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+    DEEPSEEK_MODEL_NAME: str = "deepseek-r1"
+    DEEPSEEK_BASE_URL: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 
     # minimax模型
-    MINIMAX_MODEL_NAME = "MiniMax-M2"
-    MINIMAX_BASE_URL = "https://api.minimax.io/v1"
+    MINIMAX_MODEL_NAME: str = "MiniMax-M2"
+    MINIMAX_BASE_URL: str = "https://api.minimax.io/v1"
 
     #qwen-plus模型
-    QWEN_MODEL_NAME = "qwen-plus"
-    QWEN_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+    QWEN_MODEL_NAME: str = "qwen-plus"
+    QWEN_BASE_URL: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 
 
     #默认提供的大模型
-    LLM_PROVIDER = "qwen"
+    LLM_PROVIDER: str = "qwen"
+    # LLM 请求超时（秒）
+    LLM_TIMEOUT: float = 60.0
+    # 网络搜索请求超时（秒）
+    SEARCH_TIMEOUT: float = 30.0
 
     # 对话配置
-    MAX_HISTORY_MESSAGES = 10  # 保留最近5轮（5问+5答）
+    MAX_HISTORY_MESSAGES: int = 10  # 保留最近5轮（5问+5答）
+    MAX_HISTORY_TOKENS: int = 2000  # 生成答案时发送给 LLM 的历史消息 token 上限
+    HISTORY_SUMMARY_EVERY: int = 5  # 每 N 轮把超出上限的旧消息合并进滚动摘要（0 表示不做摘要）
 
     # 持久化配置
-    CHECKPOINT_DIR = "./checkpoints"
+    CHECKPOINT_DIR: str = "./checkpoints"
+    # Checkpoint 后端："sqlite"（本地开发默认）| "postgres"（生产多并发）
+    CHECKPOINTER_BACKEND: str = os.getenv("CHECKPOINTER_BACKEND", "sqlite")
+    POSTGRES_URL: Optional[str] = os.getenv("POSTGRES_URL")
+
+    # 路由判断缓存：进程内 LRU 容量、有效期（秒）
+    DECIDE_CACHE_SIZE: int = 1024
+    DECIDE_CACHE_TTL: int = 7 * 24 * 3600
+    # 路由判断的同时推测性地执行查询扩展（判断为 COMPLEX 时直接使用，省掉一次串行的 LLM 调用）
+    SPECULATIVE_EXPAND: bool = True
+    # 短查询快速路径：少于该字符数、空格分隔且不含疑问词的关键词查询不调用 LLM 路由（知识库为空走网络搜索，否则走混合检索）
+    SHORT_QUERY_CHARS: int = 12
+    # 少于该字符数的查询不做 Multi-Query 扩展（关键词太少，扩展只会得到近义改写）
+    MIN_EXPAND_QUERY_CHARS: int = 15
+    # 路由 / 反思判断的语义缓存：近似问题复用之前的判断结果
+    DECISION_CACHE_THRESHOLD: float = 0.93
+
 
-    
     # === RAG 配置 ===
     # Embedding 模型
-    EMBEDDING_MODEL = "shibing624/text2vec-base-chinese"
-    
+    EMBEDDING_MODEL: str = "shibing624/text2vec-base-chinese"
+
     # Rerank 模型
-    RERANK_MODEL = "BAAI/bge-reranker-base"
-    
+    RERANK_MODEL: str = "BAAI/bge-reranker-base"
+
     # 知识库目录
-    KNOWLEDGE_DIR = "./data/knowledge"
-    
+    KNOWLEDGE_DIR: str = "./data/knowledge"
+
     # 向量数据库目录
-    VECTOR_DB_DIR = "./data/vector_db"
-    
+    VECTOR_DB_DIR: str = "./data/vector_db"
+
     # 切分配置
-    CHUNK_SIZE = 500
-    CHUNK_OVERLAP = 100
-    
+    CHUNK_SIZE: int = 500
+    CHUNK_OVERLAP: int = 100
+
     # 检索配置
-    VECTOR_SEARCH_TOP_K = 20
-    RERANK_TOP_N = 5
-    VECTOR_WEIGHT = 0.6
-    USE_RERANK = True
+    VECTOR_SEARCH_TOP_K: int = 20
+    RERANK_TOP_N: int = 5
+    VECTOR_WEIGHT: float = 0.6
+    USE_RERANK: bool = True
+    # Embedding / Rerank 推理后端："torch"（默认）| "onnx"（ONNX Runtime）| "compile"（torch.compile）
+    # | "onnx-int8"（Embedding 动态量化为 int8 的 ONNX 模型，Rerank 使用 ONNX）
+    EMBED_BACKEND: str = "torch"
+    # int8 量化的目标指令集："avx512_vnni" | "avx512" | "avx2" | "arm64"
+    EMBED_QUANT_CONFIG: str = "avx512_vnni"
+    # 量化后模型的保存目录（首次导出后复用）
+    QUANTIZED_MODEL_DIR: str = "./data/models"
+
+    # 关键词检索的 jieba 自定义词典（每行 "词 词频 词性"），文件不存在时忽略
+    JIEBA_USER_DICT: str = "./data/user_dict.txt"
+
+    # 检索结果语义缓存：相似问题直接复用之前的检索结果
+    USE_SEMANTIC_CACHE: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95  # 命中所需的最小余弦相似度
+    SEMANTIC_CACHE_SIZE: int = 2048
+    SEMANTIC_CACHE_TTL: int = 3600  # 秒，网络结果有时效性
+    # Multi-Query 结果融合：候选数超过该值时用 MMR 做多样性选择
+    MMR_MIN_CANDIDATES: int = 8
+    MMR_LAMBDA: float = 0.7  # 相关度权重（越小越偏向多样性）
+    # Multi-Query 扩展结果的语义缓存（扩展不随时间失效，阈值更严格）
+    EXPANSION_CACHE_THRESHOLD: float = 0.97
+    EXPANSION_CACHE_TTL: int = 7 * 24 * 3600
+    # RAGManager.query 的本地检索结果缓存（知识库变化时自动失效，本身不随时间过期）
+    RETRIEVAL_CACHE_THRESHOLD: float = 0.97
+    RETRIEVAL_CACHE_TTL: int = 7 * 24 * 3600
+    # 反思循环提前结束：改进查询与之前的查询相似度超过该值时不再重新检索
+    REFINE_SIMILARITY_THRESHOLD: float = 0.97
+
+    # === 评估配置 ===
+    # 评估时最多同时进行的样本数（避免触发 API 限流）
+    EVAL_CONCURRENCY: int = 16
+    # 送入评判模型的上下文 token 上限
+    EVAL_CONTEXT_TOKENS: int = 2000
+
+
+# 全局唯一配置实例
+Config = _Config()
+
+_dirs_ready = False
+
+
+def ensure_dirs():
+    """创建运行时需要的目录（进程内只执行一次，其他模块无需再各自 makedirs）"""
+    global _dirs_ready
+    if not _dirs_ready:
+        os.makedirs(Config.CHECKPOINT_DIR, exist_ok=True)
+        _dirs_ready = True
+
+
+ensure_dirs()
@@ -0,0 +1,144 @@
+"""
+评判模型请求批处理器
+
+并发评估时，大量评判请求会在几毫秒内先后到达。批处理器把它们收集到队列中，
+凑满 max_batch_size 或等待超过 max_delay 后统一发出：
+- 同一批请求通过 asyncio.gather 并发执行；每批作为独立任务发出，worker 不等待上一批返回，
+  继续收集下一批（批次之间不会串行成一波一波）
+- 所有请求共用一个 AsyncOpenAI 客户端（HTTP/2 + keep-alive 连接池），
+  避免每次调用重新建立 TCP/TLS 连接
+
+使用方式：
+    batcher = JudgeBatcher()
+    content = await batcher.process_batched(prompt)
+"""
+import asyncio
+import contextlib
+from typing import List, Optional, Set, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+from src.config import Config
+
+
+class JudgeBatcher:
+    """评判模型的异步批处理器"""
+
+    def __init__(
+        self,
+        max_batch_size: int = 16,
+        max_delay: float = 0.01,
+        model: str = Config.QWEN_MODEL_NAME,
+        temperature: float = 0.7
+    ):
+        """
+        Args:
+            max_batch_size: 每批最多合并的请求数
+            max_delay: 凑批的最长等待时间（秒）
+            model: 评判模型名称
+            temperature: 采样温度
+        """
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.model = model
+        self.temperature = temperature
+
+        # 队列、worker 和 HTTP 连接池都绑定在事件循环上，切换事件循环时重建
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._client: Optional[AsyncOpenAI] = None
+        # 正在执行的批次任务（持有引用，防止任务在完成前被垃圾回收）
+        self._batches: Set[asyncio.Task] = set()
+
+    def _ensure_started(self):
+        """在当前事件循环上启动 worker（惰性初始化）"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker and not self._worker.done():
+            return
+
+        # 上一个事件循环的连接池：worker 被取消时已在原事件循环上关闭；
+        # 原事件循环没有取消 worker 就被丢弃时，在这里尽力关闭，避免每次 asyncio.run 泄漏一个客户端
+        if self._client is not None and not self._client.is_closed():
+            loop.create_task(self._close_client(self._client))
+
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._batches = set()
+        # 连接池绑定在事件循环上；同一事件循环内所有评判请求复用已建立的 TLS 连接
+        self._client = AsyncOpenAI(
+            api_key=Config.DASHSCOPE_API_KEY,
+            base_url=Config.QWEN_BASE_URL,
+            http_client=httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+            )
+        )
+        self._worker = loop.create_task(self._run())
+
+    async def process_batched(self, prompt: str, **params) -> str:
+        """
+        提交一个评判 prompt，等待所在批次完成后返回模型输出文本
+
+        Args:
+            prompt: 发送给评判模型的内容
+            **params: 透传给 chat.completions.create 的额外参数（如 response_format）
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        await self._queue.put((prompt, params, future))
+        return await future
+
+    @staticmethod
+    async def _close_client(client: AsyncOpenAI):
+        """关闭客户端连接池，忽略已失效的连接上的错误"""
+        with contextlib.suppress(Exception):
+            await client.close()
+
+    async def _run(self):
+        """后台 worker：不断收集一批请求，每批作为独立任务并发执行"""
+        client = self._client
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = self._loop.time() + self.max_delay
+
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - self._loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                task = self._loop.create_task(self.process_batch(batch))
+                self._batches.add(task)
+                task.add_done_callback(self._batches.discard)
+        finally:
+            # asyncio.run 结束时会取消 worker：在同一事件循环上关闭连接池
+            await self._close_client(client)
+
+    async def process_batch(self, batch: List[Tuple[str, dict, asyncio.Future]]):
+        """并发发出一批请求，并把结果（或异常）回填到各自的 Future"""
+        responses = await asyncio.gather(
+            *[
+                self._client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=self.temperature,
+                    **params
+                )
+                for prompt, params, _ in batch
+            ],
+            return_exceptions=True
+        )
+
+        for (_, _, future), response in zip(batch, responses):
+            if future.done():
+                continue
+            if isinstance(response, BaseException):
+                future.set_exception(response)
+            else:
+                future.set_result(response.choices[0].message.content or "")
@@ -0,0 +1,140 @@
+"""
+评判分数磁盘缓存
+
+评判结果取决于 (指标, 问题, 答案, 上下文, 标准答案)，以及评判配置：
+评判模型、采样温度、评估标准 prompt、上下文 token 预算。反复运行 A/B 实验时，
+相同样本、相同评判配置直接命中缓存，无需再次调用评判模型。
+
+缓存存放在 {CHECKPOINT_DIR}/eval_cache.db（SQLite），key 为上述内容的 BLAKE2b 摘要，
+输入或评判配置变化时 key 自然变化，无需手动失效。表中记录 schema 版本，
+key 的组成方式变化时递增 SCHEMA_VERSION，旧版本的条目自动清除。
+
+评判输出解析失败时的兜底分数不应写入缓存（否则一次异常输出会污染之后所有运行），
+评估方法用 Uncached(value) 包装返回值，装饰器照常返回 value 但不缓存。
+
+使用方式：
+    @cached_score("faithfulness", FAITHFULNESS_HEADER)
+    async def evaluate_faithfulness(self, answer, contexts): ...
+"""
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Optional
+
+from src.config import Config
+
+# key 的组成方式变化时递增，旧版本写入的条目不再被读取
+SCHEMA_VERSION = 2
+
+
+class ScoreCache:
+    """基于 SQLite 的评判分数缓存"""
+
+    def __init__(self, db_path: str):
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(eval_cache)")]
+        if columns and "schema" not in columns:
+            # 旧版表没有 schema 列，条目的 key 不含评判配置，直接丢弃
+            self._conn.execute("DROP TABLE eval_cache")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS eval_cache "
+            "(key TEXT PRIMARY KEY, value TEXT, schema INTEGER NOT NULL)"
+        )
+        self._conn.execute("DELETE FROM eval_cache WHERE schema != ?", (SCHEMA_VERSION,))
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM eval_cache WHERE key = ? AND schema = ?",
+                (key, SCHEMA_VERSION)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO eval_cache (key, value, schema) VALUES (?, ?, ?)",
+                (key, json.dumps(value), SCHEMA_VERSION)
+            )
+            self._conn.commit()
+
+
+_cache: Optional[ScoreCache] = None
+
+
+def get_score_cache() -> ScoreCache:
+    """延迟创建全局缓存实例"""
+    global _cache
+    if _cache is None:
+        _cache = ScoreCache(os.path.join(Config.CHECKPOINT_DIR, "eval_cache.db"))
+    return _cache
+
+
+def make_key(metric: str, *parts: Any) -> str:
+    """把指标名和所有输入拼接后计算摘要，列表参数（contexts）逐项展开"""
+    fields = [metric]
+    for part in parts:
+        if isinstance(part, (list, tuple)):
+            fields.extend(str(p) for p in part)
+        else:
+            fields.append("" if part is None else str(part))
+    return hashlib.blake2b("\x00".join(fields).encode(), digest_size=16).hexdigest()
+
+
+def _judge_config(judge: Any, prompt: str) -> list:
+    """评判配置：模型、采样温度、评估标准 prompt 摘要、上下文 token 预算"""
+    return [
+        getattr(judge, "model", None),
+        getattr(judge, "temperature", None),
+        hashlib.blake2b(prompt.encode(), digest_size=8).hexdigest(),
+        Config.EVAL_CONTEXT_TOKENS,
+    ]
+
+
+class Uncached:
+    """包装不应写入缓存的返回值（如解析失败时的兜底分数）"""
+
+    def __init__(self, value: Any):
+        self.value = value
+
+
+def cached_score(metric: str, prompt: str = "") -> Callable:
+    """
+    缓存异步评估方法的返回值（分数或分数字典）
+
+    Args:
+        metric: 指标名，参与 key 计算，避免不同指标之间串用
+        prompt: 该指标的评估标准 prompt（静态前缀），修改评估标准后旧分数自动失效
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            # 按函数签名绑定参数，保证位置参数/关键字参数调用得到相同的 key
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            key = make_key(
+                metric, *_judge_config(getattr(self, "batcher", None), prompt),
+                *list(bound.arguments.values())[1:]
+            )
+            cache = get_score_cache()
+
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+            result = await func(self, *args, **kwargs)
+            if isinstance(result, Uncached):
+                return result.value
+            cache.set(key, result)
+            return result
+
+        return wrapper
+    return decorator
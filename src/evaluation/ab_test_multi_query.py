@@ -30,14 +30,12 @@ async def run_experimental_run(use_multi_query: bool):
     print(f"\n🚀 开始实验: {'Multi-Query (开启)' if use_multi_query else 'Baseline (关闭)'}")
     print("=" * 60)
     
-    samples = []
-    loop_counts = []
     evaluator = RAGEvaluator()
-    
-    for i, case in enumerate(TEST_CASES, 1):
+
+    async def run_case(i: int, case: dict):
         q = case["question"]
         print(f"[{i}/{len(TEST_CASES)}] 处理问题: {q[:40]}...")
-        
+
         # 构造初始状态
         state = {
             "messages": [],
@@ -46,31 +44,37 @@ async def run_experimental_run(use_multi_query: bool):
             "max_loops": 3,
             "loop_count": 0
         }
-        
-        # 运行图
+
+        # 运行图（SqliteSaver 不支持异步接口，放到线程中并发执行）
         config = {"configurable": {"thread_id": f"ab-test-{'mq' if use_multi_query else 'base'}-{i}"}}
-        result = graph.invoke(state, config)
-        
+        result = await asyncio.to_thread(graph.invoke, state, config)
+        return case, result, result.get("loop_count", 0)
+
+    # 各测试用例相互独立，并发执行
+    results = await asyncio.gather(*[run_case(i, case) for i, case in enumerate(TEST_CASES, 1)])
+
+    samples = []
+    loop_counts = []
+    for case, result, final_loops in results:
         # 记录循环次数
-        final_loops = result.get("loop_count", 0)
         loop_counts.append(final_loops)
-        
+
         # 收集上下文
         contexts = []
         if result.get("local_contexts"):
             contexts.append(result["local_contexts"])
         if result.get("search_results"):
             contexts.append(result["search_results"])
-            
+
         samples.append({
-            "question": q,
+            "question": case["question"],
             "answer": result["final_answer"],
             "contexts": contexts,
             "expected_answer": case["expected_answer"]
         })
-        
+
     print("\n🔍 正在评估质量指标...")
-    report = evaluator.evaluate_batch(samples)
+    report = await evaluator.evaluate_batch(samples)
     avg_loops = sum(loop_counts) / len(loop_counts)
     return report, avg_loops
 
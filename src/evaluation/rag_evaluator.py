@@ -11,13 +11,145 @@ RAG 评估模块
 
 参考框架：RAGAS (https://github.com/explodinggradients/ragas)
 """
+import re
 import json
+import asyncio
+import numpy as np
+import orjson
 from typing import List, Dict, Optional
 from dataclasses import dataclass, asdict
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
 from src.config import Config
-from src.utils.llm_factory import LLMFactory
+from src.evaluation._judge_batcher import JudgeBatcher
+from src.evaluation._score_cache import cached_score, Uncached
+from src.utils.tokens import get_tokenizer
+
+
+# evaluate_all 返回的指标名（与 EvaluationResult 字段一致）
+METRICS = ("faithfulness", "answer_relevancy", "context_precision", "context_recall")
+
+# 全局共享的评判批处理器（延迟创建），多次实验复用已建立的连接
+_JUDGE: Optional[JudgeBatcher] = None
+
+
+def _get_judge() -> JudgeBatcher:
+    """获取全局评判批处理器"""
+    global _JUDGE
+    if _JUDGE is None:
+        _JUDGE = JudgeBatcher()
+    return _JUDGE
+
+
+def _fit_contexts(contexts: List[str], budget: int = Config.EVAL_CONTEXT_TOKENS) -> List[str]:
+    """
+    按 token 预算截取上下文：依次放入，超出预算的那一段截断，之后的丢弃
+
+    Args:
+        contexts: 检索到的上下文列表
+        budget: 上下文总 token 数上限
+    """
+    tok = get_tokenizer()
+    fitted, used = [], 0
+    for c in contexts:
+        remaining = budget - used
+        if remaining <= 0:
+            break
+        if tok:
+            ids = tok.encode(c)
+            if len(ids) > remaining:
+                c = tok.decode(ids[:remaining])
+            used += min(len(ids), remaining)
+        else:
+            c = c[:remaining]
+            used += len(c)
+        fitted.append(c)
+    return fitted
+
+
+# 从评判输出中提取 0~1 的分数（兼容 "分数：0.8"、"0.85。" 等带前后缀的输出）
+_SCORE_RE = re.compile(r"(?<![\d.])(?:1(?:\.0+)?|0?\.\d+|0)(?![\d.])")
+
+
+def _parse_score(content: str) -> float:
+    """解析评判模型输出的分数，找不到分数时返回中性分数 0.5"""
+    m = _SCORE_RE.search(content or "")
+    return max(0.0, min(1.0, float(m.group(0)))) if m else 0.5
+
+
+def _judged_score(content: str):
+    """解析评判分数；找不到分数时返回不写入缓存的中性分数，下次运行重新评判"""
+    return _parse_score(content) if _SCORE_RE.search(content or "") else Uncached(0.5)
+
+
+# ============ 评判 Prompt ============
+# 静态的评估标准放在 prompt 最前面，逐字节保持不变，变量部分只追加在末尾。
+# DashScope / OpenAI 等服务会自动缓存相同的 prompt 前缀（>= 1K tokens），
+# 相同前缀的评判请求可以复用服务端缓存，降低 prefill 开销。
+SCORE_OUTPUT_RULE = "请只输出一个 0 到 1 之间的数字（保留两位小数）。"
+
+FAITHFULNESS_HEADER = f"""你是一个答案质量评估专家。请评估答案的"忠实度"（Faithfulness）。
+
+## 评估标准
+忠实度衡量答案中的信息是否都能在上下文中找到依据。
+- 1.0: 答案完全基于上下文，没有编造信息
+- 0.7-0.9: 大部分基于上下文，少量合理推断
+- 0.4-0.6: 部分基于上下文，部分可能是编造
+- 0.0-0.3: 大量信息无法从上下文中找到依据
+
+{SCORE_OUTPUT_RULE}
+"""
+
+ANSWER_RELEVANCY_HEADER = f"""你是一个答案质量评估专家。请评估答案对问题的"相关性"（Answer Relevancy）。
+
+## 评估标准
+相关性衡量答案是否直接回答了用户的问题。
+- 1.0: 完美回答了问题的所有方面
+- 0.7-0.9: 回答了主要问题，可能遗漏细节
+- 0.4-0.6: 部分回答了问题，但有偏离
+- 0.0-0.3: 基本没有回答问题或完全跑题
+
+{SCORE_OUTPUT_RULE}
+"""
+
+CONTEXT_PRECISION_HEADER = f"""你是一个检索质量评估专家。请评估检索结果的"精确度"（Context Precision）。
+
+## 评估标准
+精确度衡量检索到的内容是否都与问题相关。
+- 1.0: 所有检索内容都高度相关
+- 0.7-0.9: 大部分内容相关，少量不太相关
+- 0.4-0.6: 部分内容相关，部分不相关
+- 0.0-0.3: 大部分内容与问题无关
+
+{SCORE_OUTPUT_RULE}
+"""
+
+CONTEXT_RECALL_HEADER = f"""你是一个检索质量评估专家。请评估检索结果的"召回率"（Context Recall）。
+
+## 评估标准
+召回率衡量检索到的内容是否包含了回答问题所需的所有信息。
+对比标准答案，看检索内容是否覆盖了回答所需的关键信息。
+- 1.0: 检索内容完全覆盖了标准答案所需的信息
+- 0.7-0.9: 覆盖了大部分关键信息
+- 0.4-0.6: 覆盖了部分关键信息
+- 0.0-0.3: 几乎没有覆盖关键信息
+
+{SCORE_OUTPUT_RULE}
+"""
+
+ALL_METRICS_HEADER = """你是一个 RAG 系统质量评估专家。请根据给出的信息，同时评估 4 个指标。
+
+## 评估标准（每个指标都是 0 到 1 之间的数字，保留两位小数）
+1. faithfulness（忠实度）：答案中的信息是否都能在检索内容中找到依据
+   - 1.0: 完全基于上下文；0.7-0.9: 少量合理推断；0.4-0.6: 部分可能是编造；0.0-0.3: 大量信息无依据
+2. answer_relevancy（答案相关性）：答案是否直接回答了用户的问题
+   - 1.0: 完美回答；0.7-0.9: 可能遗漏细节；0.4-0.6: 有偏离；0.0-0.3: 基本跑题
+3. context_precision（检索精确度）：检索到的内容是否都与问题相关
+   - 1.0: 全部高度相关；0.7-0.9: 少量不太相关；0.4-0.6: 部分不相关；0.0-0.3: 大部分无关
+4. context_recall（检索召回率）：对比标准答案，检索内容是否覆盖了回答所需的关键信息
+   - 1.0: 完全覆盖；0.7-0.9: 覆盖大部分；0.4-0.6: 覆盖部分；0.0-0.3: 几乎没有覆盖
+
+## 输出格式（只输出 JSON，不要有任何多余文字）
+{"faithfulness": 0.00, "answer_relevancy": 0.00, "context_precision": 0.00, "context_recall": 0.00}
+"""
 
 
 @dataclass
@@ -57,9 +189,11 @@ class RAGEvaluator:
     """
 
     def __init__(self):
-        self.llm = LLMFactory.get_qwen_model()
+        # 评判请求经批处理器合并发出；所有评估器共用同一个批处理器和 HTTP/2 连接池
+        self.batcher = _get_judge()
 
-    def evaluate_faithfulness(self, answer: str, contexts: List[str]) -> float:
+    @cached_score("faithfulness", FAITHFULNESS_HEADER)
+    async def evaluate_faithfulness(self, answer: str, contexts: List[str]) -> float:
         """
         评估答案忠实度
 
@@ -68,63 +202,41 @@ class RAGEvaluator:
         if not contexts:
             return 0.0
 
-        context_text = "\n\n".join(contexts[:5])  # 限制长度
-
-        prompt = f"""你是一个答案质量评估专家。请评估以下答案的"忠实度"（Faithfulness）。
+        context_text = "\n\n".join(_fit_contexts(contexts))
 
+        prompt = FAITHFULNESS_HEADER + f"""
 ## 检索到的上下文
 {context_text}
 
 ## 生成的答案
 {answer}
 
-## 评估标准
-忠实度衡量答案中的信息是否都能在上下文中找到依据。
-- 1.0: 答案完全基于上下文，没有编造信息
-- 0.7-0.9: 大部分基于上下文，少量合理推断
-- 0.4-0.6: 部分基于上下文，部分可能是编造
-- 0.0-0.3: 大量信息无法从上下文中找到依据
+分数："""
 
-请只输出一个 0 到 1 之间的数字（保留两位小数）："""
+        content = await self.batcher.process_batched(prompt)
+        return _judged_score(content)
 
-        response = self.llm.invoke([HumanMessage(content=prompt)])
-        try:
-            score = float(response.content.strip())
-            return max(0.0, min(1.0, score))
-        except:
-            return 0.5
-
-    def evaluate_answer_relevancy(self, question: str, answer: str) -> float:
+    @cached_score("answer_relevancy", ANSWER_RELEVANCY_HEADER)
+    async def evaluate_answer_relevancy(self, question: str, answer: str) -> float:
         """
         评估答案相关性
 
         检查答案是否真正回答了用户的问题
         """
-        prompt = f"""你是一个答案质量评估专家。请评估以下答案对问题的"相关性"（Answer Relevancy）。
-
+        prompt = ANSWER_RELEVANCY_HEADER + f"""
 ## 用户问题
 {question}
 
 ## 生成的答案
 {answer}
 
-## 评估标准
-相关性衡量答案是否直接回答了用户的问题。
-- 1.0: 完美回答了问题的所有方面
-- 0.7-0.9: 回答了主要问题，可能遗漏细节
-- 0.4-0.6: 部分回答了问题，但有偏离
-- 0.0-0.3: 基本没有回答问题或完全跑题
+分数："""
 
-请只输出一个 0 到 1 之间的数字（保留两位小数）："""
-
-        response = self.llm.invoke([HumanMessage(content=prompt)])
-        try:
-            score = float(response.content.strip())
-            return max(0.0, min(1.0, score))
-        except:
-            return 0.5
+        content = await self.batcher.process_batched(prompt)
+        return _judged_score(content)
 
-    def evaluate_context_precision(self, question: str, contexts: List[str]) -> float:
+    @cached_score("context_precision", CONTEXT_PRECISION_HEADER)
+    async def evaluate_context_precision(self, question: str, contexts: List[str]) -> float:
         """
         评估检索精确度
 
@@ -133,33 +245,22 @@ class RAGEvaluator:
         if not contexts:
             return 0.0
 
-        context_text = "\n\n---\n\n".join([f"[{i+1}] {c}" for i, c in enumerate(contexts[:5])])
-
-        prompt = f"""你是一个检索质量评估专家。请评估以下检索结果的"精确度"（Context Precision）。
+        context_text = "\n\n---\n\n".join([f"[{i+1}] {c}" for i, c in enumerate(_fit_contexts(contexts))])
 
+        prompt = CONTEXT_PRECISION_HEADER + f"""
 ## 用户问题
 {question}
 
 ## 检索到的内容
 {context_text}
 
-## 评估标准
-精确度衡量检索到的内容是否都与问题相关。
-- 1.0: 所有检索内容都高度相关
-- 0.7-0.9: 大部分内容相关，少量不太相关
-- 0.4-0.6: 部分内容相关，部分不相关
-- 0.0-0.3: 大部分内容与问题无关
-
-请只输出一个 0 到 1 之间的数字（保留两位小数）："""
+分数："""
 
-        response = self.llm.invoke([HumanMessage(content=prompt)])
-        try:
-            score = float(response.content.strip())
-            return max(0.0, min(1.0, score))
-        except:
-            return 0.5
+        content = await self.batcher.process_batched(prompt)
+        return _judged_score(content)
 
-    def evaluate_context_recall(
+    @cached_score("context_recall", CONTEXT_RECALL_HEADER)
+    async def evaluate_context_recall(
         self,
         question: str,
         contexts: List[str],
@@ -174,10 +275,9 @@ class RAGEvaluator:
         if not expected_answer:
             return 0.5  # 无法评估，返回中性分数
 
-        context_text = "\n\n".join(contexts[:5])
-
-        prompt = f"""你是一个检索质量评估专家。请评估以下检索结果的"召回率"（Context Recall）。
+        context_text = "\n\n".join(_fit_contexts(contexts))
 
+        prompt = CONTEXT_RECALL_HEADER + f"""
 ## 用户问题
 {question}
 
@@ -187,49 +287,109 @@ class RAGEvaluator:
 ## 检索到的内容
 {context_text}
 
-## 评估标准
-召回率衡量检索到的内容是否包含了回答问题所需的所有信息。
-对比标准答案，看检索内容是否覆盖了回答所需的关键信息。
-- 1.0: 检索内容完全覆盖了标准答案所需的信息
-- 0.7-0.9: 覆盖了大部分关键信息
-- 0.4-0.6: 覆盖了部分关键信息
-- 0.0-0.3: 几乎没有覆盖关键信息
+分数："""
 
-请只输出一个 0 到 1 之间的数字（保留两位小数）："""
+        content = await self.batcher.process_batched(prompt)
+        return _judged_score(content)
 
-        response = self.llm.invoke([HumanMessage(content=prompt)])
+    @cached_score("all", ALL_METRICS_HEADER)
+    async def evaluate_all(
+        self,
+        question: str,
+        answer: str,
+        contexts: List[str],
+        expected_answer: Optional[str] = None
+    ) -> Dict[str, float]:
+        """
+        一次 LLM 调用同时评估 4 个指标
+
+        上面 4 个单指标方法会把问题/上下文重复发送 4 次，这里合并为一个 prompt，
+        让评判模型以 JSON 返回全部分数（单指标方法保留用于调试）
+        """
+        context_text = "\n\n---\n\n".join([f"[{i+1}] {c}" for i, c in enumerate(_fit_contexts(contexts))])
+
+        prompt = ALL_METRICS_HEADER + f"""
+## 用户问题
+{question}
+
+## 标准答案
+{expected_answer or "（无）"}
+
+## 检索到的内容
+{context_text or "（无）"}
+
+## 生成的答案
+{answer}
+
+JSON 结果："""
+
+        content = await self.batcher.process_batched(
+            prompt, response_format={"type": "json_object"}
+        )
         try:
-            score = float(response.content.strip())
-            return max(0.0, min(1.0, score))
-        except:
-            return 0.5
+            data = json.loads(content)
+        except (json.JSONDecodeError, TypeError):
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+
+        scores, failed = {}, set()
+        for metric in METRICS:
+            try:
+                scores[metric] = max(0.0, min(1.0, float(data[metric])))
+            except (KeyError, TypeError, ValueError):
+                scores[metric] = 0.5
+                failed.add(metric)
+
+        # 与单指标方法保持一致的边界处理
+        if not contexts:
+            scores["faithfulness"] = 0.0
+            scores["context_precision"] = 0.0
+            failed -= {"faithfulness", "context_precision"}
+        if not expected_answer:
+            scores["context_recall"] = 0.5  # 无法评估，返回中性分数
+            failed.discard("context_recall")
+        # 输出被截断或不是合法 JSON 时，兜底分数不写入缓存
+        return Uncached(scores) if failed else scores
 
-    def evaluate_single(
+    async def evaluate_single_async(
         self,
         question: str,
         answer: str,
         contexts: List[str],
         expected_answer: Optional[str] = None
     ) -> EvaluationResult:
-        """评估单个样本"""
+        """评估单个样本（单次 LLM 调用）"""
+        scores = await self.evaluate_all(question, answer, contexts, expected_answer)
         return EvaluationResult(
             question=question,
             expected_answer=expected_answer,
             generated_answer=answer,
             contexts=contexts,
-            faithfulness=self.evaluate_faithfulness(answer, contexts),
-            answer_relevancy=self.evaluate_answer_relevancy(question, answer),
-            context_precision=self.evaluate_context_precision(question, contexts),
-            context_recall=self.evaluate_context_recall(question, contexts, expected_answer)
+            **scores
+        )
+
+    def evaluate_single(
+        self,
+        question: str,
+        answer: str,
+        contexts: List[str],
+        expected_answer: Optional[str] = None
+    ) -> EvaluationResult:
+        """评估单个样本（同步入口）"""
+        return asyncio.run(
+            self.evaluate_single_async(question, answer, contexts, expected_answer)
         )
 
-    def evaluate_batch(
+    async def evaluate_batch(
         self,
         samples: List[Dict]
     ) -> EvaluationReport:
         """
         批量评估
 
+        所有样本并发评估，通过 Semaphore 限制同时进行的样本数，避免触发 API 限流
+
         Args:
             samples: 样本列表，每个样本包含:
                 - question: 问题
@@ -237,26 +397,41 @@ class RAGEvaluator:
                 - contexts: 检索到的上下文列表
                 - expected_answer: (可选) 标准答案
         """
-        results = []
-        for sample in samples:
-            result = self.evaluate_single(
-                question=sample["question"],
-                answer=sample["answer"],
-                contexts=sample.get("contexts", []),
-                expected_answer=sample.get("expected_answer")
-            )
-            results.append(result)
+        sem = asyncio.Semaphore(Config.EVAL_CONCURRENCY or 16)
+
+        async def run_one(sample: Dict) -> EvaluationResult:
+            async with sem:
+                result = await self.evaluate_single_async(
+                    question=sample["question"],
+                    answer=sample["answer"],
+                    contexts=sample.get("contexts", []),
+                    expected_answer=sample.get("expected_answer")
+                )
             print(f"  ✓ 评估完成: {sample['question'][:30]}...")
+            return result
+
+        results = await asyncio.gather(*[run_one(sample) for sample in samples])
 
-        # 计算平均分
+        # 计算平均分：一次性堆成 (n, 4) 数组，按列向量化求均值
         n = len(results)
+        scores = np.fromiter(
+            (
+                (r.faithfulness, r.answer_relevancy, r.context_precision, r.context_recall)
+                for r in results
+            ),
+            dtype=np.dtype((np.float64, len(METRICS))),
+            count=n
+        )
+        means = scores.mean(axis=0) if n else np.zeros(len(METRICS))
+        avg_faithfulness, avg_answer_relevancy, avg_context_precision, avg_context_recall = means.tolist()
+
         return EvaluationReport(
             total_samples=n,
-            avg_faithfulness=sum(r.faithfulness for r in results) / n if n else 0,
-            avg_answer_relevancy=sum(r.answer_relevancy for r in results) / n if n else 0,
-            avg_context_precision=sum(r.context_precision for r in results) / n if n else 0,
-            avg_context_recall=sum(r.context_recall for r in results) / n if n else 0,
-            results=results
+            avg_faithfulness=avg_faithfulness,
+            avg_answer_relevancy=avg_answer_relevancy,
+            avg_context_precision=avg_context_precision,
+            avg_context_recall=avg_context_recall,
+            results=list(results)
         )
 
 
@@ -324,7 +499,7 @@ if __name__ == "__main__":
     print("\n" + "=" * 60)
     print("🔍 开始评估...")
     evaluator = RAGEvaluator()
-    report = evaluator.evaluate_batch(samples)
+    report = asyncio.run(evaluator.evaluate_batch(samples))
 
     # 打印报告
     print_report(report)
@@ -339,7 +514,7 @@ if __name__ == "__main__":
         "results": [asdict(r) for r in report.results]
     }
 
-    with open("evaluation_report.json", "w", encoding="utf-8") as f:
-        json.dump(report_dict, f, ensure_ascii=False, indent=2)
+    with open("evaluation_report.json", "wb") as f:
+        f.write(orjson.dumps(report_dict, option=orjson.OPT_INDENT_2))
 
     print(f"\n💾 报告已保存到 evaluation_report.json")
@@ -100,9 +100,18 @@ def test_full_graph():
         }
 
         try:
-            result = graph.invoke(state, config)
-            print(f"📍 搜索类型: {result.get('search_type', 'unknown')}")
-            print(f"💬 回答:\n{result['final_answer'][:500]}...")
+            # 同时订阅节点更新和 LLM token：答案边生成边打印
+            result = dict(state)
+            print("💬 回答:")
+            for mode, payload in graph.stream(state, config, stream_mode=["updates", "messages"]):
+                if mode == "messages":
+                    chunk, metadata = payload
+                    if metadata.get("langgraph_node") == "answer":
+                        print(chunk.content, end="", flush=True)
+                else:
+                    for update in payload.values():
+                        result.update(update or {})
+            print(f"\n📍 搜索类型: {result.get('search_type', 'unknown')}")
         except Exception as e:
             print(f"❌ 错误: {e}")
 
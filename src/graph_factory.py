@@ -0,0 +1,263 @@
+"""
+Graph 构建工厂
+
+src/graph.py、graph_advanced.py、graph_with_interrupt.py、graph_with_reflection.py
+原本各自重复注册同一组节点、在导入时各自 compile 一次。这里统一构建：
+- 共用节点注册和路由函数，各 flavor 只在条件边 / interrupt_before 上有区别
+- build_graph(flavor) 带缓存，同一 flavor 只 compile 一次
+- 各模块的全局 graph 实例改为首次访问时才构建，只用到一种 Graph 的进程不再为其他 Graph 付出编译开销
+
+flavor：
+    "basic"      - src.graph 的默认 Graph（Multi-Query + Reflector）
+    "advanced"   - src.graph_advanced（与 basic 结构相同，独立的 checkpoint）
+    "reflection" - src.graph_with_reflection（无 Multi-Query 的反思循环）
+    "interrupt"  - src.graph_with_interrupt（搜索前暂停等待用户确认）
+"""
+import functools
+
+from langgraph.graph import StateGraph, END
+from src.state import AgentState
+from src.nodes import (
+    decide_search, search_web, generate_answer, skip_search,
+    local_rag_search, hybrid_search, expand_query, reflect_on_results, refine_search
+)
+from src.persistence import build_checkpointer
+
+
+# 各 flavor 的 checkpoint 数据库文件
+_DB_NAMES = {
+    "basic": "checkpoints.db",
+    "advanced": "checkpoints_advanced.db",
+    "reflection": "checkpoints_reflection.db",
+    "interrupt": "checkpoints_interrupt.db",
+}
+
+# 路由表（模块级常量，避免每次路由都重新构建）
+_ROUTE_SEARCH = {
+    "local": "local_rag",
+    "web": "web_search",
+    "hybrid": "hybrid_search"
+}
+_ROUTE_SEARCH_OR_SKIP = {
+    **_ROUTE_SEARCH,
+    "none": "skip_search"
+}
+_ROUTE_REFLECTION = {
+    "sufficient": "answer",
+    "insufficient": "refine"
+}
+
+# 搜索节点名 -> 节点自身（条件边的 path_map）
+_SEARCH_NODES = {name: name for name in ("local_rag", "web_search", "hybrid_search")}
+
+
+# ============ 路由函数 ============
+
+def route_after_decide(state: AgentState) -> str:
+    """决定搜索后的路由：
+    1. 不需要搜索 -> skip_search
+    2. 需要搜索且复杂 -> expand (Multi-Query)
+    3. 需要搜索但简单 -> web/local/hybrid (直接搜索)
+    """
+    search_type = state.get("search_type", "none")
+    use_multi_query = state.get("use_multi_query", False)
+
+    if search_type == "none":
+        return "skip_search"
+
+    if use_multi_query:
+        return "expand"
+
+    # 如果是简单问题，直接根据类型跳到具体的搜索节点
+    return search_type
+
+
+def route_search(state: AgentState) -> str:
+    """路由到具体的搜索执行节点"""
+    return _ROUTE_SEARCH.get(state.get("search_type", "web"), "web_search")
+
+
+def route_search_or_skip(state: AgentState) -> str:
+    """路由到不同的搜索节点（无需搜索时走 skip_search）"""
+    return _ROUTE_SEARCH_OR_SKIP.get(state.get("search_type", "none"), "skip_search")
+
+
+def route_after_reflection(state: AgentState) -> str:
+    """
+    反思后的路由决策
+
+    返回值：
+    - "answer": 结果充分，生成答案
+    - "refine": 结果不足，需要改进搜索
+    - "answer": 达到最大循环次数，强制生成答案
+    """
+    reflection_result = state.get("reflection_result", "sufficient")
+    loop_count = state.get("loop_count", 0)
+    max_loops = state.get("max_loops", 3)
+
+    # 达到最大循环次数，强制结束
+    if loop_count >= max_loops:
+        print(f"  ⚠️ 达到最大循环次数 ({max_loops})，强制生成答案")
+        return "answer"
+
+    # 改进查询与之前的查询几乎相同，再检索也是同样的结果
+    if state.get("refine_converged"):
+        print("  ⚠️ 改进查询与之前的查询相同，提前结束循环")
+        return "answer"
+
+    # 根据反思结果决定
+    route = _ROUTE_REFLECTION.get(reflection_result)
+    if route:
+        return route
+    else:  # irrelevant
+        # 不相关的结果，尝试改进一次
+        if loop_count < 2:
+            return "refine"
+        return "answer"
+
+
+# ============ Human-in-the-loop 专用节点 ============
+
+def prepare_search(state: AgentState) -> AgentState:
+    """
+    准备搜索节点：设置待确认的操作描述
+
+    这个节点在 interrupt 前执行，告诉用户即将做什么
+    """
+    search_type = state.get("search_type", "none")
+    query = state["current_query"]
+
+    # 根据搜索类型生成操作描述
+    action_descriptions = {
+        "local": f"📚 即将在本地知识库中搜索: '{query}'",
+        "web": f"🌐 即将进行网络搜索: '{query}'",
+        "hybrid": f"🔄 即将进行混合搜索（本地+网络）: '{query}'",
+        "none": f"💭 无需搜索，将直接回答: '{query}'"
+    }
+
+    state["pending_action"] = action_descriptions.get(
+        search_type,
+        f"❓ 未知操作类型: {search_type}"
+    )
+    state["current_step"] = "⏸️ 等待用户确认..."
+
+    return state
+
+
+# ============ 构建 ============
+
+def build_workflow(flavor: str) -> StateGraph:
+    """
+    构建未编译的 StateGraph
+
+    Args:
+        flavor: "basic" | "advanced" | "reflection" | "interrupt"
+    """
+    if flavor not in _DB_NAMES:
+        raise ValueError(f"未知的 Graph 类型: {flavor}")
+
+    workflow = StateGraph(AgentState)
+
+    # 所有 flavor 共用的节点
+    workflow.add_node("decide", decide_search)
+    workflow.add_node("local_rag", local_rag_search)
+    workflow.add_node("web_search", search_web)
+    workflow.add_node("hybrid_search", hybrid_search)
+    workflow.add_node("skip_search", skip_search)
+    workflow.add_node("answer", generate_answer)
+
+    # 设置入口
+    workflow.set_entry_point("decide")
+
+    if flavor == "interrupt":
+        # decide → prepare（先准备确认信息）→ 根据类型路由到不同搜索节点
+        workflow.add_node("prepare", prepare_search)
+        workflow.add_edge("decide", "prepare")
+        workflow.add_conditional_edges(
+            "prepare",
+            route_search_or_skip,
+            {**_SEARCH_NODES, "skip_search": "skip_search"}
+        )
+
+        # 所有搜索节点 → answer
+        for node in _SEARCH_NODES:
+            workflow.add_edge(node, "answer")
+    else:
+        workflow.add_node("reflector", reflect_on_results)  # 反思评估
+        workflow.add_node("refine", refine_search)          # 改进搜索
+
+        if flavor == "reflection":
+            # decide → 根据类型路由到搜索节点
+            workflow.add_conditional_edges(
+                "decide",
+                route_search_or_skip,
+                {**_SEARCH_NODES, "skip_search": "skip_search"}
+            )
+        else:
+            workflow.add_node("expand", expand_query)  # Multi-Query 扩展
+
+            # 添加条件边：从 decide 判断进入哪个分支
+            workflow.add_conditional_edges(
+                "decide",
+                route_after_decide,
+                {
+                    "expand": "expand",
+                    "skip_search": "skip_search",
+                    "web": "web_search",
+                    "local": "local_rag",
+                    "hybrid": "hybrid_search"
+                }
+            )
+
+            # 从 expand 根据类型路由到具体的搜索节点
+            workflow.add_conditional_edges("expand", route_search, _SEARCH_NODES)
+
+        # 所有搜索节点 → reflector（反思评估）
+        for node in _SEARCH_NODES:
+            workflow.add_edge(node, "reflector")
+
+        # reflector → 条件路由（循环的关键）
+        workflow.add_conditional_edges(
+            "reflector",
+            route_after_reflection,
+            {
+                "answer": "answer",
+                "refine": "refine"
+            }
+        )
+
+        # refine → reflector（形成循环）
+        workflow.add_edge("refine", "reflector")
+
+    # skip_search 直接到 answer
+    workflow.add_edge("skip_search", "answer")
+    workflow.add_edge("answer", END)
+
+    return workflow
+
+
+def compile_graph(flavor: str, checkpointer=None):
+    """
+    编译指定 flavor 的 Graph（不缓存）
+
+    Args:
+        flavor: Graph 类型
+        checkpointer: 自定义持久化器，None 则按 Config.CHECKPOINTER_BACKEND 创建
+    """
+    if checkpointer is None:
+        checkpointer = build_checkpointer(_DB_NAMES[flavor])
+
+    if flavor == "interrupt":
+        # 关键：设置 interrupt_before
+        # 在这些节点执行前会暂停，等待用户确认（skip_search 不需要确认）
+        return build_workflow(flavor).compile(
+            checkpointer=checkpointer,
+            interrupt_before=list(_SEARCH_NODES)
+        )
+    return build_workflow(flavor).compile(checkpointer=checkpointer)
+
+
+@functools.lru_cache(maxsize=None)
+def build_graph(flavor: str):
+    """获取指定 flavor 的全局 Graph（同一 flavor 只编译一次）"""
+    return compile_graph(flavor)
@@ -17,60 +17,11 @@
     # 用户确认后，继续执行
     result = graph.invoke(None, config)  # 传 None 表示继续
 """
-import sqlite3
-import os
 
-from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.sqlite import SqliteSaver
-from src.state import AgentState
-from src.nodes import (
-    decide_search, search_web, generate_answer, skip_search,
-    local_rag_search, hybrid_search
-)
-from src.config import Config
+from src.graph_factory import build_graph, prepare_search, route_search_or_skip
 
-
-def prepare_search(state: AgentState) -> AgentState:
-    """
-    准备搜索节点：设置待确认的操作描述
-
-    这个节点在 interrupt 前执行，告诉用户即将做什么
-    """
-    search_type = state.get("search_type", "none")
-    query = state["current_query"]
-
-    # 根据搜索类型生成操作描述
-    action_descriptions = {
-        "local": f"📚 即将在本地知识库中搜索: '{query}'",
-        "web": f"🌐 即将进行网络搜索: '{query}'",
-        "hybrid": f"🔄 即将进行混合搜索（本地+网络）: '{query}'",
-        "none": f"💭 无需搜索，将直接回答: '{query}'"
-    }
-
-    state["pending_action"] = action_descriptions.get(
-        search_type,
-        f"❓ 未知操作类型: {search_type}"
-    )
-    state["current_step"] = "⏸️ 等待用户确认..."
-
-    return state
-
-
-def route_after_confirm(state: AgentState) -> str:
-    """
-    确认后的路由函数
-
-    根据 search_type 决定走哪个搜索节点
-    """
-    search_type = state.get("search_type", "none")
-
-    routing = {
-        "local": "local_rag",
-        "web": "web_search",
-        "hybrid": "hybrid_search",
-        "none": "skip_search"
-    }
-    return routing.get(search_type, "skip_search")
+# 确认后的路由：根据 search_type 决定走哪个搜索节点
+route_after_confirm = route_search_or_skip
 
 
 def create_graph_with_interrupt():
@@ -81,65 +32,20 @@ def create_graph_with_interrupt():
     1. 添加 prepare_search 节点，设置待确认信息
     2. 在搜索节点前设置 interrupt_before
     """
-    workflow = StateGraph(AgentState)
-
-    # 添加节点
-    workflow.add_node("decide", decide_search)
-    workflow.add_node("prepare", prepare_search)  # 新增：准备确认信息
-    workflow.add_node("local_rag", local_rag_search)
-    workflow.add_node("web_search", search_web)
-    workflow.add_node("hybrid_search", hybrid_search)
-    workflow.add_node("skip_search", skip_search)
-    workflow.add_node("answer", generate_answer)
-
-    # 设置入口
-    workflow.set_entry_point("decide")
-
-    # decide → prepare（先准备确认信息）
-    workflow.add_edge("decide", "prepare")
-
-    # prepare → 根据类型路由到不同搜索节点
-    workflow.add_conditional_edges(
-        "prepare",
-        route_after_confirm,
-        {
-            "local_rag": "local_rag",
-            "web_search": "web_search",
-            "hybrid_search": "hybrid_search",
-            "skip_search": "skip_search"
-        }
-    )
-
-    # 所有搜索节点 → answer
-    workflow.add_edge("local_rag", "answer")
-    workflow.add_edge("web_search", "answer")
-    workflow.add_edge("hybrid_search", "answer")
-    workflow.add_edge("skip_search", "answer")
-    workflow.add_edge("answer", END)
-
-    # 持久化
-    os.makedirs(Config.CHECKPOINT_DIR, exist_ok=True)
-    conn = sqlite3.connect(
-        f"{Config.CHECKPOINT_DIR}/checkpoints_interrupt.db",
-        check_same_thread=False
-    )
-    memory = SqliteSaver(conn)
-
-    # 关键：设置 interrupt_before
-    # 在这些节点执行前会暂停，等待用户确认
-    return workflow.compile(
-        checkpointer=memory,
-        interrupt_before=["local_rag", "web_search", "hybrid_search"]
-        # 注意：skip_search 不需要确认
-    )
-
-
-# 创建全局实例
-graph_with_interrupt = create_graph_with_interrupt()
+    return build_graph("interrupt")
+
+
+def __getattr__(name):
+    """全局实例 graph_with_interrupt 在首次访问时才构建"""
+    if name == "graph_with_interrupt":
+        return build_graph("interrupt")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ============ 使用示例 ============
 if __name__ == "__main__":
+    graph_with_interrupt = create_graph_with_interrupt()
+
     print("=" * 60)
     print("🔧 Human-in-the-loop 演示")
     print("=" * 60)
@@ -16,59 +16,11 @@
 
 这是 Agentic RAG 的核心进阶点，体现了 Agent 的"自主决策"能力。
 """
-import sqlite3
-import os
-
-from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.sqlite import SqliteSaver
-from src.state import AgentState
-from src.nodes import (
-    decide_search, search_web, generate_answer, skip_search,
-    local_rag_search, hybrid_search, reflect_on_results, refine_search
-)
-from src.config import Config
-
-
-def route_search(state: AgentState) -> str:
-    """路由到不同的搜索节点"""
-    search_type = state.get("search_type", "none")
-    routing = {
-        "local": "local_rag",
-        "web": "web_search",
-        "hybrid": "hybrid_search",
-        "none": "skip_search"
-    }
-    return routing.get(search_type, "skip_search")
-
-
-def route_after_reflection(state: AgentState) -> str:
-    """
-    反思后的路由决策
 
-    返回值：
-    - "answer": 结果充分，生成答案
-    - "refine": 结果不足，需要改进搜索
-    - "answer": 达到最大循环次数，强制生成答案
-    """
-    reflection_result = state.get("reflection_result", "sufficient")
-    loop_count = state.get("loop_count", 0)
-    max_loops = state.get("max_loops", 3)
-
-    # 达到最大循环次数，强制结束
-    if loop_count >= max_loops:
-        print(f"  ⚠️ 达到最大循环次数 ({max_loops})，强制生成答案")
-        return "answer"
-
-    # 根据反思结果决定
-    if reflection_result == "sufficient":
-        return "answer"
-    elif reflection_result == "insufficient":
-        return "refine"
-    else:  # irrelevant
-        # 不相关的结果，尝试改进一次
-        if loop_count < 2:
-            return "refine"
-        return "answer"
+from src.graph_factory import build_graph, route_after_reflection, route_search_or_skip
+
+# 路由到不同的搜索节点（无需搜索时走 skip_search）
+route_search = route_search_or_skip
 
 
 def create_graph_with_reflection():
@@ -80,74 +32,20 @@ def create_graph_with_reflection():
     2. LangGraph 的循环（Loop）机制
     3. 质量保证的自动化
     """
-    workflow = StateGraph(AgentState)
-
-    # 添加节点
-    workflow.add_node("decide", decide_search)
-    workflow.add_node("local_rag", local_rag_search)
-    workflow.add_node("web_search", search_web)
-    workflow.add_node("hybrid_search", hybrid_search)
-    workflow.add_node("skip_search", skip_search)
-    workflow.add_node("reflector", reflect_on_results)  # 反思节点
-    workflow.add_node("refine", refine_search)          # 改进搜索节点
-    workflow.add_node("answer", generate_answer)
-
-    # 设置入口
-    workflow.set_entry_point("decide")
-
-    # decide → 根据类型路由到搜索节点
-    workflow.add_conditional_edges(
-        "decide",
-        route_search,
-        {
-            "local_rag": "local_rag",
-            "web_search": "web_search",
-            "hybrid_search": "hybrid_search",
-            "skip_search": "skip_search"
-        }
-    )
-
-    # 所有搜索节点 → reflector（反思评估）
-    workflow.add_edge("local_rag", "reflector")
-    workflow.add_edge("web_search", "reflector")
-    workflow.add_edge("hybrid_search", "reflector")
-
-    # skip_search 不需要反思，直接生成答案
-    workflow.add_edge("skip_search", "answer")
-
-    # reflector → 条件路由（循环的关键）
-    workflow.add_conditional_edges(
-        "reflector",
-        route_after_reflection,
-        {
-            "answer": "answer",
-            "refine": "refine"
-        }
-    )
+    return build_graph("reflection")
 
-    # refine → reflector（形成循环）
-    workflow.add_edge("refine", "reflector")
 
-    # answer → END
-    workflow.add_edge("answer", END)
-
-    # 持久化
-    os.makedirs(Config.CHECKPOINT_DIR, exist_ok=True)
-    conn = sqlite3.connect(
-        f"{Config.CHECKPOINT_DIR}/checkpoints_reflection.db",
-        check_same_thread=False
-    )
-    memory = SqliteSaver(conn)
-
-    return workflow.compile(checkpointer=memory)
-
-
-# 创建全局实例
-graph_with_reflection = create_graph_with_reflection()
+def __getattr__(name):
+    """全局实例 graph_with_reflection 在首次访问时才构建"""
+    if name == "graph_with_reflection":
+        return build_graph("reflection")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ============ 使用示例 ============
 if __name__ == "__main__":
+    graph_with_reflection = create_graph_with_reflection()
+
     print("=" * 60)
     print("🔄 Agentic RAG with Reflection Loop 演示")
     print("=" * 60)
@@ -1,38 +1,127 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+import atexit
+import hashlib
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+import xxhash
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, trim_messages
+from langgraph.constants import TAG_NOSTREAM
 from src.state import AgentState
 from src.config import Config
-from src.tools import create_search_tool
-from src.rag.rag_manager import RAGManager
-from src.utils.llm_factory import LLMFactory
+from src.utils.tokens import count_message_tokens
+from src.utils.query_cache import get_decide_cache, get_rewrite_cache, get_reflect_cache
+from src.utils.paths import source_basename
+from src.rag.fusion import mmr_rerank
+from src.rag.semantic_cache import semantic_cached, get_expansion_cache, get_decision_cache, embed_query
+
+# LLM、搜索工具、RAG 管理器都延迟初始化：
+# 导入本模块时不加载 langchain_openai / Tavily / Embedding 模型，只在节点首次用到时创建
+_llm = None
+_task_llms = {}  # 任务类型 -> 绑定了生成参数的模型
+_search_tool = None
+_rag_manager = None
+_rag_lock = threading.Lock()
 
-# 初始化 LLM
-llm = LLMFactory.get_model()
+# Multi-Query 检索共用的线程池：多个子查询的本地检索 / 网络搜索并发执行
+_search_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+# 进程退出时不再执行排队中的任务（如被丢弃的推测扩展），不等待网络请求返回
+atexit.register(_search_executor.shutdown, wait=False, cancel_futures=True)
 
-# 搜索工具
-search_tool = create_search_tool()
 
-# 初始化 RAG 管理器（延迟初始化，避免启动时加载模型）
-_rag_manager = None
+def get_llm(task: str = "answer"):
+    """
+    延迟获取 LLM 实例
+
+    Args:
+        task: 任务类型，非 "answer" 时返回绑定了对应生成参数（max_tokens / temperature）的模型
+    """
+    global _llm
+    if _llm is None:
+        from src.utils.llm_factory import LLMFactory
+        _llm = LLMFactory.get_model()
+    if task == "answer":
+        return _llm
+    if task not in _task_llms:
+        from src.utils.llm_factory import LLMFactory
+        _task_llms[task] = LLMFactory.for_task(task, _llm)
+    return _task_llms[task]
+
+
+def get_search_tool():
+    """延迟获取搜索工具实例"""
+    global _search_tool
+    if _search_tool is None:
+        from src.tools import create_search_tool
+        _search_tool = create_search_tool()
+    return _search_tool
+
 
 def get_rag_manager():
     """延迟获取 RAG 管理器实例"""
     global _rag_manager
     if _rag_manager is None:
-        _rag_manager = RAGManager.get_instance()
+        with _rag_lock:
+            if _rag_manager is None:
+                from src.rag.rag_manager import RAGManager
+                _rag_manager = RAGManager.get_instance()
     return _rag_manager
 
 
-def decide_search(state: AgentState) -> AgentState:
-    """判断搜索类型和复杂度(根据复杂度决定是否开启multi-query)"""
-    state['current_step'] = "🤔 正在判断查询类型..."
-    query = state["current_query"]
+# 规则预判：明显无需搜索（算式、寒暄）的问题不调用 LLM；明显需要联网（时效性词、年份）的问题直接确定搜索类型
+# 算式至少包含一个运算符，"2025"、"911" 这类纯数字不算（可能是年份、事件、型号）
+_NO_SEARCH_RE = re.compile(
+    r"^\s*(?:\(*\s*\d[\d.\s()]*(?:[+\-*/^%]\s*\(*\s*\d[\d.\s()]*)+=?"
+    r"|hi|hello|hey|你好|您好|谢谢|再见|在吗)[\s!！。?？~]*$",
+    re.IGNORECASE
+)
+_NEEDS_WEB_RE = re.compile(r"(今天|今日|昨天|最新|新闻|股价|汇率|天气|实时|(?<!\d)20[2-9]\d(?!\d))")
+# 短查询快速路径只接受空格分隔的关键词片段（"RAG 原理"）；
+# 带疑问词或指令词的短句（"什么是向量数据库"、"写一首诗"）仍交给 LLM，它们可能走本地检索或无需搜索
+_KEYWORDS_RE = re.compile(r"^\S+(?:\s+\S+)+$")
+_QUESTION_WORD_RE = re.compile(
+    r"(什么|如何|怎么|怎样|为什么|为何|哪|谁|吗|呢|是否|多少|几|写|翻译|总结|解释|介绍|生成|帮我|请"
+    r"|\b(?:what|how|why|who|when|where|which|is|are|do|does|can|write|translate)\b)",
+    re.IGNORECASE
+)
 
-    # 提示词优化：同时判断类型和复杂度
-    prompt = f"""你是一个智能路由专家。请分析以下用户问题，并决定搜索类型和问题复杂度。
 
-## 问题
-{query}
+def _kb_has_documents() -> bool:
+    """知识库中是否有文档（决定规则预判时是否需要同时检索本地）"""
+    return get_rag_manager().count() > 0
+
+
+def _rule_classify(query: str):
+    """
+    规则预判搜索类型，能高置信判断时返回 (search_type, complexity)，否则返回 None
+
+    complexity 为 None 表示只确定了搜索类型，复杂度仍交给 LLM 判断
+    """
+    if _NO_SEARCH_RE.match(query):
+        return "NONE", "SIMPLE"
+    if _NEEDS_WEB_RE.search(query):
+        # 时效性问题一定要联网；但"2023年报营收"这类问题的答案也可能在知识库中，非空时走混合检索。
+        # 只有短查询直接判定 SIMPLE，带年份的分析类长问题由 LLM 判断复杂度（仍可开启 Multi-Query）
+        complexity = "SIMPLE" if len(query.strip()) < Config.SHORT_QUERY_CHARS else None
+        return ("HYBRID" if _kb_has_documents() else "WEB"), complexity
+    # "RAG 原理" 这类短关键词查询：路由和扩展都没有收益，不调用 LLM；
+    # 知识库非空时走混合检索，避免"项目代号"之类只在本地文档里的关键词被路由到网络
+    stripped = query.strip()
+    if (len(stripped) < Config.SHORT_QUERY_CHARS and _KEYWORDS_RE.match(stripped)
+            and "?" not in stripped and "？" not in stripped
+            and not _QUESTION_WORD_RE.search(stripped)):
+        return ("HYBRID" if _kb_has_documents() else "WEB"), "SIMPLE"
+    return None
+
+
+# 路由 / 扩展 / 反思的固定指令放在 SystemMessage 中，问题等可变内容放在最后的 HumanMessage 中：
+# 每次请求的 prompt 前缀完全相同，可以命中服务端的前缀缓存（DashScope / DeepSeek 等自动生效），
+# 省去重复 prefill 的计算和输入 token 计费
+
+# 提示词优化：同时判断类型和复杂度
+_CLASSIFY_SYSTEM_PROMPT = """你是一个智能路由专家。请分析用户问题，并决定搜索类型和问题复杂度。
 
 ## 评估标准
 1. **搜索类型**：
@@ -47,33 +136,151 @@ def decide_search(state: AgentState) -> AgentState:
 
 ## 输出格式（严格按此格式，不要有任何多余文字）
 TYPE: [LOCAL/WEB/HYBRID/NONE]
-COMPLEXITY: [SIMPLE/COMPLEX]
+COMPLEXITY: [SIMPLE/COMPLEX]"""
 
-分析结论："""
+_EXPAND_SYSTEM_PROMPT = """你是一个查询扩展专家。请将用户的问题扩展为 3-4 个相关但不同角度的搜索查询。
 
-    response = llm.invoke([HumanMessage(content=prompt)])
-    content = response.content.strip()
+## 扩展要求
+1. 保留原始问题的核心意图
+2. 使用不同的关键词和表述方式
+3. 可以包含相关的子问题
+4. 每个查询都应该是独立的、可搜索的
+
+## 输出格式（每行一个查询，不要编号）
+查询1
+查询2
+查询3
+查询4"""
+
+_REFLECT_SYSTEM_PROMPT = """你是一个信息质量评估专家。请评估检索结果是否足以回答用户问题。
+
+## 评估标准
+1. SUFFICIENT（充分）：检索结果直接回答了问题，信息完整、相关
+2. INSUFFICIENT（不足）：检索结果相关但不完整，需要更多信息
+3. IRRELEVANT（不相关）：检索结果与问题无关
+
+## 输出格式（严格按此格式）
+RESULT: [SUFFICIENT/INSUFFICIENT/IRRELEVANT]
+REASON: [一句话说明原因]
+REFINED_QUERY: [如果是 INSUFFICIENT和IRRELEVANT，给出改进的搜索查询；否则留空]"""
+
+
+# 判断类输出的 "KEY: value" 行（兼容 **TYPE**: WEB、全角冒号等写法），一次匹配取出 key 和值
+_LABEL_RE = re.compile(r"\b([A-Z_]+)\**\s*[:：]\s*\**\s*(.*?)\s*\**\s*$")
+
+
+def _stream_labeled_lines(messages: list, keys: tuple, task: str) -> dict:
+    """
+    流式读取 LLM 输出并逐行解析 "KEY: value"，所有 key 都拿到后立即停止生成
+
+    判断类输出只需要开头几行，不必等模型把后面的解释说完。
+    调用标记为 nostream，不出现在 stream_mode="messages" 的 token 流中。
+    """
+    found = {}
+    buf = ""
+
+    def parse(line: str):
+        m = _LABEL_RE.search(line)
+        if m and m.group(1) in keys and m.group(1) not in found:
+            found[m.group(1)] = m.group(2)
+
+    for chunk in get_llm(task).stream(messages, config={"tags": [TAG_NOSTREAM]}):
+        buf += chunk.content
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            parse(line)
+        if len(found) == len(keys):
+            # 退出循环即关闭生成器，断开流式响应
+            return found
+    parse(buf)
+    return found
+
+
+def _classify_query(query: str) -> tuple:
+    """调用 LLM 判断搜索类型和复杂度，返回 (search_type, complexity)"""
+    fields = _stream_labeled_lines([
+        SystemMessage(content=_CLASSIFY_SYSTEM_PROMPT),
+        HumanMessage(content=f"## 问题\n{query}\n\n分析结论：")
+    ], ("TYPE", "COMPLEXITY"), "classify")
 
     # 解析结果
-    search_type = "WEB"
-    complexity = "SIMPLE"
-    
-    for line in content.split("\n"):
-        if "TYPE:" in line:
-            search_type = line.split(":", 1)[1].strip().upper()
-        if "COMPLEXITY:" in line:
-            complexity = line.split(":", 1)[1].strip().upper()
+    search_type = fields.get("TYPE", "WEB").upper()
+    complexity = fields.get("COMPLEXITY", "SIMPLE").upper()
 
     # 验证与容错
     if search_type not in ["LOCAL", "WEB", "HYBRID", "NONE"]:
         search_type = "WEB"
-    
+
+    return search_type, complexity
+
+
+def _semantic_decision(namespace: str, query: str, compute):
+    """
+    LLM 判断结果的语义缓存：近似问题直接复用之前的判断，未命中才调用 compute()
+
+    Args:
+        namespace: 缓存命名空间（不同判断、不同上下文互不串用）
+        query: 用于向量化比较的用户问题
+        compute: 无参函数，调用 LLM 并返回可 JSON 序列化的结果
+    """
+    if not Config.USE_SEMANTIC_CACHE:
+        return compute()
+
+    embedding = embed_query(query)
+    cache = get_decision_cache()
+    cached = cache.lookup(namespace, embedding)
+    if cached is not None:
+        print(f"  ⚡ 语义缓存命中: {namespace.split(':')[0]}")
+        return cached["value"]
+
+    value = compute()
+    cache.store(namespace, embedding, {"value": value})
+    return value
+
+
+def decide_search(state: AgentState) -> AgentState:
+    """判断搜索类型和复杂度(根据复杂度决定是否开启multi-query)"""
+    state['current_step'] = "🤔 正在判断查询类型..."
+    query = state["current_query"]
+
+    # 明显的问题由规则直接判断；相同问题直接复用之前的路由结果；都未命中才调用 LLM
+    speculative = None
+    ruled = _rule_classify(query)
+    if ruled and ruled[1]:
+        search_type, complexity = ruled
+    else:
+        cache = get_decide_cache()
+        cached = cache.get(query)
+        if cached:
+            search_type, complexity = cached
+        else:
+            # 需要调用 LLM 判断时，同时推测性地扩展查询，两次 LLM 调用并行而不是串行
+            if Config.SPECULATIVE_EXPAND and state.get("use_multi_query", True):
+                speculative = _search_executor.submit(_expand_cached, query)
+            search_type, complexity = _semantic_decision("decide", query, lambda: _classify_query(query))
+            cache.set(query, [search_type, complexity])
+        if ruled:
+            # 规则已确定搜索类型（时效性问题），LLM 的结果只用于复杂度
+            search_type = ruled[0]
+
     state["search_type"] = search_type.lower()
+    # 新问题重置上一轮的扩展查询和反思循环记录（checkpoint 中可能留有上一轮的值）
+    state["expanded_queries"] = []
+    state["speculative_queries"] = []
+    state["previous_queries"] = []
+    state["refine_converged"] = False
     
     # 动态确定是否执行 Multi-Query
     # 逻辑：只有当复杂度为 COMPLEX 且用户没在入口处显式禁用时，才开启扩展
     if state.get("use_multi_query", True):
         state["use_multi_query"] = (complexity == "COMPLEX")
+
+    # 判断为 COMPLEX 时保留推测的扩展结果交给 expand 节点（不再调用 LLM）；否则丢弃
+    if speculative is not None and state["use_multi_query"] and search_type != "NONE":
+        try:
+            state["speculative_queries"] = speculative.result()
+        except Exception as e:
+            print(f"  ⚠️ 推测扩展失败，由 expand 节点重新扩展: {e}")
     
     print(f"  🎯 意图识别: 类型={search_type} | 复杂度={complexity} | Multi-Query={state['use_multi_query']}")
     return state
@@ -91,33 +298,59 @@ def expand_query(state: AgentState) -> AgentState:
     """
     state["current_step"] = "🔄 正在扩展查询问题..."
 
-    # 如果禁用了 Multi-Query，直接返回原查询
-    if not state.get("use_multi_query", True):
-        state["expanded_queries"] = [state["current_query"]]
+    query = state["current_query"]
+
+    # 禁用了 Multi-Query 或查询过短时，直接返回原查询
+    if not state.get("use_multi_query", True) or len(query.strip()) < Config.MIN_EXPAND_QUERY_CHARS:
+        state["expanded_queries"] = [query]
         return state
 
-    query = state["current_query"]
+    # decide_search 已推测性地完成扩展时直接使用
+    expanded = state.get("speculative_queries") or _expand_cached(query)
+    state["expanded_queries"] = expanded
+
+    print(f"  📝 原始查询: {query}")
+    print(f"  🔄 扩展查询 ({len(expanded)} 个):")
+    for i, q in enumerate(expanded, 1):
+        print(f"     {i}. {q}")
 
-    expand_prompt = f"""你是一个查询扩展专家。请将用户的问题扩展为 3-4 个相关但不同角度的搜索查询。
+    return state
 
-## 用户原始问题
-{query}
 
-## 扩展要求
-1. 保留原始问题的核心意图
-2. 使用不同的关键词和表述方式
-3. 可以包含相关的子问题
-4. 每个查询都应该是独立的、可搜索的
+def _expand_cached(query: str) -> list:
+    """相同问题直接复用之前的扩展结果，跳过 LLM 调用"""
+    cache = get_rewrite_cache()
+    expanded = cache.get(query)
+    if expanded is None:
+        expanded = _expand_semantic_cached(query)
+        cache.set(query, expanded)
+    return expanded
 
-## 输出格式（每行一个查询，不要编号）
-查询1
-查询2
-查询3
-查询4
 
-请扩展："""
+def _expand_semantic_cached(query: str) -> list:
+    """近似问题（换种说法）复用之前的扩展结果，未命中才调用 LLM"""
+    if not Config.USE_SEMANTIC_CACHE:
+        return _expand(query)
+
+    embedding = embed_query(query)
+    cache = get_expansion_cache()
+    cached = cache.lookup("expand", embedding)
+    if cached is not None:
+        print("  ⚡ 语义缓存命中: expand_query")
+        # 用当前问题替换原来的问题，其余扩展查询沿用
+        return [query] + [q for q in cached["expanded"] if q not in (query, cached["query"])][:4]
 
-    response = llm.invoke([HumanMessage(content=expand_prompt)])
+    expanded = _expand(query)
+    cache.store("expand", embedding, {"query": query, "expanded": expanded})
+    return expanded
+
+
+def _expand(query: str) -> list:
+    """调用 LLM 把问题扩展为多个子查询（包含原始问题，最多 5 个）"""
+    response = get_llm("expand").invoke([
+        SystemMessage(content=_EXPAND_SYSTEM_PROMPT),
+        HumanMessage(content=f"## 用户原始问题\n{query}\n\n请扩展：")
+    ])
     result_text = response.content.strip()
 
     # 解析扩展的查询
@@ -141,16 +374,10 @@ def expand_query(state: AgentState) -> AgentState:
         if query not in expanded:
             expanded.insert(0, query)
 
-    state["expanded_queries"] = expanded
-
-    print(f"  📝 原始查询: {query}")
-    print(f"  🔄 扩展查询 ({len(expanded)} 个):")
-    for i, q in enumerate(expanded, 1):
-        print(f"     {i}. {q}")
-
-    return state
+    return expanded
 
 
+@semantic_cached("local_contexts", "sources")
 def local_rag_search(state: AgentState) -> AgentState:
     """
     本地知识库检索
@@ -164,34 +391,27 @@ def local_rag_search(state: AgentState) -> AgentState:
     if not queries:
         queries = [state["current_query"]]
 
-    all_contexts = []
-    all_sources = []
-    seen_contents = set()  # 用于去重
-
-    for query in queries:
-        result = get_rag_manager().query(query, top_n=3)  # 每个查询取 top 3
-
-        for ctx in result["contexts"]:
-            content = ctx.get("content", "")
-            # 简单去重：跳过重复内容
-            content_hash = hash(content[:100])
-            if content_hash not in seen_contents:
-                seen_contents.add(content_hash)
-                all_contexts.append(ctx)
-                all_sources.append({
-                    "type": "local",
-                    "source": ctx.get("metadata", {}).get("source", ""),
-                    "score": float(ctx.get("score", 0))
-                })
-
-    # 按分数排序，取 top 5
-    all_contexts.sort(key=lambda x: x.get("score", 0), reverse=True)
-    all_contexts = all_contexts[:5]
-    all_sources = all_sources[:5]
+    # 各子查询批量检索（一次编码 + 一次向量查询），每个查询取 top 3，合并后去重
+    all_contexts = _local_search_batch(queries, top_n=3)
+
+    # 取 top 5（来源与选出的结果一一对应）：
+    # 候选较多时（Multi-Query）用 MMR 兼顾相关度和多样性，否则直接按分数排序
+    if len(all_contexts) > Config.MMR_MIN_CANDIDATES:
+        all_contexts = mmr_rerank(all_contexts, k=5, lam=Config.MMR_LAMBDA)
+    else:
+        all_contexts = _top_contexts(all_contexts, 5)
+    all_sources = [
+        {
+            "type": "local",
+            "source": ctx.get("metadata", {}).get("source", ""),
+            "score": float(ctx.get("score", 0))
+        }
+        for ctx in all_contexts
+    ]
 
     # 格式化结果
     state["local_contexts"] = _format_local_contexts(all_contexts)
-    state["sources"] = all_sources
+    state["sources"] = _dedup_sources(all_sources)
 
     print(f"  📚 检索到 {len(all_contexts)} 条本地结果")
     return state
@@ -202,77 +422,48 @@ def _format_local_contexts(contexts: list) -> str:
     if not contexts:
         return "## 本地知识库检索结果\n\n未找到相关内容。"
 
-    import os
-    result = "## 本地知识库检索结果\n\n"
+    # 先收集片段再一次性拼接，避免循环中 += 反复复制字符串
+    parts = ["## 本地知识库检索结果\n\n"]
     for i, ctx in enumerate(contexts, 1):
         source = ctx.get('metadata', {}).get('source', '未知来源')
         if source and source != '未知来源':
-            source = os.path.basename(source)
-        score = ctx.get('score', 0)
-        result += f"[{i}] 来源: {source} (相关度: {score:.2f})\n"
-        result += f"内容: {ctx.get('content', '')}\n\n"
-    return result
+            source = source_basename(source)
+        parts.append(
+            f"[{i}] 来源: {source} (相关度: {ctx.get('score', 0):.2f})\n"
+            f"内容: {ctx.get('content', '')}\n\n"
+        )
+    return "".join(parts)
 
 
+@semantic_cached("local_contexts", "search_results", "sources")
 def hybrid_search(state: AgentState) -> AgentState:
     """混合搜索：本地 + 网络 (支持 Multi-Query)"""
     state["current_step"] = "🔄 正在进行混合搜索..."
     
-    queries = state.get("expanded_queries", [state["current_query"]])
-    
-    # 1. 本地检索 (取全量 queries)
-    all_local_contexts = []
-    seen_local = set()
-    for q in queries:
-        local_result = get_rag_manager().query(q, top_n=3)
-        for ctx in local_result["contexts"]:
-            content_hash = hash(ctx.get("content", "")[:100])
-            if content_hash not in seen_local:
-                seen_local.add(content_hash)
-                all_local_contexts.append(ctx)
-    
-    # 2. 网络搜索 (并发执行所有 queries)
-    from concurrent.futures import ThreadPoolExecutor
-    all_web_results = []
-    seen_urls = set()
+    queries = state.get("expanded_queries") or [state["current_query"]]
     
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        batch_results = list(executor.map(search_tool.invoke, queries))
-        
-    for results in batch_results:
-        # 处理不同格式的返回结果
-        search_hits = []
-        if isinstance(results, list):
-            search_hits = results
-        elif isinstance(results, dict):
-            # Tavily 等可能返回 {"results": [...]} 或 {"answer": ...}
-            search_hits = results.get("results", [])
-            if not search_hits and "answer" in results:
-                search_hits = [{"content": results["answer"], "url": "Tavily Answer"}]
-        elif isinstance(results, str):
-            search_hits = [{"content": results, "url": "N/A"}]
-            
-        for r in search_hits:
-            url = r.get("url", r.get("link", "N/A"))
-            if url not in seen_urls:
-                seen_urls.add(url)
-                all_web_results.append(r)
+    # 本地检索（CPU/GPU 推理）和网络搜索（等待网络）两个分支互不依赖：
+    # 本地分支交给线程池，当前线程同时发起网络搜索，总耗时约为 max(本地, 网络) 而不是两者之和
+    local_future = _search_executor.submit(_local_search_batch, queries, 3)
+    all_web_results = _web_search_batch(queries)
+    # 多个子查询的结果按分数取 top 5，而不是按查询顺序截断
+    all_local_contexts = _top_contexts(local_future.result(), 5)
 
     # 格式化
-    state["local_contexts"] = _format_local_contexts(all_local_contexts[:5])
+    state["local_contexts"] = _format_local_contexts(all_local_contexts)
     state["search_results"] = "\n\n".join([
         f"[网络{i+1}] 来源: {r.get('url', 'N/A')}\n内容: {r.get('content', '')}"
         for i, r in enumerate(all_web_results[:5])
     ])
     
     # 合并来源
-    state["sources"] = [
+    state["sources"] = _dedup_sources([
         {"type": "local", "source": ctx.get("metadata", {}).get("source", ""), "score": float(ctx.get("score", 0))}
         for ctx in all_local_contexts[:3]
     ] + [
         {"type": "web", "source": r.get("url", ""), "score": 1.0}
         for r in all_web_results[:3]
-    ]
+    ])
     
     return state
 
@@ -308,33 +499,115 @@ def generate_answer(state: AgentState) -> AgentState:
     else:
         prompt = f"回答以下问题：{query}"
     
-    messages = state["messages"] + [HumanMessage(content=prompt)]
-    response = llm.invoke(messages)
-    
-    state["final_answer"] = response.content
+    history, summary, summarized_upto = _bounded_history(state)
+    messages = history + [HumanMessage(content=prompt)]
+
+    # 流式生成：graph.stream(stream_mode="messages") 可以逐 token 拿到输出，
+    # 调用方无需等待完整答案即可开始展示
+    chunks = []
+    for chunk in get_llm().stream(messages):
+        chunks.append(chunk.content)
+    answer = "".join(chunks)
+
+    state["final_answer"] = answer
+    state["history_summary"] = summary
+    state["history_summarized_upto"] = summarized_upto
     state["current_step"] = "✅ 完成"
     
     # 更新对话历史
     state["messages"].append(HumanMessage(content=query))
-    state["messages"].append(AIMessage(content=response.content))
+    state["messages"].append(AIMessage(content=answer))
     
     return state
 
 
-def search_web(state: AgentState) -> AgentState:
-    """网络搜索节点 (支持 Multi-Query)"""
-    state["current_step"] = "🔍 正在搜索网络..."
+def _bounded_history(state: AgentState) -> tuple:
+    """
+    裁剪发送给 LLM 的对话历史，避免 prompt 随会话增长线性变长
 
-    queries = state.get("expanded_queries") or [state["current_query"]]
-    
-    # 并发搜索
-    from concurrent.futures import ThreadPoolExecutor
+    - 只保留 MAX_HISTORY_TOKENS 以内的最近消息（从用户提问开始）
+    - 被裁掉的消息按 HISTORY_SUMMARY_EVERY 轮一批合并进滚动摘要，以 SystemMessage 放在最前；
+      history_summarized_upto 记录已合并进摘要的消息数，尚未合并的消息仍留在 prompt 中，
+      每条消息总在摘要或 prompt 之一里，不会丢失
+
+    Returns:
+        (裁剪后的消息列表, 最新摘要, 已合并进摘要的消息数)
+    """
+    history = state.get("messages", [])
+    summary = state.get("history_summary", "")
+    summarized_upto = state.get("history_summarized_upto", 0)
+    trimmed = trim_messages(
+        history,
+        max_tokens=Config.MAX_HISTORY_TOKENS,
+        strategy="last",
+        token_counter=count_message_tokens,
+        start_on="human"
+    )
+
+    every = Config.HISTORY_SUMMARY_EVERY
+    dropped_upto = len(history) - len(trimmed)
+    if every and dropped_upto > summarized_upto:
+        merged = None
+        if dropped_upto - summarized_upto >= 2 * every:
+            # 攒够 every 轮再合并：把水位线之后所有被裁掉的消息一次并入摘要
+            merged = _summarize_history(summary, history[summarized_upto:dropped_upto])
+        if merged is not None:
+            summary, summarized_upto = merged, dropped_upto
+        else:
+            # 还没攒够（或摘要失败）：尚未摘要的消息继续留在 prompt 中
+            trimmed = history[summarized_upto:]
+
+    if summary:
+        trimmed = [SystemMessage(content=f"此前对话摘要：{summary}")] + trimmed
+    return trimmed, summary, summarized_upto
+
+
+def _summarize_history(summary: str, messages: list) -> Optional[str]:
+    """把新裁掉的对话合并进已有摘要，失败时返回 None"""
+    dialogue = "\n".join(
+        f"{'用户' if isinstance(m, HumanMessage) else '助手'}: {m.content}" for m in messages
+    )
+    prompt = f"""请把以下对话合并进已有摘要，保留关键事实、实体和用户偏好，不超过 200 字。
+
+## 已有摘要
+{summary or "无"}
+
+## 新对话
+{dialogue}
+
+只输出新的摘要："""
+    try:
+        # nostream：摘要不属于答案，不出现在 stream_mode="messages" 的 token 流中
+        response = get_llm().invoke([HumanMessage(content=prompt)], config={"tags": [TAG_NOSTREAM]})
+        print("  🗜️ 已压缩早期对话历史")
+        return response.content.strip()
+    except Exception as e:
+        print(f"  ⚠️ 历史摘要失败，暂不压缩: {e}")
+        return None
+
+
+def _local_search_batch(queries: list, top_n: int) -> list:
+    """本地知识库批量检索多个子查询，合并去重"""
+    return _dedup_local_contexts(get_rag_manager().query_batch(queries, top_n=top_n))
+
+
+def _web_search_batch(queries: list) -> list:
+    """多个子查询并发网络搜索，按 URL 合并去重"""
+    return _dedup_web_hits(_search_executor.map(get_search_tool().invoke, queries))
+
+
+def _unique_by_hash(items: list, hashes: list) -> list:
+    """按预先计算的 64 位哈希去重，保留每个哈希第一次出现的条目（保持原顺序）"""
+    if not items:
+        return []
+    _, first_idx = np.unique(np.array(hashes, dtype=np.uint64), return_index=True)
+    return [items[i] for i in np.sort(first_idx)]
+
+
+def _dedup_web_hits(batch_results) -> list:
+    """把多个查询的网络搜索返回统一成结果列表，并按 URL 去重"""
     all_results = []
-    seen_urls = set()
-    
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        batch_results = list(executor.map(search_tool.invoke, queries))
-        
+
     for results in batch_results:
         # 处理不同格式的返回结果
         search_hits = []
@@ -348,25 +621,77 @@ def search_web(state: AgentState) -> AgentState:
         elif isinstance(results, str):
             search_hits = [{"content": results, "url": "N/A"}]
             
-        for r in search_hits:
-            url = r.get("url", r.get("link", "N/A"))
-            if url not in seen_urls:
-                seen_urls.add(url)
-                all_results.append(r)
+        all_results.extend(search_hits)
 
-    # 格式化结果 (取前 8 条，避免上下文过长)
-    formatted = "\n\n".join([
-        f"来源 {i + 1}: {r.get('url', 'N/A')}\n搜索内容：{r.get('content', r.get('snippet', ''))}"
-        for i, r in enumerate(all_results[:8])
-    ])
+    url_hashes = [
+        xxhash.xxh3_64_intdigest(str(r.get("url", r.get("link", "N/A"))).encode()) for r in all_results
+    ]
+    return _unique_by_hash(all_results, url_hashes)
+
+
+def _dedup_local_contexts(batch_results) -> list:
+    """合并多个查询的本地检索结果，按完整内容去重"""
+    all_contexts = [ctx for result in batch_results for ctx in result["contexts"]]
+    # 哈希完整内容：只取前 100 字时，开头相同（如模板化标题）的不同 chunk 会被误删
+    content_hashes = [xxhash.xxh3_64_intdigest(ctx.get("content", "").encode()) for ctx in all_contexts]
+    return _unique_by_hash(all_contexts, content_hashes)
+
+
+def _top_contexts(contexts: list, k: int) -> list:
+    """按 score 取前 k 条（分数一次转成数组，argpartition 选出 top k 后只对这 k 条排序）"""
+    k = min(k, len(contexts))
+    if k <= 0:
+        return []
+    scores = np.fromiter((float(ctx.get("score", 0)) for ctx in contexts), dtype=np.float64, count=len(contexts))
+    top = np.argpartition(-scores, k - 1)[:k]
+    # 分数相同时保持原顺序
+    top = top[np.lexsort((top, -scores[top]))]
+    return [contexts[i] for i in top]
+
+
+def _dedup_sources(sources: list) -> list:
+    """按来源去重（同一来源保留最后一次写入），避免反思循环中重复来源撑大 checkpoint"""
+    return list({s["source"]: s for s in sources}.values())
+
+
+def _format_web_results(results: list) -> str:
+    """格式化网络搜索结果：片段写入同一个列表，最后一次 join，避免逐条拼接中间字符串"""
+    if not results:
+        return ""
+
+    buf = []
+    append = buf.append
+    for i, r in enumerate(results, 1):
+        if i > 1:
+            append("\n\n")
+        get = r.get
+        append("来源 ")
+        append(str(i))
+        append(": ")
+        append(str(get("url", "N/A")))
+        append("\n搜索内容：")
+        append(str(get("content", get("snippet", ""))))
+    return "".join(buf)
+
+
+@semantic_cached("search_results", "sources")
+def search_web(state: AgentState) -> AgentState:
+    """网络搜索节点 (支持 Multi-Query)"""
+    state["current_step"] = "🔍 正在搜索网络..."
 
-    state["search_results"] = formatted
+    queries = state.get("expanded_queries") or [state["current_query"]]
+    
+    # 并发搜索
+    all_results = _web_search_batch(queries)
+
+    # 格式化结果 (取前 8 条，避免上下文过长)
+    state["search_results"] = _format_web_results(all_results[:8])
     
     # 更新 sources
-    state["sources"] = [
+    state["sources"] = _dedup_sources([
         {"type": "web", "source": r.get("url", "N/A"), "score": 1.0}
         for r in all_results[:5]
-    ]
+    ])
     
     print(f"  🌐 网络检索完成: 共 {len(queries)} 个查询, 得到 {len(all_results)} 条去重结果")
     return state
@@ -409,45 +734,33 @@ def reflect_on_results(state: AgentState) -> AgentState:
         state["loop_count"] = loop_count + 1
         return state
 
-    # 让 LLM 评估结果质量
-    reflect_prompt = f"""你是一个信息质量评估专家。请评估以下检索结果是否足以回答用户问题。
-
-## 用户问题
+    # 让 LLM 评估结果质量（检索结果限制长度避免 token 过多）；
+    # 改进搜索的结果追加在末尾，之后的轮次保留首尾各一半，保证评判能看到新结果
+    judged = all_contexts[:3000]
+    if loop_count > 0 and len(all_contexts) > 3000:
+        judged = all_contexts[:1500] + "\n\n...\n\n" + all_contexts[-1500:]
+    reflect_input = f"""## 用户问题
 {query}
 
 ## 检索结果
-{all_contexts[:3000]}  # 限制长度避免 token 过多
-
-## 评估标准
-1. SUFFICIENT（充分）：检索结果直接回答了问题，信息完整、相关
-2. INSUFFICIENT（不足）：检索结果相关但不完整，需要更多信息
-3. IRRELEVANT（不相关）：检索结果与问题无关
-
-## 输出格式（严格按此格式）
-RESULT: [SUFFICIENT/INSUFFICIENT/IRRELEVANT]
-REASON: [一句话说明原因]
-REFINED_QUERY: [如果是 INSUFFICIENT和IRRELEVANT，给出改进的搜索查询；否则留空]
+{judged}
 
 请评估："""
 
-    response = llm.invoke([HumanMessage(content=reflect_prompt)])
-    result_text = response.content.strip()
-
-    # 解析 LLM 输出
-    reflection_result = "sufficient"  # 默认充分
-    reflection_reason = ""
-    refined_query = ""
-
-    for line in result_text.split("\n"):
-        line = line.strip()
-        if line.startswith("RESULT:"):
-            result_value = line.replace("RESULT:", "").strip().upper()
-            if result_value in ["SUFFICIENT", "INSUFFICIENT", "IRRELEVANT"]:
-                reflection_result = result_value.lower()
-        elif line.startswith("REASON:"):
-            reflection_reason = line.replace("REASON:", "").strip()
-        elif line.startswith("REFINED_QUERY:"):
-            refined_query = line.replace("REFINED_QUERY:", "").strip()
+    # 完全相同的评估请求直接复用；同一批检索结果下的近似问题复用之前的评估。
+    # 两级缓存都以完整的检索结果作为 key：refine_search 把改进结果追加在末尾，
+    # 只看前缀（或截断后的评估输入）会命中上一轮的评估，改进后的结果永远得不到评判
+    cache_key = f"{query}\n{all_contexts}"
+    cache = get_reflect_cache()
+    cached = cache.get(cache_key)
+    if cached:
+        reflection_result, reflection_reason, refined_query = cached
+    else:
+        context_key = hashlib.blake2b(all_contexts.encode(), digest_size=8).hexdigest()
+        reflection_result, reflection_reason, refined_query = _semantic_decision(
+            f"reflect:{context_key}", query, lambda: _reflect(reflect_input)
+        )
+        cache.set(cache_key, [reflection_result, reflection_reason, refined_query])
 
     # 更新状态
     state["reflection_result"] = reflection_result
@@ -455,6 +768,11 @@ REFINED_QUERY: [如果是 INSUFFICIENT和IRRELEVANT，给出改进的搜索查
     state["refined_query"] = refined_query if refined_query else query
     state["loop_count"] = loop_count + 1
 
+    if reflection_result != "sufficient":
+        previous = state.get("previous_queries") or []
+        state["refine_converged"] = _is_repeated_query(state["refined_query"], [query] + previous)
+        state["previous_queries"] = previous + [state["refined_query"]]
+
     # 打印反思结果（调试用）
     print(f"  🔍 反思结果: {reflection_result}")
     print(f"  📝 原因: {reflection_reason}")
@@ -465,6 +783,32 @@ REFINED_QUERY: [如果是 INSUFFICIENT和IRRELEVANT，给出改进的搜索查
     return state
 
 
+def _reflect(reflect_input: str) -> list:
+    """调用 LLM 评估检索结果，返回 [reflection_result, reflection_reason, refined_query]"""
+    fields = _stream_labeled_lines([
+        SystemMessage(content=_REFLECT_SYSTEM_PROMPT),
+        HumanMessage(content=reflect_input)
+    ], ("RESULT", "REASON", "REFINED_QUERY"), "reflect")
+
+    # 解析 LLM 输出
+    reflection_result = "sufficient"  # 默认充分
+    result_value = fields.get("RESULT", "").upper()
+    if result_value in ["SUFFICIENT", "INSUFFICIENT", "IRRELEVANT"]:
+        reflection_result = result_value.lower()
+
+    return [reflection_result, fields.get("REASON", ""), fields.get("REFINED_QUERY", "")]
+
+
+def _is_repeated_query(refined_query: str, previous: list) -> bool:
+    """改进查询与之前任一查询的向量相似度超过阈值时视为重复（Embedding 远比一次 LLM 改写 + 检索便宜）"""
+    try:
+        embeddings = embed_query([refined_query] + previous)
+    except Exception as e:
+        print(f"  ⚠️ 查询向量化失败，跳过重复检测: {e}")
+        return False
+    return float(np.max(embeddings[1:] @ embeddings[0])) > Config.REFINE_SIMILARITY_THRESHOLD
+
+
 def refine_search(state: AgentState) -> AgentState:
     """
     改进搜索节点：使用改进后的查询重新搜索
@@ -489,10 +833,10 @@ def refine_search(state: AgentState) -> AgentState:
             {"type": "local", "source": ctx.get("metadata", {}).get("source", ""), "score": float(ctx.get("score", 0))}
             for ctx in result["contexts"]
         ]
-        state["sources"] = state.get("sources", []) + new_sources
+        state["sources"] = _dedup_sources(state.get("sources", []) + new_sources)
 
     elif search_type == "web":
-        results = search_tool.invoke(refined_query)
+        results = get_search_tool().invoke(refined_query)
         if isinstance(results, list):
             formatted = "\n\n".join([
                 f"来源: {r.get('url', 'N/A')}\n内容：{r.get('content', '')}"
@@ -506,7 +850,7 @@ def refine_search(state: AgentState) -> AgentState:
     elif search_type == "hybrid":
         # 混合搜索
         local_result = get_rag_manager().query(refined_query, top_n=3)
-        web_results = search_tool.invoke(refined_query)
+        web_results = get_search_tool().invoke(refined_query)
 
         existing_local = state.get("local_contexts", "")
         state["local_contexts"] = existing_local + "\n\n--- 改进搜索结果 ---\n" + local_result["formatted"]
@@ -0,0 +1,123 @@
+"""
+Checkpoint 持久化
+
+Config.CHECKPOINTER_BACKEND 选择后端：
+- "sqlite"（默认）：本地文件，适合开发调试
+- "postgres"：MVCC 支持多会话并发写入，适合生产部署（需要 langgraph-checkpoint-postgres）
+
+build_checkpointer / build_async_checkpointer 按配置创建对应的 Saver。
+
+SQLite 连接管理
+
+各个 Graph 原本各自 sqlite3.connect 一个裸连接（默认 rollback journal），
+并发调用时读写互相阻塞。这里统一管理 checkpoint 连接：
+- 同一数据库文件只建立一次连接，按路径缓存复用
+- 开启 WAL：读不阻塞写、写不阻塞读
+- synchronous=NORMAL（WAL 下足够安全）、临时表放内存、启用 mmap
+- 进程退出时统一关闭
+
+SqliteSaver 内部自带写锁，同一个连接上的写操作已经串行化，这里不再额外加锁。
+
+使用方式：
+    memory = build_checkpointer("checkpoints.db")
+"""
+import atexit
+import os
+import sqlite3
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from src.config import Config
+
+# 数据库路径 -> 连接
+_connections: Dict[str, sqlite3.Connection] = {}
+_lock = threading.Lock()
+
+
+def get_checkpoint_conn(db_path: str) -> sqlite3.Connection:
+    """
+    获取（或创建）指定 checkpoint 数据库的共享连接
+
+    Args:
+        db_path: 数据库文件路径
+    """
+    key = os.path.abspath(db_path)
+    with _lock:
+        conn = _connections.get(key)
+        if conn is None:
+            conn = sqlite3.connect(key, check_same_thread=False)  # 允许多线程访问
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA mmap_size=268435456")  # 256MB
+            _connections[key] = conn
+        return conn
+
+
+@atexit.register
+def close_checkpoint_conns():
+    """关闭所有 checkpoint 连接"""
+    with _lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+
+
+# Postgres 连接池（所有 Graph 共用，惰性创建，schema 只初始化一次）
+_postgres_saver = None
+
+
+def _get_postgres_saver():
+    global _postgres_saver
+    with _lock:
+        if _postgres_saver is None:
+            from langgraph.checkpoint.postgres import PostgresSaver
+            from psycopg.rows import dict_row
+            from psycopg_pool import ConnectionPool
+
+            pool = ConnectionPool(
+                Config.POSTGRES_URL,
+                kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+            )
+            atexit.register(pool.close)
+            _postgres_saver = PostgresSaver(pool)
+            _postgres_saver.setup()
+        return _postgres_saver
+
+
+def build_checkpointer(db_name: str):
+    """
+    按配置创建同步 checkpointer
+
+    Args:
+        db_name: SQLite 后端使用的数据库文件名（位于 CHECKPOINT_DIR 下）
+    """
+    if Config.CHECKPOINTER_BACKEND == "postgres":
+        return _get_postgres_saver()
+    return SqliteSaver(get_checkpoint_conn(os.path.join(Config.CHECKPOINT_DIR, db_name)))
+
+
+@asynccontextmanager
+async def build_async_checkpointer(db_name: str):
+    """
+    按配置创建异步 checkpointer（用于 ainvoke / astream）
+
+    Args:
+        db_name: SQLite 后端使用的数据库文件名（位于 CHECKPOINT_DIR 下）
+    """
+    if Config.CHECKPOINTER_BACKEND == "postgres":
+        from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+        async with AsyncPostgresSaver.from_conn_string(Config.POSTGRES_URL) as checkpointer:
+            await checkpointer.setup()
+            yield checkpointer
+    else:
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+        async with AsyncSqliteSaver.from_conn_string(
+            os.path.join(Config.CHECKPOINT_DIR, db_name)
+        ) as checkpointer:
+            yield checkpointer
@@ -1,31 +1,13 @@
-# """配置文件"""
-
-# # Embedding 模型
-# EMBEDDING_MODEL = "shibing624/text2vec-base-chinese"
-
-# # Rerank 模型
-# RERANK_MODEL = "BAAI/bge-reranker-base"
-
-# # 大模型配置
-# LLM_API_KEY = "your-api-key"
-# LLM_BASE_URL = "base_url"
-# LLM_MODEL = "deepseek-r1"
-
-# # 切分配置
-# CHUNK_SIZE = 500
-# CHUNK_OVERLAP = 100
-
-# # 检索配置
-# VECTOR_SEARCH_TOP_K = 20  # 向量检索召回数量
-# RERANK_TOP_N = 5          # Rerank 后保留数量
-# VECTOR_WEIGHT = 0.6       # 混合检索中向量权重
-
-"""RAG 模块配置"""
+"""RAG 模块配置（统一从 src.config 读取，不再单独维护一份配置）"""
 from src.config import Config
 
 class RAGConfig:
     EMBEDDING_MODEL = Config.EMBEDDING_MODEL        # Embedding 模型
     RERANK_MODEL = Config.RERANK_MODEL          # Rerank 模型
+    EMBED_BACKEND = Config.EMBED_BACKEND        # 模型推理后端
+    EMBED_QUANT_CONFIG = Config.EMBED_QUANT_CONFIG    # int8 量化目标指令集
+    QUANTIZED_MODEL_DIR = Config.QUANTIZED_MODEL_DIR  # 量化模型保存目录
+    JIEBA_USER_DICT = Config.JIEBA_USER_DICT    # jieba 自定义词典
     CHUNK_SIZE = Config.CHUNK_SIZE          # 文档切分大小
     CHUNK_OVERLAP = Config.CHUNK_OVERLAP         # 文档切分重叠部分
 
@@ -38,4 +20,17 @@ class RAGConfig:
     VECTOR_WEIGHT = Config.VECTOR_WEIGHT       # 混合检索中向量权重
 
     # 向量库持久化目录
-    VECTOR_DB_DIR = Config.VECTOR_DB_DIR #持久化向量库路径
\ No newline at end of file
+    VECTOR_DB_DIR = Config.VECTOR_DB_DIR #持久化向量库路径
+
+    # 语义缓存
+    CHECKPOINT_DIR = Config.CHECKPOINT_DIR
+    USE_SEMANTIC_CACHE = Config.USE_SEMANTIC_CACHE
+    SEMANTIC_CACHE_THRESHOLD = Config.SEMANTIC_CACHE_THRESHOLD
+    SEMANTIC_CACHE_SIZE = Config.SEMANTIC_CACHE_SIZE
+    SEMANTIC_CACHE_TTL = Config.SEMANTIC_CACHE_TTL
+    EXPANSION_CACHE_THRESHOLD = Config.EXPANSION_CACHE_THRESHOLD
+    EXPANSION_CACHE_TTL = Config.EXPANSION_CACHE_TTL
+    DECISION_CACHE_THRESHOLD = Config.DECISION_CACHE_THRESHOLD
+    RETRIEVAL_CACHE_THRESHOLD = Config.RETRIEVAL_CACHE_THRESHOLD
+    RETRIEVAL_CACHE_TTL = Config.RETRIEVAL_CACHE_TTL
+    DECISION_CACHE_TTL = Config.DECIDE_CACHE_TTL
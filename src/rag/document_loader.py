@@ -29,7 +29,22 @@ PDF 则是结构化的，
 处理完记得关闭文档（或者用 with fitz.open(...) as doc: 自动关闭）。
 基本流程就是：open → 遍历页 → get_text → close。这些 API 足够你实现 load_pdf 了。
 """
-from typing import List
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+# 切分点：段落 > 换行 > 句末标点，一次扫描同时找出三类分隔符
+_SPLIT_RE = re.compile(r"(\n\n)|(\n)|([.。！？?!])")
+
+# 页数达到该值的 PDF 按页段分给多个进程并行提取
+_PARALLEL_PDF_PAGES = 50
+
+
+def _extract_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """在子进程中打开 PDF，提取 [start, stop) 页的文字"""
+    with fitz.open(file_path) as doc:
+        return [doc.load_page(i).get_text("text") for i in range(start, stop)]
 
 
 class DocumentLoader:
@@ -39,20 +54,43 @@ class DocumentLoader:
     3. split_text(text, chunk_size, overlap) - 切分文本
     """
 
+    def __init__(self, parallel_pdf: bool = True):
+        """
+        Args:
+            parallel_pdf: 大 PDF 是否按页段多进程提取；本身已在子进程中运行时应关闭，避免嵌套进程池
+        """
+        self.parallel_pdf = parallel_pdf
+
     def load_pdf(self, file_path: str) -> str:
         """
         加载 PDF 文件，返回纯文本
         提示：使用 fitz.open() 打开，遍历每页提取文字
+
+        页数较多时按页段分给多个进程并行提取：PyMuPDF 不支持多线程
+        （文档对象不是线程安全的，提取时也不释放 GIL），只能用多进程，每个进程各自打开文件
         """
-        text = []
         with fitz.open(file_path) as doc:
-            for page_index in range(doc.page_count):
-                # 拿到 page 对象
-                page = doc.load_page(page_index)
-                # 获取当页文字
-                page_text = page.get_text("text")
-                text.append(page_text)
-        return "\n".join(text)
+            page_count = doc.page_count
+            workers = min(8, os.cpu_count() or 1)
+            if not self.parallel_pdf or page_count < _PARALLEL_PDF_PAGES or workers == 1:
+                text = []
+                for page_index in range(page_count):
+                    # 拿到 page 对象
+                    page = doc.load_page(page_index)
+                    # 获取当页文字
+                    page_text = page.get_text("text")
+                    text.append(page_text)
+                return "\n".join(text)
+        return self._load_pdf_parallel(file_path, page_count, workers)
+
+    @staticmethod
+    def _load_pdf_parallel(file_path: str, page_count: int, workers: int) -> str:
+        step = -(-page_count // workers)  # 向上取整
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        with ProcessPoolExecutor(max_workers=len(ranges)) as ex:
+            # map 按提交顺序返回，页序不变
+            segments = ex.map(_extract_pages, [file_path] * len(ranges), *zip(*ranges))
+            return "\n".join(page for segment in segments for page in segment)
 
     def load_txt(self, file_path: str) -> str:
         """加载 TXT/MD 文件"""
@@ -71,9 +109,6 @@ class DocumentLoader:
 
     def split_text(self, text: str, chunk_size: int = 500,
                    overlap: int = 100) -> List[str]:
-
-        chunk_size = int(chunk_size)
-        overlap = int(overlap)
         """
         切分文本
 
@@ -82,11 +117,23 @@ class DocumentLoader:
         2. 相邻 chunk 有 overlap 个字符重叠
         3. 尽量在句号、换行处切分，保持语义完整 （检查每个 chunk 末50字符）
         """
+        return [text[start:end] for start, end in self.split_text_spans(text, chunk_size, overlap)]
+
+    def split_text_spans(self, text: str, chunk_size: int = 500,
+                         overlap: int = 100) -> List[Tuple[int, int]]:
+        """
+        切分文本，只返回每个 chunk 的 (起始, 结束) 位置，规则同 split_text
+
+        查找切分点时直接在原文本的指定范围内搜索，不为每个 chunk 的末尾再切片复制一份；
+        chunk 内容由调用方在真正需要时再取出
+        """
+        chunk_size = int(chunk_size)
+        overlap = int(overlap)
         if not text:
             return []
 
         start = 0
-        chunks = []
+        spans = []
         text_len = len(text)
         while start < text_len:
             end = min(start + chunk_size, text_len)
@@ -94,32 +141,27 @@ class DocumentLoader:
             #如果不是最后一个块
             if end < text_len:
                 search_start = max(end - 50, start)
-                chunk_tail = text[search_start:end]
-                # 判断切分的 chunk 末尾 50个字符里，是否有换行符
+                # 在 chunk 末尾 50 个字符里找切分点：记录每类分隔符最后一次出现的结束位置，
+                # 优先按段落切分，其次换行，最后按句子切分
+                last_end = [-1, -1, -1]
+                for m in _SPLIT_RE.finditer(text, search_start, end):
+                    last_end[m.lastindex - 1] = m.end()
                 best_split = -1
-                # 先按照段落分割，再按照句子分割
-                for sep in ["\n\n", "\n"]:
-                    pos = chunk_tail.rfind(sep)
-                    if pos != -1:  # 找到换行符
-                        best_split = search_start + pos + len(sep) #best_split处于换行符的后一个位置
-                if best_split == -1:
-                    #没找到换行符，那就找是否有完整的句子
-                    for sep in ['.','。','！','？','?',"!"]:
-                        pos = chunk_tail.rfind(sep)
-                        if pos !=-1:
-                            best_split = search_start + pos + len(sep)
+                for pos in last_end:
+                    if pos != -1:
+                        best_split = pos #best_split处于分隔符的后一个位置
+                        break
 
                 if best_split > start:
                     end = best_split
 
-            #提取 chunk
-            chunk = text[start:end]
-            if chunk:
-                chunks.append(chunk)
+            #记录 chunk 位置
+            if end > start:
+                spans.append((start, end))
             #计算下一个位置
             start = end - overlap if end < text_len else text_len
 
-        return chunks
+        return spans
 
     def load_and_split(self, file_path: str, chunk_size: int = 500,overlap: int = 100) -> List[dict]:
         """
@@ -127,13 +169,13 @@ class DocumentLoader:
         面试加分点：保留来源信息，方便后续引用溯源
         """
         text = self.load(file_path)
-        chunks = self.split_text(text,chunk_size,overlap)
+        spans = self.split_text_spans(text,chunk_size,overlap)
         return [
             {
-            "content":chunk,
+            "content":text[start:end],
             "metadata":{
                 "source":file_path,
                 "chunk_index":i
             }
         }
-            for i,chunk in enumerate(chunks)]
+            for i,(start,end) in enumerate(spans)]
@@ -0,0 +1,57 @@
+"""
+文档 Embedding 缓存
+
+Embedding 结果只取决于 模型 + 文本内容：clear() 后重新导入、切换持久化目录、
+强制重新导入同一批文件时，已经编码过的 chunk 不必再过一遍模型。
+
+- 键为 "{模型}:{推理后端}:{sha1(内容)}"，值为 float16 向量（体积减半，交给 Chroma 前转回 float32）
+- 持久化到 {persist_dir}/embed_cache.sqlite；clear() 只清空向量库，不清空这里
+
+使用方式：
+    cache = EmbedCache(path)
+    cached = cache.get_many(keys)        # {key: np.ndarray}
+    cache.put_many(missing_keys, vectors)
+"""
+import sqlite3
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+# SQLite 单条语句的参数个数有上限，IN (...) 查询分段进行
+_SQL_BATCH = 500
+
+
+class EmbedCache:
+    """基于 SQLite 的文档向量缓存"""
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embed_cache (key TEXT PRIMARY KEY, vec BLOB)")
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """批量查询，返回命中的 {key: float32 向量}"""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embed_cache WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for key, vec in rows:
+                    found[key] = np.frombuffer(vec, dtype=np.float16).astype(np.float32)
+        return found
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        """批量写入（以 float16 存储）"""
+        vectors = np.asarray(vectors, dtype=np.float16)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embed_cache (key, vec) VALUES (?, ?)",
+                [(key, vec.tobytes()) for key, vec in zip(keys, vectors)]
+            )
+            self._conn.commit()
@@ -0,0 +1,78 @@
+"""
+Embedding 模型加载
+
+知识库（VectorStore）、语义缓存（查询向量化）、MMR 都使用同一个 Embedding 模型。
+这里按 (模型, 推理后端, 量化配置) 在进程内只加载一份，且不依赖 RAGManager / Chroma：
+只需要查询向量的路径（如纯网络搜索节点的语义缓存）不会因此连带创建向量库客户端。
+
+使用方式：
+    embedder = get_embedder(RAGConfig.EMBEDDING_MODEL, RAGConfig.EMBED_BACKEND)
+"""
+import os
+import threading
+from typing import Dict, Tuple
+
+from sentence_transformers import SentenceTransformer
+
+_embedders: Dict[Tuple[str, str, str, str], SentenceTransformer] = {}
+_lock = threading.Lock()
+
+
+def load_int8_onnx_embedder(model_name: str, quant_config: str, cache_dir: str) -> SentenceTransformer:
+    """
+    加载动态量化为 int8 的 ONNX Embedding 模型
+
+    权重量化为 int8（per-channel），矩阵乘法在支持 VNNI 的 CPU 上走 int8 点积指令，
+    内存带宽减半、吞吐约翻倍，检索召回几乎不受影响。
+    首次调用时导出 ONNX 并量化，保存到 cache_dir 下，之后直接加载（需要 optimum[onnxruntime]）。
+
+    Args:
+        model_name: Embedding 模型名称
+        quant_config: 目标指令集，"avx512_vnni" | "avx512" | "avx2" | "arm64"
+        cache_dir: 量化模型保存目录
+    """
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    local_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+    file_name = f"onnx/model_qint8_{quant_config}.onnx"
+    if not os.path.exists(os.path.join(local_dir, file_name)):
+        print(f"⚙️ 首次使用，导出 int8 量化模型: {model_name} ({quant_config})")
+        model = SentenceTransformer(model_name, backend="onnx")
+        model.save(local_dir)
+        export_dynamic_quantized_onnx_model(model, quant_config, local_dir)
+    return SentenceTransformer(local_dir, backend="onnx", model_kwargs={"file_name": file_name})
+
+
+def _load_embedder(model_name: str, backend: str, quant_config: str, cache_dir: str) -> SentenceTransformer:
+    if backend == "onnx":
+        # 导出为 ONNX 并用 ONNX Runtime 推理（需要 optimum[onnxruntime]）
+        return SentenceTransformer(model_name, backend="onnx")
+    if backend == "onnx-int8":
+        return load_int8_onnx_embedder(model_name, quant_config, cache_dir)
+    embedder = SentenceTransformer(model_name)
+    if backend == "compile":
+        # 编译底层 transformer；dynamic=True 避免不同序列长度反复重编译
+        import torch
+        embedder[0].auto_model = torch.compile(embedder[0].auto_model, dynamic=True)
+    return embedder
+
+
+def get_embedder(model_name: str, backend: str = "torch", quant_config: str = "avx512_vnni",
+                 cache_dir: str = "./data/models") -> SentenceTransformer:
+    """
+    获取（首次调用时加载）Embedding 模型，双重检查加锁保证并发下只加载一份
+
+    Args:
+        model_name: Embedding 模型名称
+        backend: 推理后端，"torch" | "onnx" | "compile" | "onnx-int8"
+        quant_config: onnx-int8 后端的量化目标指令集
+        cache_dir: onnx-int8 后端量化模型的保存目录
+    """
+    key = (model_name, backend, quant_config, cache_dir)
+    embedder = _embedders.get(key)
+    if embedder is None:
+        with _lock:
+            embedder = _embedders.get(key)
+            if embedder is None:
+                embedder = _embedders[key] = _load_embedder(*key)
+    return embedder
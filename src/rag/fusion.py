@@ -0,0 +1,87 @@
+"""
+Multi-Query 检索结果融合
+
+多个扩展查询各自召回的结果合并后，按分数直接取 top N 往往是同一段内容的
+几个相邻 chunk。这里用 MMR（最大边际相关）做多样性选择：
+    每一步选择 lam * 相关度 - (1 - lam) * 与已选结果的最大相似度 最大的候选
+
+- 相似度矩阵由 numpy 一次矩阵乘法得到（BLAS）
+- 贪心选择循环用 numba 编译（cache=True，编译结果落盘，只在首次运行付出编译开销）；
+  numba 为可选依赖，未安装时以纯 Python 执行，候选数量很小，同样可用
+
+使用方式：
+    contexts = mmr_rerank(contexts, k=5)
+"""
+from typing import Dict, List
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """numba 不可用时的占位装饰器：原样返回函数"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True)
+def mmr_select(sims: np.ndarray, scores: np.ndarray, k: int, lam: float) -> np.ndarray:
+    """
+    MMR 贪心选择
+
+    Args:
+        sims: (N, N) 候选之间的余弦相似度
+        scores: (N,) 候选与查询的相关度（已归一化到 0~1）
+        k: 选择数量
+        lam: 相关度权重，越大越偏向相关度，越小越偏向多样性
+
+    Returns:
+        按选择顺序排列的候选下标
+    """
+    n = scores.shape[0]
+    k = min(k, n)
+    selected = np.empty(k, dtype=np.int64)
+    used = np.zeros(n, dtype=np.bool_)
+    # 每个候选与已选集合的最大相似度（尚未选择时不惩罚）
+    max_sim = np.zeros(n, dtype=np.float64)
+
+    for step in range(k):
+        best = -1
+        best_val = -np.inf
+        for i in range(n):
+            if used[i]:
+                continue
+            val = lam * scores[i] - (1.0 - lam) * max_sim[i]
+            if val > best_val:
+                best_val = val
+                best = i
+        selected[step] = best
+        used[best] = True
+        for i in range(n):
+            if sims[i, best] > max_sim[i]:
+                max_sim[i] = sims[i, best]
+    return selected
+
+
+def mmr_rerank(contexts: List[Dict], k: int = 5, lam: float = 0.7) -> List[Dict]:
+    """
+    对合并后的检索结果做 MMR 多样性选择
+
+    Args:
+        contexts: 检索结果（需含 content、score）
+        k: 保留数量
+        lam: 相关度权重
+    """
+    from src.rag.semantic_cache import embed_query
+
+    embeddings = embed_query([ctx.get("content", "") for ctx in contexts])
+    sims = (embeddings @ embeddings.T).astype(np.float64)
+
+    # Rerank 分数是 logits，与余弦相似度量纲不同，先 min-max 归一化
+    scores = np.array([float(ctx.get("score", 0)) for ctx in contexts], dtype=np.float64)
+    span = scores.max() - scores.min()
+    scores = (scores - scores.min()) / span if span > 0 else np.ones_like(scores)
+
+    return [contexts[i] for i in mmr_select(sims, scores, k, lam)]
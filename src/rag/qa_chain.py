@@ -1,9 +1,56 @@
 """问答链"""
-from openai import OpenAI
-from typing import List, Dict
+import hashlib
+import re
+
+from openai import AsyncOpenAI, OpenAI
+from typing import AsyncIterator, List, Dict
 
 import config
 
+# 固定指令放在最前面、用户问题放在最后：每次请求的 prompt 前缀逐字节相同，
+# 服务端可以复用前缀缓存（KV cache），省去这部分的 prefill
+SYSTEM_INSTRUCTION = "你是一个知识库问答助手,一切答案根据参考文档回答，不要捏造，不知道的直接说不知道"
+
+RULES_SECTION = """
+                ## 规则
+                1. 只能基于参考文档回答，不要编造
+                2. 回答时请标注引用来源，如"根据[1]，..."
+                3. 如果文档中没有相关信息，请说"根据现有资料无法回答"
+                """
+
+# 参考文档总字符数上限：上下文长度直接决定 prefill 耗时，超出部分丢弃排名靠后的文档
+CONTEXT_CHAR_BUDGET = 6000
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def select_contexts(contexts: List[Dict], budget: int = CONTEXT_CHAR_BUDGET) -> List[Dict]:
+    """
+    按顺序（检索结果已按相关度排序）挑选送入大模型的参考文档
+
+    - 只有空白字符不同的重复文档（向量 / 关键词两路召回的同一段）只保留第一条
+    - 总字符数超过 budget 时截断，排名靠后的文档被丢弃
+    """
+    limit = budget
+    seen = set()
+    selected = []
+    truncated = False
+    for doc in contexts:
+        key = hashlib.blake2b(_WHITESPACE_RE.sub(" ", doc["content"]).strip().encode(), digest_size=8).digest()
+        if key in seen:
+            continue
+        if budget <= 0:
+            truncated = True
+            break
+        seen.add(key)
+        take = doc["content"][:budget]
+        truncated = truncated or len(take) < len(doc["content"])
+        budget -= len(take)
+        selected.append({**doc, "content": take})
+    if truncated:
+        print(f"✂️ 参考文档超出 {limit} 字符预算，已截断（保留 {len(selected)}/{len(contexts)} 条）")
+    return selected
+
 
 class QAChain:
     """
@@ -11,72 +58,76 @@ class QAChain:
 
     功能：
     1. 构造带引用的 Prompt
-    2. 调用大模型生成答案
+    2. 调用大模型生成答案（answer 一次性返回，answer_stream 异步逐段返回）
     3. 返回答案 + 引用来源
     """
 
     def __init__(self, api_key: str, base_url: str, model: str):
         self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.aclient = AsyncOpenAI(api_key=api_key, base_url=base_url)
         self.model = model
 
     def _build_prompt(self, query: str, contexts: List[Dict]) -> str:
-        # 1. 设定系统角色和指令
-        system_instruction = "你是一个知识库问答助手。\n\n"
-
-        # 2. 构造参考文档部分
-        context_section = "## 参考文档\n"
-        for i, doc in enumerate(contexts):
-            # 格式：[1] 文档内容...
-            context_section += f"[{i + 1}] {doc['content']}\n"
-
-        # 3. 构造规则部分
-        rules_section = """
-                ## 规则
-                1. 只能基于参考文档回答，不要编造
-                2. 回答时请标注引用来源，如"根据[1]，..."
-                3. 如果文档中没有相关信息，请说"根据现有资料无法回答"
-                """
-
-        # 4. 构造用户问题部分
-        query_section = f"\n## 用户问题\n{query}\n"
-
-        # 5. 组合所有部分
-        final_prompt = context_section + rules_section + query_section
-
-        # 返回 final_prompt
-        return final_prompt
+        # 1. 构造参考文档部分（先收集片段，最后一次 join，避免循环中 += 反复复制字符串）
+        parts = [RULES_SECTION, "## 参考文档\n"]
+        # 格式：[1] 文档内容...
+        parts.extend(f"[{i + 1}] {doc['content']}\n" for i, doc in enumerate(contexts))
+
+        # 2. 构造用户问题部分：固定的规则在前，随请求变化的文档和问题在后
+        parts.append(f"\n## 用户问题\n{query}\n")
+
+        # 3. 组合所有部分
+        return "".join(parts)
+
+    def _build_messages(self, query: str, contexts: List[Dict]) -> List[Dict]:
+        """准备 API 调用的消息格式：固定的系统指令 + 整个 Prompt 作为用户输入"""
+        return [
+            {"role": "system", "content": SYSTEM_INSTRUCTION},
+            {"role": "user", "content": self._build_prompt(query, contexts)}
+        ]
 
     def answer(self, query: str, contexts: List[Dict]) -> Dict:
         """
         生成答案
         """
-        # 1. 构造完整的 Prompt
-        full_prompt = self._build_prompt(query, contexts)
-
-        # 2. 准备 API 调用的消息格式
-        messages = [
-            # 这里的角色通常是 'user'，将整个 Prompt 作为用户输入
-            # 也可以考虑将 system_instruction 拆分到 role='system' 中，但一个 Prompt 也可以
-            {"role":"system","content":"你是一个知识库问答助手,一切答案根据参考文档回答，不要捏造，不知道的直接说不知道"},
-            {"role": "user", "content": full_prompt}
-        ]
+        # 去重并控制上下文长度；返回的 sources 与 prompt 中的编号一一对应
+        contexts = select_contexts(contexts)
 
-        # 3. 调用大模型 API
+        # 1. 调用大模型 API
         response = self.client.chat.completions.create(
             model=self.model,
-            messages=messages,
+            messages=self._build_messages(query, contexts),
             temperature=0.0  # RAG 倾向于低温度，以保证事实准确性
         )
 
-        # 4. 提取答案文本
+        # 2. 提取答案文本
         answer_text = response.choices[0].message.content
 
-        # 5. 返回结果，包含答案和原始的 contexts (作为 sources)
+        # 3. 返回结果，包含答案和原始的 contexts (作为 sources)
         return {
             "answer": answer_text,
             "sources": contexts
         }
 
+    async def answer_stream(self, query: str, contexts: List[Dict]) -> AsyncIterator[str]:
+        """
+        流式生成答案：逐段返回模型输出，调用方可以边接收边展示
+
+        用法：
+            async for delta in chain.answer_stream(query, contexts):
+                print(delta, end="")
+        """
+        contexts = select_contexts(contexts)
+        stream = await self.aclient.chat.completions.create(
+            model=self.model,
+            messages=self._build_messages(query, contexts),
+            temperature=0.0,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
 
 # ============ 测试 ============
 if __name__ == "__main__":
@@ -1,46 +1,127 @@
 """RAG 管理器 - 统一对外接口"""
+import atexit
 import os
 import hashlib
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import List, Dict, Set
+
+import numpy as np
+
 from src.rag.document_loader import DocumentLoader
+from src.rag.fusion import mmr_select
 from src.rag.vector_store import VectorStore
 from src.rag.retriever import HybridRetriever
 from src.rag.config import RAGConfig
+from src.rag.semantic_cache import embed_query, get_retrieval_cache
+from src.utils.paths import source_basename
+
+
+# 目录导入：文件数达到该值时多进程解析；累计到该数量的 chunk 就先编码写入一批
+_PARALLEL_FILES = 4
+_ADD_FLUSH_CHUNKS = 256
+
+
+def _parse_and_split(file_path: str, chunk_size: int, overlap: int) -> List[dict]:
+    """在子进程中加载并切分单个文档（子进程内不再为大 PDF 另开进程池）"""
+    return DocumentLoader(parallel_pdf=False).load_and_split(file_path, chunk_size=chunk_size, overlap=overlap)
 
 
 class RAGManager:
     _instance = None  # 单例模式
+    _instance_lock = threading.Lock()
 
     def __init__(self):
         self.loader = DocumentLoader()
         # 使用持久化模式，文档导入后重启不会丢失
         self.vector_store = VectorStore(
             embedding_model=RAGConfig.EMBEDDING_MODEL,
-            persist_dir=RAGConfig.VECTOR_DB_DIR  # 启用持久化
+            persist_dir=RAGConfig.VECTOR_DB_DIR,  # 启用持久化
+            backend=RAGConfig.EMBED_BACKEND,
+            quant_config=RAGConfig.EMBED_QUANT_CONFIG,
+            model_cache_dir=RAGConfig.QUANTIZED_MODEL_DIR
         )
         self.retriever = HybridRetriever(
             vector_store=self.vector_store,
-            rerank_model=RAGConfig.RERANK_MODEL
+            rerank_model=RAGConfig.RERANK_MODEL,
+            backend=RAGConfig.EMBED_BACKEND,
+            user_dict=RAGConfig.JIEBA_USER_DICT
         )
 
+        # 文件哈希缓存：绝对路径 -> [大小, 修改时间, 哈希]，文件未改动时不必重新读取整个文件
+        self._hash_cache: Dict[str, list] = {}
+        self._hash_cache_path = os.path.join(RAGConfig.VECTOR_DB_DIR, "hash_cache.json")
+        if os.path.exists(self._hash_cache_path):
+            try:
+                with open(self._hash_cache_path, encoding="utf-8") as f:
+                    self._hash_cache = json.load(f)
+            except Exception as e:
+                print(f"⚠️ 文件哈希缓存加载失败: {e}")
+        atexit.register(self._save_hash_cache)
+
+    def _save_hash_cache(self):
+        try:
+            with open(self._hash_cache_path, "w", encoding="utf-8") as f:
+                json.dump(self._hash_cache, f, ensure_ascii=False)
+        except Exception as e:
+            print(f"⚠️ 文件哈希缓存保存失败: {e}")
+
     @classmethod
     def get_instance(cls):
+        # 双重检查加锁：并发的首个请求（流式回答 + 后台推测扩展）不会各自加载一份 Embedding 模型
         if cls._instance is None:
-            cls._instance = cls()
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
         return cls._instance
 
+    @property
+    def embedder(self):
+        """知识库的 Embedding 模型（语义缓存、MMR 等共用这一份，进程内只加载一次）"""
+        return self.vector_store.embedder
+
+    def warmup(self):
+        """
+        预热 Embedding / Rerank 模型和检索索引
+
+        模型都是延迟加载的，首次推理会触发权重加载、算子初始化等一次性开销，
+        服务启动时先跑一次假数据，避免第一个真实请求承担冷启动延迟
+        """
+        self.embedder.encode(["warmup"])
+        # jieba 词典在第一次分词时才加载（约 1 秒），也放到启动阶段
+        self.retriever.warmup_tokenizer()
+        # numba 内核（BM25 打分、MMR 选择）同样在首次调用时才编译 / 载入
+        self.retriever.warmup_kernels()
+        mmr_select(np.eye(1), np.ones(1), 1, 0.5)
+        if self.vector_store.count() > 0:
+            # 知识库非空时完整跑一次检索：同时载入 HNSW 索引、构建关键词倒排索引、预热 Rerank 模型
+            self.retriever.retrieve("warmup")
+        elif self.retriever.reranker is not None:
+            self.retriever.reranker.predict([("warmup", "warmup")])
+
     def _compute_file_hash(self, file_path: str) -> str:
         """
         计算文件的 MD5 哈希值
 
-        用于判断文件内容是否已经导入过（即使文件名相同，内容变了也会重新导入）
+        用于判断文件内容是否已经导入过（即使文件名相同，内容变了也会重新导入）。
+        文件大小和修改时间都没变时直接返回缓存的哈希。
+        （保持 MD5：已入库文档的 metadata 中存的是 MD5，换算法会导致全部重新导入）
         """
+        path = os.path.abspath(file_path)
+        st = os.stat(path)
+        cached = self._hash_cache.get(path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+
         hash_md5 = hashlib.md5()
-        with open(file_path, "rb") as f:
-            # 分块读取，避免大文件内存溢出
-            for chunk in iter(lambda: f.read(4096), b""):
+        with open(path, "rb") as f:
+            # 分块读取（1 MiB），避免大文件内存溢出
+            for chunk in iter(lambda: f.read(1 << 20), b""):
                 hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+        digest = hash_md5.hexdigest()
+        self._hash_cache[path] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
 
     def _get_indexed_sources(self) -> Set[str]:
         """
@@ -50,28 +131,34 @@ class RAGManager:
         返回格式: {"filename1.md:hash1", "filename2.pdf:hash2", ...}
         """
         indexed = set()
-        all_docs = self.vector_store.get_all_documents()
-        for doc in all_docs:
-            source = doc.get("metadata", {}).get("source", "")
-            file_hash = doc.get("metadata", {}).get("file_hash", "")
+        # 只需要 metadata，不读取文档内容
+        for metadata in self.vector_store.get_all_metadatas():
+            metadata = metadata or {}
+            source = metadata.get("source", "")
+            file_hash = metadata.get("file_hash", "")
             if source:
                 # 用 "文件名:哈希" 作为唯一标识
                 filename = os.path.basename(source)
                 indexed.add(f"{filename}:{file_hash}")
         return indexed
 
-    def is_document_indexed(self, file_path: str) -> bool:
+    def is_document_indexed(self, file_path: str, indexed_sources: Set[str] = None) -> bool:
         """
         检查文档是否已经被索引
 
         判断逻辑：文件名 + 文件内容哈希 都匹配才算已索引
         这样即使文件名相同但内容变了，也会重新导入
+
+        Args:
+            file_path: 文档路径
+            indexed_sources: 已索引来源集合，批量检查时传入以避免每个文件都读一遍向量库
         """
         filename = os.path.basename(file_path)
         file_hash = self._compute_file_hash(file_path)
         identifier = f"{filename}:{file_hash}"
 
-        indexed_sources = self._get_indexed_sources()
+        if indexed_sources is None:
+            indexed_sources = self._get_indexed_sources()
         return identifier in indexed_sources
 
     def add_document(self, file_path: str, force: bool = False) -> int:
@@ -92,30 +179,37 @@ class RAGManager:
             print(f"⏭️  跳过（已存在）: {filename}")
             return 0
 
-        # 计算文件哈希，用于后续去重判断
-        file_hash = self._compute_file_hash(file_path)
+        documents, metadatas = self._load_chunks(file_path)
+        return self.vector_store.add_documents(documents, metadatas)
 
-        # 加载并切分文档
+    def _load_chunks(self, file_path: str):
+        """加载并切分文档，返回 (chunk 内容列表, metadata 列表)"""
         chunks = self.loader.load_and_split(
             file_path,
             chunk_size=RAGConfig.CHUNK_SIZE,
             overlap=RAGConfig.CHUNK_OVERLAP
         )
+        return self._with_file_hash(chunks, self._compute_file_hash(file_path))
 
+    @staticmethod
+    def _with_file_hash(chunks: List[dict], file_hash: str):
+        """拆成 (chunk 内容列表, metadata 列表)，并在 metadata 中添加 file_hash，用于去重"""
         documents = [chunk["content"] for chunk in chunks]
-        # 在 metadata 中添加 file_hash，用于去重
         metadatas = []
         for chunk in chunks:
             meta = chunk["metadata"].copy()
             meta["file_hash"] = file_hash  # 添加哈希值
             metadatas.append(meta)
-
-        return self.vector_store.add_documents(documents, metadatas)
+        return documents, metadatas
 
     def add_documents_from_dir(self, dir_path: str, force: bool = False) -> int:
         """
         批量添加目录下的文档
 
+        文件较多时用多进程解析（PDF 提取是 CPU 密集型，且 PyMuPDF 不释放 GIL），
+        解析完成的 chunk 累计到一定数量就交给 Embedding 模型编码写入，
+        编码与其余文件的解析同时进行；文件较少时直接串行处理。
+
         Args:
             dir_path: 文档目录路径
             force: 是否强制重新导入所有文档
@@ -123,8 +217,6 @@ class RAGManager:
         Returns:
             新导入的 chunk 总数
         """
-        total_added = 0
-        skipped = 0
         supported_extensions = ('.pdf', '.txt', '.md')
 
         files = [f for f in os.listdir(dir_path) if f.endswith(supported_extensions)]
@@ -134,18 +226,58 @@ class RAGManager:
             return 0
 
         print(f"📂 扫描到 {len(files)} 个文档")
+        indexed_sources = set() if force else self._get_indexed_sources()
 
+        # 去重检查在主进程完成（文件哈希有缓存），只把需要导入的文件交给解析
+        pending = {}  # 路径 -> 文件哈希
+        skipped = 0
         for filename in files:
             file_path = os.path.join(dir_path, filename)
-            try:
-                count = self.add_document(file_path, force=force)
-                if count > 0:
-                    total_added += count
-                    print(f"✅ 已添加: {filename} ({count} chunks)")
-                else:
-                    skipped += 1
-            except Exception as e:
-                print(f"❌ 添加失败: {filename} - {e}")
+            if not force and self.is_document_indexed(file_path, indexed_sources):
+                print(f"⏭️  跳过（已存在）: {filename}")
+                skipped += 1
+                continue
+            pending[file_path] = self._compute_file_hash(file_path)
+
+        # 先攒一批 chunk 再编码写入：Embedding 模型看到的是较大的批次，而不是每个文件各编码一次
+        buffer_documents, buffer_metadatas = [], []
+        total_added = 0
+
+        def collect(file_path: str, chunks: List[dict]):
+            nonlocal buffer_documents, buffer_metadatas, total_added
+            documents, metadatas = self._with_file_hash(chunks, pending[file_path])
+            buffer_documents.extend(documents)
+            buffer_metadatas.extend(metadatas)
+            print(f"✅ 已切分: {os.path.basename(file_path)} ({len(documents)} chunks)")
+            if len(buffer_documents) >= _ADD_FLUSH_CHUNKS:
+                total_added += self.vector_store.add_documents(buffer_documents, buffer_metadatas)
+                buffer_documents, buffer_metadatas = [], []
+
+        workers = min(len(pending), os.cpu_count() or 1)
+        if len(pending) < _PARALLEL_FILES or workers == 1:
+            for file_path in pending:
+                try:
+                    collect(file_path, self.loader.load_and_split(
+                        file_path, chunk_size=RAGConfig.CHUNK_SIZE, overlap=RAGConfig.CHUNK_OVERLAP
+                    ))
+                except Exception as e:
+                    print(f"❌ 添加失败: {os.path.basename(file_path)} - {e}")
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                futures = {
+                    ex.submit(_parse_and_split, file_path, RAGConfig.CHUNK_SIZE, RAGConfig.CHUNK_OVERLAP): file_path
+                    for file_path in pending
+                }
+                # 按完成顺序处理：先解析完的文件先编码，不被大文件阻塞
+                for future in as_completed(futures):
+                    file_path = futures[future]
+                    try:
+                        collect(file_path, future.result())
+                    except Exception as e:
+                        print(f"❌ 添加失败: {os.path.basename(file_path)} - {e}")
+
+        if buffer_documents:
+            total_added += self.vector_store.add_documents(buffer_documents, buffer_metadatas)
 
         # 打印统计信息
         print(f"\n📊 导入统计: 新增 {total_added} chunks, 跳过 {skipped} 个已存在文档")
@@ -153,39 +285,89 @@ class RAGManager:
 
     def query(self, question: str, top_n: int = 5) -> Dict:
         """检索并返回相关文档"""
+        return self.query_batch([question], top_n)[0]
+
+    def query_batch(self, questions: List[str], top_n: int = 5) -> List[Dict]:
+        """
+        批量检索（Multi-Query 的多个子查询一次完成）
+
+        启用语义缓存时，每个问题先按查询向量查找之前的检索结果（相同 / 近似问题直接复用），
+        只有未命中的问题才走 向量检索 + 关键词检索 + Rerank
+
+        Returns:
+            与 questions 一一对应的结果，格式同 query()
+        """
         # 检查知识库是否为空
         if self.vector_store.count() == 0:
-            return {
-                "contexts": [],
-                "formatted": "## 本地知识库检索结果\n\n暂无文档，请先添加文档到知识库。"
-            }
+            return [
+                {
+                    "contexts": [],
+                    "formatted": "## 本地知识库检索结果\n\n暂无文档，请先添加文档到知识库。"
+                }
+                for _ in questions
+            ]
+
+        if not RAGConfig.USE_SEMANTIC_CACHE:
+            return self._retrieve_batch(questions, top_n)
+
+        cache = get_retrieval_cache()
+        namespace = self._retrieval_namespace(top_n)
+        embeddings = embed_query(questions)
+        results = [cache.lookup(namespace, embedding) for embedding in embeddings]
+
+        misses = [i for i, result in enumerate(results) if result is None]
+        if len(misses) < len(questions):
+            print(f"  ⚡ 检索缓存命中: {len(questions) - len(misses)}/{len(questions)}")
+        if misses:
+            fresh = self._retrieve_batch([questions[i] for i in misses], top_n)
+            for i, result in zip(misses, fresh):
+                results[i] = result
+                cache.store(namespace, embeddings[i], result)
+        return results
+
+    def _retrieval_namespace(self, top_n: int) -> str:
+        """检索缓存的命名空间：模型、返回数量或知识库内容变化（导入/清空文档）后，之前的结果自动失效"""
+        config = {
+            "top_n": top_n,
+            "embedding_model": RAGConfig.EMBEDDING_MODEL,
+            "rerank_model": RAGConfig.RERANK_MODEL,
+            "kb_fingerprint": self.vector_store.fingerprint,
+        }
+        text = json.dumps(config, sort_keys=True, separators=(",", ":"))
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
 
-        contexts = self.retriever.retrieve(
-            question,
+    def _retrieve_batch(self, questions: List[str], top_n: int) -> List[Dict]:
+        batch_contexts = self.retriever.retrieve_batch(
+            questions,
             top_k=RAGConfig.VECTOR_SEARCH_TOP_K,
             top_n=top_n,
             vector_weight=RAGConfig.VECTOR_WEIGHT
         )
-        return {
-            "contexts": contexts,
-            "formatted": self._format_contexts(contexts)
-        }
+        return [
+            {
+                # 分数转为 Python float：结果会写入 JSON 缓存
+                "contexts": [{**ctx, "score": float(ctx.get("score", 0))} for ctx in contexts],
+                "formatted": self._format_contexts(contexts)
+            }
+            for contexts in batch_contexts
+        ]
 
     def _format_contexts(self, contexts: List[Dict]) -> str:
         """格式化检索结果，用于 Prompt"""
         if not contexts:
             return "## 本地知识库检索结果\n\n未找到相关内容。"
 
-        result = "## 本地知识库检索结果\n\n"
+        parts = ["## 本地知识库检索结果\n\n"]
         for i, ctx in enumerate(contexts, 1):
             source = ctx.get('metadata', {}).get('source', '未知来源')
             # 只显示文件名，不显示完整路径
             if source and source != '未知来源':
-                source = os.path.basename(source)
-            score = ctx.get('score', 0)
-            result += f"[{i}] 来源: {source} (相关度: {score:.2f})\n"
-            result += f"内容: {ctx['content']}\n\n"
-        return result
+                source = source_basename(source)
+            parts.append(
+                f"[{i}] 来源: {source} (相关度: {ctx.get('score', 0):.2f})\n"
+                f"内容: {ctx['content']}\n\n"
+            )
+        return "".join(parts)
 
     def clear(self):
         """清空知识库"""
@@ -202,10 +384,10 @@ class RAGManager:
         Returns:
             文档名列表（去重后）
         """
-        all_docs = self.vector_store.get_all_documents()
         sources = set()
-        for doc in all_docs:
-            source = doc.get("metadata", {}).get("source", "")
+        # 只需要 metadata 中的 source，不读取文档内容
+        for metadata in self.vector_store.get_all_metadatas():
+            source = (metadata or {}).get("source", "")
             if source:
                 sources.add(os.path.basename(source))
         return sorted(list(sources))
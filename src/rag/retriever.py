@@ -1,7 +1,11 @@
 """检索器：Hybrid Search + Rerank"""
-import jieba
+import atexit
+import os
+import pickle
+import threading
+
 import numpy as np
-from collections import Counter
+from collections import Counter, OrderedDict
 
 from numpy import argsort
 from sentence_transformers import CrossEncoder
@@ -11,6 +15,58 @@ from typing import List, Dict
 # 假设 VectorStore 已实现
 from src.rag.vector_store import VectorStore
 
+# jieba_fast 是 jieba 的 C 实现（接口相同），安装了就优先使用
+try:
+    import jieba_fast as jieba
+except ImportError:
+    import jieba
+
+
+def _tokenize(text: str) -> List[str]:
+    """关键词检索分词：关闭 HMM 新词发现（BM25 只需要粗粒度的词匹配，Viterbi 是分词中最慢的一步）"""
+    return list(jieba.cut(text, cut_all=False, HMM=False))
+
+try:
+    from numba import njit
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+
+def _bm25_scores_numpy(indptr, indices, tfs, doc_len, avgdl, term_ids, k1, b):
+    """
+    BM25 打分：倒排索引按词存储为 CSR（indptr 为每个词在 indices / tfs 中的起止位置），
+    逐个查询词把得分向量化地累加到包含它的文档上
+    """
+    n = doc_len.shape[0]
+    scores = np.zeros(n, dtype=np.float32)
+    for t in term_ids:
+        ids, tf = indices[indptr[t]:indptr[t + 1]], tfs[indptr[t]:indptr[t + 1]]
+        df = len(ids)
+        idf = np.log((n - df + 0.5) / (df + 0.5) + 1)
+        scores[ids] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len[ids] / avgdl))
+    return scores
+
+
+if _HAS_NUMBA:
+    @njit(cache=True, fastmath=True)
+    def _bm25_scores(indptr, indices, tfs, doc_len, avgdl, term_ids, k1, b):
+        """同 _bm25_scores_numpy，编译为机器码的逐 posting 循环（cache=True，编译结果落盘）"""
+        n = doc_len.shape[0]
+        scores = np.zeros(n, dtype=np.float32)
+        for t in term_ids:
+            start, stop = indptr[t], indptr[t + 1]
+            df = stop - start
+            idf = np.log((n - df + 0.5) / (df + 0.5) + 1.0)
+            for j in range(start, stop):
+                d = indices[j]
+                tf = tfs[j]
+                scores[d] += idf * tf * (k1 + 1.0) / (tf + k1 * (1.0 - b + b * doc_len[d] / avgdl))
+        return scores
+else:
+    # numba 为可选依赖，未安装时使用 numpy 向量化版本
+    _bm25_scores = _bm25_scores_numpy
+
 
 class HybridRetriever:
     """
@@ -23,55 +79,192 @@ class HybridRetriever:
     4. Rerank 精排
     """
 
-    def __init__(self, vector_store: VectorStore, rerank_model: str = None):
+    # BM25 参数：词频饱和度、文档长度归一化强度
+    BM25_K1 = 1.5
+    BM25_B = 0.75
+    # Rerank 分数缓存的最大条目数
+    RERANK_CACHE_SIZE = 4096
+
+    def __init__(self, vector_store: VectorStore, rerank_model: str = None, backend: str = "torch",
+                 user_dict: str = None):
         """
         参数：
             vector_store: 向量数据库实例
             rerank_model: Rerank 模型名称，None 则不使用 Rerank
+            backend: 推理后端，"torch" | "onnx" | "compile" | "onnx-int8"（Rerank 不量化，按 onnx 处理）
+            user_dict: jieba 自定义词典路径（领域术语不被切碎，提高关键词召回），None 则不加载
         """
+        if user_dict and os.path.exists(user_dict):
+            jieba.load_userdict(user_dict)
+        # 分词方式标识：分词器 / 参数 / 词典变化后，磁盘上的分词缓存作废
+        self._tokenizer_id = f"{jieba.__name__}:HMM=False:{user_dict or ''}"
+
         self.vector_store = vector_store
-        self.reranker = CrossEncoder(rerank_model) if rerank_model else None
+        # Rerank 模型延迟到第一次精排时加载
+        self._rerank_model = rerank_model
+        self._backend = backend
+        self._reranker = None
+        self._reranker_lock = threading.Lock()
+
+        # Rerank 分数缓存：(查询, 文档内容) -> 分数，反思循环 / 重复问题中相同的组合不再重复推理
+        self._rerank_cache: "OrderedDict[tuple, float]" = OrderedDict()
+        self._rerank_cache_lock = threading.Lock()
 
         # 关键词检索需要的数据（从 vector_store 同步）
+        self._synced_version = -1  # 已同步的向量库写入版本
+        self.doc_ids = []  # 文档 id（与下面两个列表一一对应）
         self.documents = []  # 原始文档
         self.tokenized_docs = []  # 分词后的文档
+        # BM25 倒排索引：词 -> 词 id，按词 id 存储的 CSR（起止位置、文档下标、词频），以及每个文档的长度
+        self._vocab: Dict[str, int] = {}
+        self._postings = (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32))
+        self._doc_len = np.zeros(0, dtype=np.float32)
+        self._avgdl = 0.0
+
+        # 文档 id -> 分词结果：文档内容不可变（新内容总是新 id），只需对新增文档分词。
+        # 持久化模式下缓存写入向量库目录，重启后不必重新分词整个知识库
+        self._token_cache: Dict[str, List[str]] = {}
+        self._token_cache_path = (
+            os.path.join(vector_store.persist_dir, "jieba_cache.pkl") if vector_store.persist_dir else None
+        )
+        if self._token_cache_path:
+            self._load_token_cache()
+            atexit.register(self._save_token_cache)
+
+    @property
+    def reranker(self):
+        """Rerank 模型（未配置时为 None；首次访问时加载，并发下只加载一份）"""
+        if self._reranker is None and self._rerank_model:
+            with self._reranker_lock:
+                if self._reranker is None:
+                    self._reranker = self._load_reranker()
+        return self._reranker
+
+    def _load_reranker(self) -> CrossEncoder:
+        if self._backend in ("onnx", "onnx-int8"):
+            return CrossEncoder(self._rerank_model, backend="onnx")
+        reranker = CrossEncoder(self._rerank_model)
+        import torch
+        if torch.cuda.is_available():
+            # GPU 上用 FP16 推理：显存带宽减半，精排分数几乎不变
+            reranker.model.half()
+        if self._backend == "compile":
+            reranker.model = torch.compile(reranker.model, dynamic=True)
+        return reranker
+
+    @staticmethod
+    def warmup_tokenizer():
+        """提前加载分词词典，避免第一次关键词检索承担加载开销"""
+        jieba.initialize()
+
+    @staticmethod
+    def warmup_kernels():
+        """
+        用与真实索引相同的参数类型调用一次 BM25 内核
+
+        numba 在第一次调用时才编译（或从 cache=True 的磁盘缓存载入）对应类型的机器码，
+        放到启动阶段，第一次关键词检索不再承担这部分延迟；未安装 numba 时几乎无开销
+        """
+        indptr = np.zeros(2, dtype=np.int64)
+        indices = np.zeros(0, dtype=np.int32)
+        tfs = np.zeros(0, dtype=np.float32)
+        doc_len = np.ones(1, dtype=np.float32)
+        _bm25_scores(indptr, indices, tfs, doc_len, 1.0, np.zeros(1, dtype=np.int64),
+                     HybridRetriever.BM25_K1, HybridRetriever.BM25_B)
+
+    def _load_token_cache(self):
+        if not os.path.exists(self._token_cache_path):
+            return
+        try:
+            with open(self._token_cache_path, "rb") as f:
+                data = pickle.load(f)
+            if isinstance(data, dict) and data.get("tokenizer") == self._tokenizer_id:
+                self._token_cache = data["tokens"]
+        except Exception as e:
+            print(f"⚠️ 分词缓存加载失败，将重新分词: {e}")
+
+    def _save_token_cache(self):
+        try:
+            with open(self._token_cache_path, "wb") as f:
+                pickle.dump(
+                    {"tokenizer": self._tokenizer_id, "tokens": self._token_cache},
+                    f, protocol=pickle.HIGHEST_PROTOCOL
+                )
+        except Exception as e:
+            print(f"⚠️ 分词缓存保存失败: {e}")
 
     def _sync_documents(self):
         """
         从向量库同步文档用于关键词检索
 
-        提示：Chroma 可以用 collection.get() 获取所有文档
+        向量库写入版本没有变化时直接返回（稳定状态下每次检索不再访问 Chroma）；
+        有变化时只对新增文档分词，已删除文档的缓存随之清理
         """
-        all_data = self.vector_store.get_all_documents()
-        self.documents = [dic['content'] for dic in all_data]
-        self.tokenized_docs = []
-        for doc_text in self.documents:
-            tokens = list(jieba.cut(doc_text))
-            self.tokenized_docs.append(tokens)
+        # 先读版本再取文档：同步期间发生的写入会让版本再次变化，下次检索时重新同步
+        version = self.vector_store.version
+        if version == self._synced_version:
+            return
+
+        # 只取 id 和内容两列，不读取 metadata，也不逐条拼字典
+        raw = self.vector_store.get_all_raw(include=('documents',))
+        doc_ids, documents = raw['ids'], raw['documents']
+        cache = self._token_cache
+        # 重建缓存字典：只保留仍存在的文档，整体替换，多线程并发检索时不会读到修改到一半的状态
+        token_cache = {
+            doc_id: cache[doc_id] if doc_id in cache else _tokenize(content)
+            for doc_id, content in zip(doc_ids, documents)
+        }
+        tokenized_docs = [token_cache[doc_id] for doc_id in doc_ids]
+        vocab, postings, doc_len = self._build_index(tokenized_docs)
+
+        self._token_cache = token_cache
+        # 构建完成后再整体替换，多线程并发检索时不会读到构建到一半的列表
+        self.documents, self.tokenized_docs = documents, tokenized_docs
+        self._vocab, self._postings, self._doc_len, self._avgdl = vocab, postings, doc_len, float(doc_len.mean()) if len(doc_len) else 0.0
+        self.doc_ids = doc_ids
+        self._synced_version = version
+
+    @staticmethod
+    def _build_index(tokenized_docs: List[List[str]]):
+        """构建倒排索引：每个词对应出现过的文档下标和词频，拼接成 CSR 数组"""
+        index: Dict[str, tuple] = {}
+        for i, tokens in enumerate(tokenized_docs):
+            for term, tf in Counter(tokens).items():
+                ids, tfs = index.setdefault(term, ([], []))
+                ids.append(i)
+                tfs.append(tf)
+        vocab = {term: t for t, term in enumerate(index)}
+        indptr = np.zeros(len(index) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(ids) for ids, _ in index.values()])
+        indices = np.fromiter((i for ids, _ in index.values() for i in ids), dtype=np.int32, count=indptr[-1])
+        tfs = np.fromiter((tf for _, tfs in index.values() for tf in tfs), dtype=np.float32, count=indptr[-1])
+        doc_len = np.array([len(tokens) for tokens in tokenized_docs], dtype=np.float32)
+        return vocab, (indptr, indices, tfs), doc_len
 
     def _keyword_search(self, query: str, top_k: int) -> List[Dict]:
         """
-        关键词检索（简化版 BM25）
+        关键词检索（BM25）
+
+        按查询词遍历倒排索引，把每个词的得分累加到包含它的文档上（numba 编译 / numpy 向量化），
+        不再逐个文档、逐个词在 Python 中计算
 
         返回：[{"content": "...", "score": 0.8}, ...]
         """
-        # 1. 对查询进行分词，并去重
-        query_tokens = set(jieba.cut(query))
-        scores = []  # 记录query 在每一个文档的得分情况
-
-        # 2. 遍历所有文档计算得分
-        for i, doc_tokens in enumerate(self.tokenized_docs):
-            doc_counter = Counter(doc_tokens)  # 将每一个文档转换成一个词频字典
-            frequency = sum(doc_counter.get(t, 0) for t in query_tokens)
-            score = frequency / (len(doc_tokens) + 1)
-            scores.append(score)
-
-        # 3. 排序并取出 top_k
-        scores = np.array(scores)
-        if not self.documents:
+        documents, vocab, postings = self.documents, self._vocab, self._postings
+        if not documents:
             return []
 
-        top_indices = np.argsort(scores)[::-1][:top_k]
+        # 1. 对查询进行分词，去重后映射为词 id（分词是字符串处理，留在 Python 中）
+        term_ids = np.array(sorted({vocab[t] for t in _tokenize(query) if t in vocab}), dtype=np.int64)
+        n = len(documents)
+
+        # 2. 累加每个查询词的 BM25 得分，scores 记录 query 在每一个文档的得分情况
+        scores = _bm25_scores(*postings, self._doc_len, self._avgdl, term_ids, self.BM25_K1, self.BM25_B)
+
+        # 3. 取出 top_k：argpartition 先 O(N) 选出 top_k，再只对这 top_k 个排序
+        top_k = min(top_k, n)
+        top_indices = np.argpartition(-scores, top_k - 1)[:top_k]
+        top_indices = top_indices[np.argsort(-scores[top_indices])]
 
         # 4. 转换成目标格式 List[Dict]
         results = []
@@ -85,42 +278,34 @@ class HybridRetriever:
 
     def _merge_results(self, vector_results: List[Dict], keyword_results: List[Dict],
                        vector_weight: float = 0.7) -> List[Dict]:
-        #融合两路检索结果
+        #融合两路检索结果：每个不同的内容占一个下标，两路分数各自归一化后加权累加到同一个数组
+        contents = list(dict.fromkeys(
+            [r['content'] for r in vector_results] + [r['content'] for r in keyword_results]
+        ))
+        if not contents:
+            return []
+        index = {content: i for i, content in enumerate(contents)}
+        final_score = np.zeros(len(contents))
 
-        # max-min归一化
-        def normalize(results):
+        for results, weight in ((vector_results, vector_weight), (keyword_results, 1 - vector_weight)):
             if not results:
-                return {}
-            #拿到分数
-            scores = [r['score'] for r in results]
-            min_score = min(scores)
-            max_score = max(scores)
-
-            if min_score == max_score:
-                return {r['content'] : 1.0 for r in results}
-            return {r['content']: (r['score'] - min_score) / (max_score - min_score) for r in results}
-
-        vector_scores = normalize(vector_results)
-        keyword_scores = normalize(keyword_results)
-
-        #融合分数
-        all_content = set(vector_scores.keys()) | set(keyword_scores.keys())
-        final_score = {}
-
-        for content in all_content:
-            v_score = vector_scores.get(content,0)
-            k_score = keyword_scores.get(content,0)
-            final_score[content] = v_score * vector_weight + k_score * (1-vector_weight)
+                continue
+            # max-min归一化（分数全部相同时都记为 1）
+            scores = np.array([float(r['score']) for r in results])
+            span = scores.max() - scores.min()
+            normalized = (scores - scores.min()) / span if span > 0 else np.ones_like(scores)
+            part = np.zeros(len(contents))
+            part[[index[r['content']] for r in results]] = normalized
+            final_score += weight * part
 
         #排序
-        sorted_content = sorted(final_score.keys(),key = lambda x: final_score[x],reverse=True)
-
+        order = np.argsort(-final_score, kind="stable")
         return [
             {
-                "content": content,
-                "score": final_score[content]
+                "content": contents[i],
+                "score": float(final_score[i])
             }
-            for content in sorted_content
+            for i in order
         ]
 
     def _rerank(self, query: str, candidates: List[Dict], top_n: int) -> List[Dict]:
@@ -133,9 +318,61 @@ class HybridRetriever:
 
         # 2. 调用模型获取分数
         # scores 是一个 NumPy 数组
-        scores = self.reranker.predict(sentences_pairs)
-        # 3. 排序
-        sorted_indices = np.argsort(scores)[::-1][:top_n]
+        scores = self._predict(sentences_pairs)
+        return self._top_by_scores(candidates, scores, top_n)
+
+    def _predict(self, sentences_pairs: List[List[str]]) -> np.ndarray:
+        """Rerank 打分：缓存命中的组合直接取分数，其余一次批量推理"""
+        cache = self._rerank_cache
+        with self._rerank_cache_lock:
+            cached = [cache.get((q, d)) for q, d in sentences_pairs]
+            for (q, d), score in zip(sentences_pairs, cached):
+                if score is not None:
+                    cache.move_to_end((q, d))
+        missing = [i for i, score in enumerate(cached) if score is None]
+
+        if missing:
+            pairs = [sentences_pairs[i] for i in missing]
+            predicted = self.reranker.predict(
+                pairs, batch_size=min(64, len(pairs)), show_progress_bar=False, convert_to_numpy=True
+            )
+            with self._rerank_cache_lock:
+                for i, score in zip(missing, predicted):
+                    cached[i] = float(score)
+                    cache[tuple(sentences_pairs[i])] = cached[i]
+                while len(cache) > self.RERANK_CACHE_SIZE:
+                    cache.popitem(last=False)
+        return np.array(cached, dtype=np.float32)
+
+    def _rerank_batch(self, queries: List[str], candidate_lists: List[List[Dict]], top_n: int) -> List[List[Dict]]:
+        """多个查询的候选拼成一批，一次 predict 完成打分后再按查询拆分"""
+        if not self.reranker:
+            return [candidates[:top_n] for candidates in candidate_lists]
+
+        sentences_pairs = [
+            [query, candidate['content']]
+            for query, candidates in zip(queries, candidate_lists)
+            for candidate in candidates
+        ]
+        if not sentences_pairs:
+            return [[] for _ in queries]
+        scores = self._predict(sentences_pairs)
+
+        results, offset = [], 0
+        for candidates in candidate_lists:
+            results.append(self._top_by_scores(candidates, scores[offset:offset + len(candidates)], top_n))
+            offset += len(candidates)
+        return results
+
+    @staticmethod
+    def _top_by_scores(candidates: List[Dict], scores, top_n: int) -> List[Dict]:
+        # 3. 排序：argpartition 先 O(N) 选出 top_n，再只对这 top_n 个排序
+        scores = np.asarray(scores)
+        top_n = min(top_n, len(candidates))
+        if top_n <= 0:
+            return []
+        sorted_indices = np.argpartition(-scores, top_n - 1)[:top_n]
+        sorted_indices = sorted_indices[np.argsort(-scores[sorted_indices])]
 
         return [
             {
@@ -158,18 +395,30 @@ class HybridRetriever:
             vector_weight: 向量检索权重
             use_rerank: 是否使用 Rerank
         """
+        return self.retrieve_batch([query], top_k, top_n, vector_weight, use_rerank)[0]
+
+    def retrieve_batch(self, queries: List[str], top_k: int = 20, top_n: int = 5,
+                       vector_weight: float = 0.7, use_rerank: bool = True) -> List[List[Dict]]:
+        """
+        批量检索（Multi-Query）：文档只同步一次，向量检索和 Rerank 各只做一次批量推理
+
+        Returns:
+            与 queries 一一对应的检索结果列表
+        """
         # 0. 同步文档
         self._sync_documents()
-        # 1. 向量检索
-        vector_results = self.vector_store.search(query, top_k)
-        # 2. 关键词检索
-        keyword_results = self._keyword_search(query,top_k)
-        candidates = self._merge_results(vector_results,keyword_results,vector_weight)
+        # 1. 向量检索（批量编码 + 一次查询）
+        vector_results = self.vector_store.search_batch(queries, top_k)
+        # 2. 关键词检索 + 融合
+        candidate_lists = [
+            self._merge_results(vector, self._keyword_search(query, top_k), vector_weight)
+            for query, vector in zip(queries, vector_results)
+        ]
         # 3. Rerank（如果启用）
         #TODO: 返回值适配 LangChain Document 格式
         if use_rerank:
-           return self._rerank(query, candidates, top_n=top_n)
+            return self._rerank_batch(queries, candidate_lists, top_n=top_n)
         else:
-            return candidates[:top_n]
+            return [candidates[:top_n] for candidates in candidate_lists]
 
 
@@ -0,0 +1,275 @@
+"""
+检索结果语义缓存
+
+对话场景下大量问题只是换了种说法（"什么是 RAG" / "RAG 是什么"），
+每次都重新走一遍 向量检索 + 关键词检索 + Rerank + 网络搜索 非常浪费。
+语义缓存把查询向量化后与最近的查询做余弦相似度比较，
+相似度 >= 阈值时直接返回之前的检索结果。
+
+- 查询向量使用知识库的 Embedding 模型（归一化后点积即余弦相似度），通过 get_embedder 单独加载，
+  不依赖 RAGManager / Chroma
+- 条目量级很小（默认 2048），直接用 numpy 暴力计算相似度
+- 条目持久化到 {CHECKPOINT_DIR}/semantic_cache.db，重启后继续可用
+- Multi-Query 扩展结果使用同一文件中的 expansion_cache 表（get_expansion_cache）
+- 路由 / 反思判断结果使用 decision_cache 表（get_decision_cache），config_hash 作为命名空间
+- RAGManager.query 的单个查询检索结果使用 retrieval_cache 表（get_retrieval_cache）
+- config_hash 区分不同节点 / 搜索类型 / Multi-Query 开关 / 模型 / 知识库版本，
+  避免不同配置之间串用结果
+- 只差一个日期或数字的问题（"今天/明天天气"、"2024/2025 年奖项"）向量几乎相同，
+  查询中的数字和时间词也计入 config_hash，必须完全一致才复用；含相对时间词时再加上当天日期
+
+使用方式：
+    @semantic_cached("local_contexts", "sources")
+    def local_rag_search(state): ...
+"""
+import datetime
+import functools
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+from src.rag.config import RAGConfig
+
+
+class SemanticCache:
+    """基于查询向量相似度的检索结果缓存"""
+
+    def __init__(self, db_path: str, threshold: float = 0.95, maxsize: int = 2048, ttl: int = 3600,
+                 table: str = "semantic_query_cache"):
+        """
+        Args:
+            db_path: SQLite 文件路径
+            threshold: 命中所需的最小余弦相似度
+            maxsize: 最多保留的条目数（超出后淘汰最旧的）
+            ttl: 条目有效期（秒），网络结果有时效性，不宜过长
+            table: 表名，同一文件中不同用途的缓存各用一张表
+        """
+        self.table = table
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, config_hash TEXT, embedding BLOB, payload TEXT, ts INT)"
+        )
+        self._conn.execute(
+            f"DELETE FROM {table} WHERE ts < ?", (int(time.time()) - ttl,)
+        )
+        self._conn.commit()
+
+        # 内存中的条目：按写入顺序排列，与 _embeddings 的行一一对应
+        rows = self._conn.execute(
+            f"SELECT id, config_hash, embedding, payload, ts FROM {table} "
+            "ORDER BY id DESC LIMIT ?",
+            (maxsize,)
+        ).fetchall()[::-1]
+        self._ids: List[int] = [r[0] for r in rows]
+        self._hashes: List[str] = [r[1] for r in rows]
+        self._payloads: List[str] = [r[3] for r in rows]
+        self._ts: List[int] = [r[4] for r in rows]
+        self._embeddings: Optional[np.ndarray] = (
+            np.vstack([np.frombuffer(r[2], dtype=np.float32) for r in rows]) if rows else None
+        )
+
+    def lookup(self, config_hash: str, embedding: np.ndarray) -> Optional[Dict]:
+        """查找相似度最高且 >= 阈值的条目，返回缓存的字段字典"""
+        with self._lock:
+            if self._embeddings is None:
+                return None
+            sims = self._embeddings @ embedding
+            # 过滤掉配置不同或已过期的条目
+            expired_before = time.time() - self.ttl
+            mask = np.fromiter(
+                (h == config_hash and ts >= expired_before for h, ts in zip(self._hashes, self._ts)),
+                dtype=bool,
+                count=len(self._hashes)
+            )
+            sims = np.where(mask, sims, -1.0)
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            return json.loads(self._payloads[best])
+
+    def store(self, config_hash: str, embedding: np.ndarray, payload: Dict):
+        """写入一条缓存"""
+        embedding = np.asarray(embedding, dtype=np.float32)
+        payload_text = json.dumps(payload, ensure_ascii=False)
+        ts = int(time.time())
+        with self._lock:
+            cursor = self._conn.execute(
+                f"INSERT INTO {self.table} (config_hash, embedding, payload, ts) VALUES (?, ?, ?, ?)",
+                (config_hash, embedding.tobytes(), payload_text, ts)
+            )
+            self._ids.append(cursor.lastrowid)
+            self._hashes.append(config_hash)
+            self._payloads.append(payload_text)
+            self._ts.append(ts)
+            self._embeddings = (
+                embedding[None, :] if self._embeddings is None
+                else np.vstack([self._embeddings, embedding])
+            )
+
+            # 超出容量时淘汰最旧的条目
+            overflow = len(self._ids) - self.maxsize
+            if overflow > 0:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE id <= ?", (self._ids[overflow - 1],)
+                )
+                del self._ids[:overflow], self._hashes[:overflow], self._payloads[:overflow], self._ts[:overflow]
+                self._embeddings = self._embeddings[overflow:]
+            self._conn.commit()
+
+
+_cache: Optional[SemanticCache] = None
+_expansion_cache: Optional[SemanticCache] = None
+_decision_cache: Optional[SemanticCache] = None
+_retrieval_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> SemanticCache:
+    """延迟创建全局语义缓存"""
+    global _cache
+    if _cache is None:
+        _cache = SemanticCache(
+            os.path.join(RAGConfig.CHECKPOINT_DIR, "semantic_cache.db"),
+            threshold=RAGConfig.SEMANTIC_CACHE_THRESHOLD,
+            maxsize=RAGConfig.SEMANTIC_CACHE_SIZE,
+            ttl=RAGConfig.SEMANTIC_CACHE_TTL
+        )
+    return _cache
+
+
+def get_expansion_cache() -> SemanticCache:
+    """延迟创建全局查询扩展缓存（与检索结果缓存同一个文件）"""
+    global _expansion_cache
+    if _expansion_cache is None:
+        _expansion_cache = SemanticCache(
+            os.path.join(RAGConfig.CHECKPOINT_DIR, "semantic_cache.db"),
+            threshold=RAGConfig.EXPANSION_CACHE_THRESHOLD,
+            maxsize=RAGConfig.SEMANTIC_CACHE_SIZE,
+            ttl=RAGConfig.EXPANSION_CACHE_TTL,
+            table="expansion_cache"
+        )
+    return _expansion_cache
+
+
+def get_decision_cache() -> SemanticCache:
+    """延迟创建全局 LLM 判断结果缓存（decide_search / reflect_on_results）"""
+    global _decision_cache
+    if _decision_cache is None:
+        _decision_cache = SemanticCache(
+            os.path.join(RAGConfig.CHECKPOINT_DIR, "semantic_cache.db"),
+            threshold=RAGConfig.DECISION_CACHE_THRESHOLD,
+            maxsize=RAGConfig.SEMANTIC_CACHE_SIZE,
+            ttl=RAGConfig.DECISION_CACHE_TTL,
+            table="decision_cache"
+        )
+    return _decision_cache
+
+
+def get_retrieval_cache() -> SemanticCache:
+    """延迟创建全局本地检索结果缓存（RAGManager.query / query_batch）"""
+    global _retrieval_cache
+    if _retrieval_cache is None:
+        _retrieval_cache = SemanticCache(
+            os.path.join(RAGConfig.CHECKPOINT_DIR, "semantic_cache.db"),
+            threshold=RAGConfig.RETRIEVAL_CACHE_THRESHOLD,
+            maxsize=RAGConfig.SEMANTIC_CACHE_SIZE,
+            ttl=RAGConfig.RETRIEVAL_CACHE_TTL,
+            table="retrieval_cache"
+        )
+    return _retrieval_cache
+
+
+def embed_query(text: Union[str, List[str]]) -> np.ndarray:
+    """
+    用知识库的 Embedding 模型把查询编码为归一化的 float32 向量（传入列表时返回矩阵）
+
+    只加载 Embedding 模型（与 VectorStore 共用同一份），不创建 RAGManager / Chroma 客户端
+    """
+    from src.rag.embedder import get_embedder
+    embedder = get_embedder(
+        RAGConfig.EMBEDDING_MODEL, RAGConfig.EMBED_BACKEND,
+        RAGConfig.EMBED_QUANT_CONFIG, RAGConfig.QUANTIZED_MODEL_DIR
+    )
+    return embedder.encode(text, normalize_embeddings=True).astype(np.float32)
+
+
+# 查询中必须精确匹配的字面量：数字（年份、型号、数量）和时间词
+_LITERAL_RE = re.compile(
+    r"\d+|今天|今日|明天|后天|昨天|前天|今年|明年|去年|本周|下周|上周|本月|下月|上月|最新|实时"
+    r"|today|tomorrow|yesterday|latest",
+    re.IGNORECASE
+)
+# 相对时间词：同一个词在不同日期指代不同的时间
+_RELATIVE_TIME_RE = re.compile(
+    r"今天|今日|明天|后天|昨天|前天|今年|明年|去年|本周|下周|上周|本月|下月|上月|最新|实时"
+    r"|today|tomorrow|yesterday|latest",
+    re.IGNORECASE
+)
+
+
+def _config_hash(node_name: str, state: Dict, uses_local: bool) -> str:
+    """把影响检索结果的配置序列化（key 排序）后取摘要"""
+    query_text = "\n".join(state.get("expanded_queries") or [state.get("current_query", "")])
+    config = {
+        "node": node_name,
+        "search_type": state.get("search_type", ""),
+        "use_multi_query": bool(state.get("use_multi_query", False)),
+        "embedding_model": RAGConfig.EMBEDDING_MODEL,
+        "literals": sorted({m.lower() for m in _LITERAL_RE.findall(query_text)}),
+    }
+    if _RELATIVE_TIME_RE.search(query_text):
+        config["date"] = datetime.date.today().isoformat()
+    if uses_local:
+        # 知识库内容变化（导入/清空文档）后，本地检索结果自动失效；
+        # 指纹只 stat 一次文件，不查询 Chroma；不涉及本地检索的节点不会创建 RAGManager
+        from src.rag.rag_manager import RAGManager
+        config["kb_fingerprint"] = RAGManager.get_instance().vector_store.fingerprint
+    text = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def semantic_cached(*fields: str) -> Callable:
+    """
+    为检索节点加上语义缓存
+
+    Args:
+        *fields: 节点写入 state 的结果字段，命中时从缓存回填这些字段
+    """
+    def decorator(func: Callable) -> Callable:
+        uses_local = "local_contexts" in fields
+
+        @functools.wraps(func)
+        def wrapper(state: Dict) -> Dict:
+            if not RAGConfig.USE_SEMANTIC_CACHE:
+                return func(state)
+
+            queries = state.get("expanded_queries") or [state["current_query"]]
+            embedding = embed_query("\n".join(queries))
+            config_hash = _config_hash(func.__name__, state, uses_local)
+
+            cache = get_semantic_cache()
+            cached = cache.lookup(config_hash, embedding)
+            if cached is not None:
+                state.update(cached)
+                state["current_step"] = "⚡ 命中语义缓存，跳过检索..."
+                print(f"  ⚡ 语义缓存命中: {func.__name__}")
+                return state
+
+            state = func(state)
+            cache.store(config_hash, embedding, {f: state.get(f) for f in fields})
+            return state
+
+        return wrapper
+    return decorator
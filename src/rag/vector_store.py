@@ -1,8 +1,15 @@
 """向量数据库封装"""
+import hashlib
+import os
+import threading
 import uuid
 import chromadb
+import numpy as np
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+from typing import List, Dict, Sequence
+
+from src.rag.embed_cache import EmbedCache
+from src.rag.embedder import get_embedder
 
 
 class VectorStore:
@@ -14,8 +21,23 @@ class VectorStore:
         results = collection.query(query_embeddings=[...], n_results=10) #查询
     """
 
+    # Chroma 单次 add 的最大条数（低于其内部上限）
+    MAX_ADD_BATCH = 5000
+
+    # 集合的 HNSW 索引参数（只在创建集合时生效）：
+    # - 余弦距离：hnswlib 在写入时就把向量归一化，查询时本身就是点积，不需要改成 "ip"
+    # - construction_ef / M 提高建图质量；search_ef 默认只有 10，
+    #   混合检索每次召回 VECTOR_SEARCH_TOP_K（20）条交给 Rerank，放宽到 100 保证召回率
+    HNSW_METADATA = {
+        "hnsw:space": "cosine",
+        "hnsw:construction_ef": 200,
+        "hnsw:M": 32,
+        "hnsw:search_ef": 100,
+    }
+
     def __init__(self, embedding_model: str, collection_name: str = "knowledge_base",
-                 persist_dir: str = None):
+                 persist_dir: str = None, backend: str = "torch",
+                 quant_config: str = "avx512_vnni", model_cache_dir: str = "./data/models"):
         """
         初始化向量存储
 
@@ -23,16 +45,29 @@ class VectorStore:
             embedding_model: Embedding 模型名称
             collection_name: 集合名称（类似数据库的表名）
             persist_dir: 持久化目录，None 则使用内存模式
+            backend: 推理后端，"torch" | "onnx" | "compile" | "onnx-int8"
+            quant_config: onnx-int8 后端的量化目标指令集
+            model_cache_dir: onnx-int8 后端量化模型的保存目录
         """
         self.collection_name = collection_name
         self.persist_dir = persist_dir
+        # 文档向量缓存的键前缀：不同模型 / 推理后端（如 int8 量化）的向量不能混用
+        self._embed_key_prefix = f"{embedding_model}:{backend}:"
+        self.embed_cache = None
+        # 写入版本号：每次 add_documents / clear 后递增，检索器据此判断是否需要重新同步文档
+        self.version = 0
+        # 内容指纹：每次写入 / 清空后换成新的随机值，持久化模式下保存在集合旁边的文件中，
+        # 重启、其他进程（如 Streamlit 与 API 服务共用目录）修改知识库后同样能感知
+        self._fingerprint_path = os.path.join(persist_dir, f"{collection_name}.fingerprint") if persist_dir else None
+        self._fingerprint = (None, uuid.uuid4().hex)  # (文件 inode, 修改时间) -> 指纹
+        self._fingerprint_lock = threading.Lock()
 
         # 关键区别：内存模式 vs 持久化模式
         if persist_dir:
             # 持久化模式：数据保存到磁盘，重启后数据还在
-            import os
             os.makedirs(persist_dir, exist_ok=True)
             self.client = chromadb.PersistentClient(path=persist_dir)
+            self.embed_cache = EmbedCache(os.path.join(persist_dir, "embed_cache.sqlite"))
         else:
             # 内存模式：数据在内存中，重启后丢失
             self.client = chromadb.Client()
@@ -40,12 +75,59 @@ class VectorStore:
         # 获取或创建集合（get_or_create 避免重复创建报错）
         self.collection = self.client.get_or_create_collection(
             name=collection_name,
-            metadata={"hnsw:space": "cosine"}  # 使用余弦距离
+            metadata=self.HNSW_METADATA  # 使用余弦距离
         )
 
-        # 加载 Embedding 模型
-        self.embedder = SentenceTransformer(embedding_model)
+        # Embedding 模型延迟到第一次编码时加载：count / list_documents 等不需要模型的操作不付出加载开销
+        self._embedding_model = embedding_model
+        self._backend = backend
+        self._quant_config = quant_config
+        self._model_cache_dir = model_cache_dir
 
+    @property
+    def fingerprint(self) -> str:
+        """
+        知识库内容指纹（缓存按它区分知识库的不同内容）
+
+        与文档数量不同：清空后导入数量相同的其他文档、替换为 chunk 数相同的文件时也会变化。
+        持久化模式下每次只 stat 一次指纹文件，文件未变时直接返回缓存值
+        """
+        if self._fingerprint_path is None:
+            return self._fingerprint[1]
+        with self._fingerprint_lock:
+            try:
+                st = os.stat(self._fingerprint_path)
+            except FileNotFoundError:
+                # 旧版本创建的知识库没有指纹文件：生成一个
+                self._write_fingerprint()
+                st = os.stat(self._fingerprint_path)
+            key = (st.st_ino, st.st_mtime_ns)
+            if self._fingerprint[0] != key:
+                with open(self._fingerprint_path, encoding="utf-8") as f:
+                    self._fingerprint = (key, f.read().strip())
+            return self._fingerprint[1]
+
+    def _write_fingerprint(self):
+        """知识库内容变化后换一个新指纹（写临时文件再替换，其他进程不会读到写了一半的内容）"""
+        value = uuid.uuid4().hex
+        if self._fingerprint_path is None:
+            self._fingerprint = (None, value)
+            return
+        tmp_path = f"{self._fingerprint_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(value)
+        os.replace(tmp_path, self._fingerprint_path)
+
+    def _bump(self):
+        """记录一次写入：进程内版本号 + 持久化的内容指纹"""
+        self.version += 1
+        with self._fingerprint_lock:
+            self._write_fingerprint()
+
+    @property
+    def embedder(self) -> SentenceTransformer:
+        """Embedding 模型（首次访问时加载；与语义缓存等共用进程内同一份）"""
+        return get_embedder(self._embedding_model, self._backend, self._quant_config, self._model_cache_dir)
 
     def add_documents(self, documents: List[str], metadatas: List[Dict] = None)->int:
         """添加文档到向量库"""
@@ -53,7 +135,8 @@ class VectorStore:
         if not documents:
             return 0
 
-        doc_embedding = self.embedder.encode(documents) #多个embedding向量 [[..], [..], [..]]
+        #多个embedding向量 [[..], [..], [..]]，编码时直接归一化；编码过的内容直接取缓存
+        doc_embedding = self._encode_documents(documents)
         ids = [str(uuid.uuid4()) for _ in documents] #每个文档有一个 id
 
         #对传入进来的metadatas做判断
@@ -62,47 +145,98 @@ class VectorStore:
         elif len(metadatas) != len(documents):
             raise ValueError("metadata的长度必须匹配documents的长度")
 
-        self.collection.add( #把向量化文档存入数据库的表中
-            documents=documents,
-            embeddings = doc_embedding.tolist(),
-            ids = ids,
-            metadatas= metadatas
-        )
+        # 把向量化文档存入数据库的表中；Chroma 单次写入有条数上限，整个目录一起导入时分段写入
+        for start in range(0, len(documents), self.MAX_ADD_BATCH):
+            end = start + self.MAX_ADD_BATCH
+            self.collection.add(
+                documents=documents[start:end],
+                embeddings=doc_embedding[start:end].tolist(),
+                ids=ids[start:end],
+                metadatas=metadatas[start:end]
+            )
+        self._bump()
         return len(documents)
 
+    def _encode_documents(self, documents: List[str]) -> np.ndarray:
+        """编码文档：先查向量缓存，只对未缓存的内容调用模型"""
+        if self.embed_cache is None:
+            return self._encode(documents)
+
+        keys = [self._embed_key_prefix + hashlib.sha1(doc.encode()).hexdigest() for doc in documents]
+        cached = self.embed_cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        if missing:
+            vectors = self._encode([documents[i] for i in missing])
+            self.embed_cache.put_many([keys[i] for i in missing], vectors)
+            cached.update(zip((keys[i] for i in missing), vectors))
+        if len(missing) < len(documents):
+            print(f"⚡ Embedding 缓存命中 {len(documents) - len(missing)}/{len(documents)} 个 chunk")
+        return np.vstack([cached[key] for key in keys]).astype(np.float32)
+
+    def _encode(self, documents: List[str]) -> np.ndarray:
+        return self.embedder.encode(
+            documents, batch_size=64, show_progress_bar=False, convert_to_numpy=True, normalize_embeddings=True
+        )
+
     def get_all_documents(self)->List[Dict]: #获取所有文档及元信息
         result = self.collection.get(
             include=['documents','metadatas']
         )
         return [
             {
+                'id':result["ids"][i],
                 'content':result["documents"][i],
                 'metadata':result["metadatas"][i]
             }
             for i in range(len(result["documents"]))
         ]
 
+    def get_all_raw(self, include: Sequence[str] = ('documents', 'metadatas')) -> Dict[str, list]:
+        """
+        按列返回 Chroma 的原始结果 {"ids": [...], "documents": [...], "metadatas": [...]}
+
+        不像 get_all_documents 那样逐条拼成字典，调用方只取自己需要的列；
+        ids 总会返回，include 中未列出的列不读取
+        """
+        return self.collection.get(include=list(include))
+
+    def get_all_metadatas(self) -> List[Dict]:
+        """只获取所有文档的 metadata（不读取内容）"""
+        return self.get_all_raw(include=('metadatas',))["metadatas"]
+
     def search(self, query: str, top_k: int = 10) -> List[Dict]:
         """向量检索"""
+        return self.search_batch([query], top_k)[0]
 
-        #先将query向量化
-        query_vec = self.embedder.encode(query).tolist()
+    def search_batch(self, queries: List[str], top_k: int = 10) -> List[List[Dict]]:
+        """
+        批量向量检索：所有查询一次前向编码、一次向量库查询
+
+        Returns:
+            与 queries 一一对应的检索结果列表
+        """
+        #先将所有 query 一起向量化（一次前向计算）
+        query_vecs = self.embedder.encode(
+            queries, batch_size=min(len(queries), 64), show_progress_bar=False,
+            convert_to_numpy=True, normalize_embeddings=True
+        ).tolist()
 
         #调用向量数据库（里面的表）进行查询
         results = self.collection.query(
-            query_embeddings=[query_vec], #支持多条检索
+            query_embeddings=query_vecs, #支持多条检索
             n_results=top_k
         )
-        docs = results['documents'][0] #支持“同时查询多个 query”，所以它的返回结构是二维的：[[doc1],[doc2]...]
-        metas = results['metadatas'][0]
-        distances = results['distances'][0]
         ret = []
-        for i in range(len(docs)):
-            ret.append({
-                "content":docs[i],
-                "metadata":metas[i],
-                "score":1 - distances[i] / 2 #距离转换成分数
-            })
+        #支持“同时查询多个 query”，所以它的返回结构是二维的：[[doc1],[doc2]...]
+        for docs, metas, distances in zip(results['documents'], results['metadatas'], results['distances']):
+            ret.append([
+                {
+                    "content":docs[i],
+                    "metadata":metas[i],
+                    "score":1 - distances[i] / 2 #距离转换成分数
+                }
+                for i in range(len(docs))
+            ])
         return ret
 
     def clear(self):
@@ -110,8 +244,9 @@ class VectorStore:
         self.client.delete_collection(name=self.collection_name)
         self.collection = self.client.create_collection(
             name=self.collection_name,
-            metadata={"hnsw:space": "cosine"}  # 使用余弦距离
+            metadata=self.HNSW_METADATA  # 使用余弦距离
         )  # 表
+        self._bump()
 
     def count(self)->int:
         """获取文档数量"""
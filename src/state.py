@@ -7,6 +7,10 @@ class AgentState(TypedDict):
     """智能搜索助手的状态定义"""
     # 对话历史（最近5轮）
     messages: Annotated[List[BaseMessage], add_messages]
+    # 超出 token 上限的早期对话的滚动摘要
+    history_summary: str
+    # messages 中前多少条已合并进 history_summary（摘要水位线）
+    history_summarized_upto: int
 
     # 当前用户问题
     current_query: str
@@ -48,9 +52,15 @@ class AgentState(TypedDict):
     max_loops: int
     # 改进后的查询（用于重新搜索）
     refined_query: str
+    # 本轮已经用过的改进查询
+    previous_queries: List[str]
+    # 改进查询与之前的查询几乎相同，继续循环只会得到相同的检索结果
+    refine_converged: bool
 
     # === Multi-Query 查询扩展相关 ===
     # 扩展后的多个查询
     expanded_queries: List[str]
+    # decide_search 与路由判断并行推测出的扩展查询（由 expand_query 采用）
+    speculative_queries: List[str]
     # 是否启用 Multi-Query
     use_multi_query: bool
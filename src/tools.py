@@ -1,15 +1,97 @@
+import threading
+
+import httpx
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_core.tools import tool
 from langchain_tavily import TavilySearch
+from src.config import Config
+
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+# Multi-Query 的子查询同时发出，连接池至少要容纳一轮并发搜索的连接
+_SEARCH_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=300)
+
+
+class PooledTavilySearch:
+    """
+    Tavily 搜索（直接调用 REST API）
+
+    langchain_tavily 的 TavilySearch 每次请求都新建连接（同步 requests.post / 异步新建 aiohttp 会话），
+    Multi-Query 并发搜索时每个查询都要重新做一次 TCP + TLS 握手。
+    这里所有请求共用进程级的 HTTP/2 客户端：多个并发查询复用同一条连接多路传输。
+
+    invoke / ainvoke 的返回值与 TavilySearch 相同（Tavily 原始 JSON）。
+    """
+
+    _client = None
+    _async_client = None
+    _lock = threading.Lock()
+
+    def __init__(self, max_results: int = 3, search_depth: str = "advanced", include_answer: bool = True):
+        self.params = {
+            "max_results": max_results,
+            "search_depth": search_depth,
+            "include_answer": include_answer,
+        }
+        self.headers = {
+            "Authorization": f"Bearer {Config.TAVILY_API_KEY}",
+            "Content-Type": "application/json",
+        }
+
+    @classmethod
+    def _get_client(cls) -> httpx.Client:
+        # 双重检查加锁：子查询在线程池中同时发起首次搜索时，只创建一个客户端（一个连接池）
+        if cls._client is None:
+            with cls._lock:
+                if cls._client is None:
+                    cls._client = httpx.Client(http2=True, timeout=Config.SEARCH_TIMEOUT, limits=_SEARCH_LIMITS)
+        return cls._client
+
+    @classmethod
+    def _get_async_client(cls) -> httpx.AsyncClient:
+        if cls._async_client is None:
+            with cls._lock:
+                if cls._async_client is None:
+                    cls._async_client = httpx.AsyncClient(
+                        http2=True, timeout=Config.SEARCH_TIMEOUT, limits=_SEARCH_LIMITS
+                    )
+        return cls._async_client
+
+    @staticmethod
+    def _parse(response: httpx.Response) -> dict:
+        if response.status_code != 200:
+            detail = response.json().get("detail", {})
+            error_message = detail.get("error") if isinstance(detail, dict) else "Unknown error"
+            raise ValueError(f"Error {response.status_code}: {error_message}")
+        return response.json()
+
+    def invoke(self, query: str) -> dict:
+        """同步搜索（线程安全，可在线程池中并发调用）"""
+        response = self._get_client().post(
+            TAVILY_SEARCH_URL, json={"query": query, **self.params}, headers=self.headers
+        )
+        return self._parse(response)
+
+    async def ainvoke(self, query: str) -> dict:
+        """异步搜索"""
+        response = await self._get_async_client().post(
+            TAVILY_SEARCH_URL, json={"query": query, **self.params}, headers=self.headers
+        )
+        return self._parse(response)
+
+
 # 方案1：使用 Tavily（推荐）
 def create_search_tool():
-    return TavilySearch(
+    return PooledTavilySearch(
         max_results=3,  # 限制返回结果数量，节省 Token
         search_depth="advanced",  # 使用更深层次的搜索，提高结果质量
         include_answer=True  # **关键：** 要求 Tavily 返回一个即时答案
     )
 
+# 方案1b：langchain_tavily 官方工具（每次请求新建连接）
+# def create_search_tool():
+#     return TavilySearch(max_results=3, search_depth="advanced", include_answer=True)
+
 # 方案2：使用 DuckDuckGo（免费备选）
 # from langchain_community.tools import DuckDuckGoSearchRun
 # def create_search_tool():
-#     return DuckDuckGoSearchRun()
\ No newline at end of file
+#     return DuckDuckGoSearchRun()
@@ -9,10 +9,12 @@ Streamlit Web UI
     - 对话式问答界面
     - 文档上传和管理
     - 实时显示搜索状态
+    - 答案逐 token 流式显示
     - 来源追溯展示
 """
 import sys
 import os
+import shutil
 
 # 添加项目根目录到 Python 路径（解决 src.xxx 导入问题）
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -36,85 +38,114 @@ from src.graph_advanced import graph_advanced, create_initial_state
 from src.rag.rag_manager import RAGManager
 
 
+@st.cache_resource(show_spinner="正在加载模型和知识库索引...")
+def get_rag_manager() -> RAGManager:
+    """
+    进程内共享的 RAGManager（所有会话共用一份模型和向量库连接）
+
+    首次打开页面时就完成预热，第一个问题不再承担模型加载、索引载入的冷启动开销
+    """
+    rag = RAGManager.get_instance()
+    rag.warmup()
+    return rag
+
+
+# 侧边栏每次交互都会重新执行：知识库统计按向量库写入版本缓存，
+# 导入 / 清空文档后版本变化自动失效，其余重跑直接命中缓存，不再扫描全部 metadata
+@st.cache_data(ttl=5)
+def _cached_count(version: int) -> int:
+    return get_rag_manager().count()
+
+
+@st.cache_data(ttl=5)
+def _cached_list_documents(version: int) -> list:
+    return get_rag_manager().list_documents()
+
+
 def init_session_state():
     """初始化 session state"""
     if "messages" not in st.session_state:
         st.session_state.messages = []
     if "thread_id" not in st.session_state:
         st.session_state.thread_id = f"streamlit-{int(time.time())}"
-    if "rag_manager" not in st.session_state:
-        st.session_state.rag_manager = RAGManager.get_instance()
 
 
+@st.fragment
 def render_sidebar():
-    """渲染侧边栏"""
-    st.sidebar.title("⚙️ 设置")
+    """
+    渲染侧边栏（在 with st.sidebar 中调用）
+
+    作为 fragment 运行：侧边栏内的交互只重跑这一部分，不再重新渲染整个聊天记录；
+    功能开关通过 key 写入 session_state，主流程从那里读取
+    """
+    st.title("⚙️ 设置")
 
     # 功能开关
-    st.sidebar.subheader("功能选项")
-    use_multi_query = st.sidebar.checkbox("Multi-Query 扩展", value=True, help="将问题扩展为多个查询")
-    max_loops = st.sidebar.slider("最大循环次数", 1, 5, 3, help="反思循环的最大次数")
+    st.subheader("功能选项")
+    st.checkbox("Multi-Query 扩展", value=True, key="use_multi_query", help="将问题扩展为多个查询")
+    st.slider("最大循环次数", 1, 5, 3, key="max_loops", help="反思循环的最大次数")
 
-    st.sidebar.divider()
+    st.divider()
 
     # 知识库管理
-    st.sidebar.subheader("📚 知识库管理")
+    st.subheader("📚 知识库管理")
 
     # 文档上传
-    uploaded_file = st.sidebar.file_uploader(
+    uploaded_file = st.file_uploader(
         "上传文档",
         type=["pdf", "txt", "md"],
         help="支持 PDF、TXT、Markdown 格式"
     )
 
     if uploaded_file:
-        if st.sidebar.button("📥 导入文档"):
+        if st.button("📥 导入文档"):
             with st.spinner("正在导入文档..."):
                 # 保存临时文件
                 import tempfile
                 import os
                 with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp:
-                    tmp.write(uploaded_file.getvalue())
+                    # 按 1 MiB 分块写入，不把整个文件再复制成一个 bytes 对象
+                    uploaded_file.seek(0)
+                    shutil.copyfileobj(uploaded_file, tmp, length=1 << 20)
                     tmp_path = tmp.name
 
                 try:
-                    rag = st.session_state.rag_manager
+                    rag = get_rag_manager()
                     chunks = rag.add_document(tmp_path)
-                    st.sidebar.success(f"✅ 已导入 {chunks} 个文档块")
+                    st.success(f"✅ 已导入 {chunks} 个文档块")
                 except Exception as e:
-                    st.sidebar.error(f"❌ 导入失败: {e}")
+                    st.error(f"❌ 导入失败: {e}")
                 finally:
                     os.unlink(tmp_path)
 
     # 显示已导入文档
-    rag = st.session_state.rag_manager
-    doc_count = rag.count()
-    documents = rag.list_documents()
+    rag = get_rag_manager()
+    version = rag.vector_store.version
+    doc_count = _cached_count(version)
+    documents = _cached_list_documents(version)
 
-    st.sidebar.metric("文档块数量", doc_count)
+    st.metric("文档块数量", doc_count)
 
     if documents:
-        with st.sidebar.expander(f"📄 已导入 {len(documents)} 个文档"):
+        with st.expander(f"📄 已导入 {len(documents)} 个文档"):
             for doc in documents:
                 st.write(f"• {doc}")
 
     # 清空按钮
-    if st.sidebar.button("🗑️ 清空知识库", type="secondary"):
+    if st.button("🗑️ 清空知识库", type="secondary"):
         rag.clear()
-        st.sidebar.success("知识库已清空")
+        st.success("知识库已清空")
         st.rerun()
 
-    st.sidebar.divider()
+    st.divider()
 
     # 会话管理
-    st.sidebar.subheader("💬 会话管理")
-    if st.sidebar.button("🔄 新建对话"):
+    st.subheader("💬 会话管理")
+    if st.button("🔄 新建对话"):
         st.session_state.messages = []
         st.session_state.thread_id = f"streamlit-{int(time.time())}"
         st.rerun()
 
-    return use_multi_query, max_loops
-
 
 def render_chat_history():
     """渲染聊天历史"""
@@ -131,8 +162,14 @@ def render_chat_history():
                             st.write(f"{i}. [{src['type']}] {src['source']}")
 
 
-def process_query(query: str, use_multi_query: bool, max_loops: int) -> dict:
-    """处理用户查询"""
+def stream_query(query: str, use_multi_query: bool, max_loops: int, result: dict, status=None):
+    """
+    处理用户查询，逐个产出答案 token
+
+    Args:
+        result: 执行过程中合并各节点的更新，生成器结束后即为最终状态
+        status: 可选的 st.empty() 占位，第一个 token 到达前显示当前执行步骤
+    """
     config = {"configurable": {"thread_id": st.session_state.thread_id}}
     state = create_initial_state(
         query=query,
@@ -140,8 +177,30 @@ def process_query(query: str, use_multi_query: bool, max_loops: int) -> dict:
         max_loops=max_loops
     )
 
-    result = graph_advanced.invoke(state, config)
-
+    answering = False
+    # updates：节点完成后的状态更新；messages：answer 节点中 LLM 生成的 token
+    for mode, payload in graph_advanced.stream(state, config, stream_mode=["updates", "messages"]):
+        if mode == "updates":
+            for update in payload.values():
+                result.update(update or {})
+            # 检索 / 反思阶段没有 token 输出，显示当前步骤，让用户知道在做什么
+            if status is not None and not answering and result.get("current_step"):
+                status.caption(result["current_step"])
+        else:
+            chunk, metadata = payload
+            if metadata.get("langgraph_node") == "answer" and chunk.content:
+                if not answering:
+                    answering = True
+                    if status is not None:
+                        status.empty()
+                yield chunk.content
+
+    if status is not None:
+        status.empty()
+
+
+def summarize_result(result: dict) -> dict:
+    """提取界面需要展示的字段"""
     return {
         "answer": result.get("final_answer", ""),
         "sources": result.get("sources", []),
@@ -161,7 +220,10 @@ def main():
     st.caption("基于 LangGraph 的智能搜索助手 | Multi-Query | Reflector | RAG")
 
     # 侧边栏
-    use_multi_query, max_loops = render_sidebar()
+    with st.sidebar:
+        render_sidebar()
+    use_multi_query = st.session_state.use_multi_query
+    max_loops = st.session_state.max_loops
 
     # 聊天历史
     render_chat_history()
@@ -175,38 +237,35 @@ def main():
 
         # 处理查询
         with st.chat_message("assistant"):
-            with st.spinner("思考中..."):
-                # 显示处理状态
-                status_placeholder = st.empty()
-
-                # 执行查询
-                result = process_query(query, use_multi_query, max_loops)
-
-                # 显示元信息
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("搜索类型", result["search_type"])
-                with col2:
-                    st.metric("循环次数", result["loop_count"])
-                with col3:
-                    st.metric("反思结果", result["reflection_result"])
-
-                # 显示扩展查询
-                if result["expanded_queries"]:
-                    with st.expander("🔄 扩展查询"):
-                        for i, q in enumerate(result["expanded_queries"], 1):
-                            st.write(f"{i}. {q}")
-
-                # 显示答案
-                st.markdown(result["answer"])
-
-                # 显示来源
-                if result["sources"]:
-                    with st.expander(f"📚 信息来源 ({len(result['sources'])} 条)"):
-                        for i, src in enumerate(result["sources"], 1):
-                            source_text = src.get("source", "N/A")
-                            score = src.get("score", 0)
-                            st.write(f"{i}. [{src['type']}] {source_text[:80]}... (相关度: {score:.2f})")
+            # 执行查询：答案 token 到达即显示，无需等待完整答案
+            final_state = {}
+            status = st.empty()
+            status.caption("🤔 思考中...")
+            st.write_stream(stream_query(query, use_multi_query, max_loops, final_state, status))
+            result = summarize_result(final_state)
+
+            # 显示元信息
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("搜索类型", result["search_type"])
+            with col2:
+                st.metric("循环次数", result["loop_count"])
+            with col3:
+                st.metric("反思结果", result["reflection_result"])
+
+            # 显示扩展查询
+            if result["expanded_queries"]:
+                with st.expander("🔄 扩展查询"):
+                    for i, q in enumerate(result["expanded_queries"], 1):
+                        st.write(f"{i}. {q}")
+
+            # 显示来源
+            if result["sources"]:
+                with st.expander(f"📚 信息来源 ({len(result['sources'])} 条)"):
+                    for i, src in enumerate(result["sources"], 1):
+                        source_text = src.get("source", "N/A")
+                        score = src.get("score", 0)
+                        st.write(f"{i}. [{src['type']}] {source_text[:80]}... (相关度: {score:.2f})")
 
         # 添加助手消息到历史
         st.session_state.messages.append({
@@ -1,11 +1,68 @@
 # src/utils/llm_factory.py
 import os
-from typing import Callable, AnyStr
+import threading
+from typing import Callable, AnyStr, Dict, Tuple
 
+import httpx
 from langchain_openai import ChatOpenAI
 from src.config import Config
 
 
+# 所有 ChatOpenAI 实例共用的 HTTP 连接池（HTTP/2 多路复用 + keep-alive），
+# 节点之间、并发的 Graph 运行之间复用已建立的 TLS 连接，避免每次请求重新握手。
+# httpx 默认空闲 5 秒即关闭连接，用户两轮对话之间往往更久，这里放宽到 5 分钟
+_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=300)
+_http_client = None
+_http_async_client = None
+_http_lock = threading.Lock()
+
+
+def _get_http_clients():
+    """延迟创建全局同步 / 异步 HTTP 客户端（双重检查加锁，并发首次调用时只创建一组连接池）"""
+    global _http_client, _http_async_client
+    if _http_client is None:
+        with _http_lock:
+            if _http_client is None:
+                # 先创建异步客户端：无锁检查的是 _http_client，赋值后两个客户端都已就绪
+                _http_async_client = httpx.AsyncClient(http2=True, timeout=Config.LLM_TIMEOUT, limits=_HTTP_LIMITS)
+                _http_client = httpx.Client(http2=True, timeout=Config.LLM_TIMEOUT, limits=_HTTP_LIMITS)
+    return _http_client, _http_async_client
+
+
+# ChatOpenAI 实例无状态、可在线程 / 协程间共享：相同参数只创建一次，
+# 各调用方（节点、评估脚本等）拿到的是同一个实例，不再每次重新构造客户端。
+# lru_cache 不会串行化并发的未命中（会各自构造一个实例），这里同样用双重检查加锁
+_chat_models: Dict[Tuple, ChatOpenAI] = {}
+_chat_models_lock = threading.Lock()
+
+
+def _chat_model(model: str, api_key, base_url: str, temperature: float) -> ChatOpenAI:
+    key = (model, api_key, base_url, temperature)
+    llm = _chat_models.get(key)
+    if llm is None:
+        with _chat_models_lock:
+            llm = _chat_models.get(key)
+            if llm is None:
+                http_client, http_async_client = _get_http_clients()
+                llm = _chat_models[key] = ChatOpenAI(
+                    model=model,
+                    openai_api_key=api_key,
+                    openai_api_base=base_url,
+                    temperature=temperature,
+                    http_client=http_client,
+                    http_async_client=http_async_client
+                )
+    return llm
+
+
+# 各任务的生成参数：判断类输出只有几行结构化文本，限制长度并去掉随机性，
+# 既少生成无用 token，也避免输出格式漂移导致解析失败
+TASK_PARAMS = {
+    "classify": {"max_tokens": 32, "temperature": 0, "top_p": 1},   # 路由判断
+    "reflect": {"max_tokens": 128, "temperature": 0, "top_p": 1},   # 反思评估（含原因和改进查询）
+    "expand": {"max_tokens": 256, "temperature": 0.3},              # 查询扩展 / 改写
+    "answer": {},                                                   # 生成答案：使用模型默认参数
+}
 
 
 class LLMFactory:
@@ -14,46 +71,65 @@ class LLMFactory:
 
     @staticmethod
     def get_deepseek_model(temperature: float = 0.7):
-        return ChatOpenAI(
-            model=Config.DEEPSEEK_MODEL_NAME,
-            openai_api_key=Config.DASHSCOPE_API_KEY,
-            openai_api_base=Config.DEEPSEEK_BASE_URL,
-            temperature=temperature
+        return _chat_model(
+            Config.DEEPSEEK_MODEL_NAME,
+            Config.DASHSCOPE_API_KEY,
+            Config.DEEPSEEK_BASE_URL,
+            temperature
         )
 
 
 
     @staticmethod
     def get_minimax_model(temperature: float = 0.7):
-        return ChatOpenAI(
-            model=Config.MINIMAX_MODEL_NAME,
-            openai_api_key=Config.MINIMAX_API_KEY,
-            openai_api_base=Config.MINIMAX_BASE_URL,
-            temperature=temperature
+        return _chat_model(
+            Config.MINIMAX_MODEL_NAME,
+            Config.MINIMAX_API_KEY,
+            Config.MINIMAX_BASE_URL,
+            temperature
         )
 
 
     @staticmethod
     def get_qwen_model(temperature: float = 0.7):
-        return ChatOpenAI(
-            model=Config.QWEN_MODEL_NAME,
-            openai_api_key=Config.DASHSCOPE_API_KEY,
-            openai_api_base=Config.QWEN_BASE_URL,
-            temperature=temperature
+        return _chat_model(
+            Config.QWEN_MODEL_NAME,
+            Config.DASHSCOPE_API_KEY,
+            Config.QWEN_BASE_URL,
+            temperature
         )
 
 
     @staticmethod
     def get_model(temperature: float = 0.7):
         """正式代码（如 nodes.py）使用这个，解耦配置"""
-        provider = getattr(Config, "LLM_PROVIDER", "deepseek").lower()
-
-        if provider == "minimax":
-            return LLMFactory.get_minimax_model(temperature)
-        elif provider == "deepseek":
-            return LLMFactory.get_deepseek_model(temperature)
-        else:
-            return LLMFactory.get_qwen_model(temperature)
+        # 未知的提供商默认使用 qwen
+        return _PROVIDERS.get(_PROVIDER_NAME, LLMFactory.get_qwen_model)(temperature)
+
+
+    @staticmethod
+    def for_task(task: str, llm: ChatOpenAI = None):
+        """
+        返回绑定了任务生成参数的模型
+
+        Args:
+            task: "classify" | "reflect" | "expand" | "answer"
+            llm: 基础模型，None 则新建
+        """
+        if task not in TASK_PARAMS:
+            raise ValueError(f"未知的任务类型: {task}")
+        llm = llm or LLMFactory.get_model()
+        params = TASK_PARAMS[task]
+        return llm.bind(**params) if params else llm
+
+
+# 提供商在导入时解析一次，get_model 只做一次字典查找
+_PROVIDER_NAME = getattr(Config, "LLM_PROVIDER", "deepseek").lower()
+_PROVIDERS = {
+    "minimax": LLMFactory.get_minimax_model,
+    "deepseek": LLMFactory.get_deepseek_model,
+    "qwen": LLMFactory.get_qwen_model,
+}
 
 
 # 为了方便，导出一个全局通用的获取函数
@@ -0,0 +1,14 @@
+"""
+路径工具
+
+检索结果的来源字段是文档的完整路径，展示和格式化时只需要文件名。
+同一文档的多个 chunk、反思循环中的重复格式化会反复传入相同路径，结果做进程内缓存。
+"""
+import functools
+import os
+
+
+@functools.lru_cache(maxsize=1024)
+def source_basename(path: str) -> str:
+    """来源文件名（相同路径只计算一次）"""
+    return os.path.basename(path)
@@ -0,0 +1,147 @@
+"""
+LLM 查询类结果缓存（路由判断 / 查询扩展 / 反思评估）
+
+decide_search 每次都要调用一次 LLM 只为得到 TYPE / COMPLEXITY 两个标签，
+expand_query 又要再调用一次 LLM 把问题改写成多个子查询，
+对重复或常见问题这些都是重复开销。这里做一个精确匹配的两级缓存：
+- 进程内 LRU（OrderedDict，容量 Config.DECIDE_CACHE_SIZE）
+- SQLite 持久化（{CHECKPOINT_DIR}/query_cache.db，与 semantic_cache.db 并列），跨会话复用。
+  不写入 LangGraph 的 checkpoints.db：缓存的读写、清空与会话检查点互不影响
+
+不同用途用 kind 区分（"decide" / "rewrite" / "reflect"），共用一张表。
+key 为规范化问题（去首尾空白、转小写）的 SHA-256，条目超过 TTL 后视为失效。
+反思评估的结果取决于检索内容，以完整的可变输入（问题 + 检索结果）作为 key。
+
+精确缓存位于语义缓存之前：完全相同的请求连 Embedding 都不用计算。
+
+使用方式：
+    cache = get_decide_cache()
+    hit = cache.get(query)          # 缓存的值或 None
+    cache.set(query, ["WEB", "SIMPLE"])
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import Config
+
+
+class QueryCache:
+    """以问题文本为 key 的 LRU + SQLite 缓存，值为可 JSON 序列化的对象"""
+
+    def __init__(self, db_path: str, kind: str, maxsize: int = 1024, ttl: int = 7 * 24 * 3600):
+        """
+        Args:
+            db_path: SQLite 文件路径
+            kind: 缓存用途，区分同一张表中的不同数据
+            maxsize: 进程内 LRU 最大条目数
+            ttl: 条目有效期（秒）
+        """
+        self.kind = kind
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lru: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_cache "
+            "(kind TEXT, key TEXT, value TEXT, ts INT, PRIMARY KEY (kind, key))"
+        )
+        self._conn.commit()
+
+        # 预加载最近的有效条目（最旧的先放入，保证 LRU 顺序正确）
+        rows = self._conn.execute(
+            "SELECT key, value, ts FROM query_cache "
+            "WHERE kind = ? AND ts >= ? ORDER BY ts DESC LIMIT ?",
+            (kind, int(time.time()) - ttl, maxsize)
+        ).fetchall()
+        for key, value, ts in reversed(rows):
+            self._lru[key] = (json.loads(value), ts)
+
+    @staticmethod
+    def make_key(query: str) -> str:
+        """规范化问题后计算 SHA-256"""
+        return hashlib.sha256(query.strip().lower().encode()).hexdigest()
+
+    def get(self, query: str) -> Optional[Any]:
+        """命中返回缓存的值，未命中或已过期返回 None"""
+        key = self.make_key(query)
+        now = int(time.time())
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                row = self._conn.execute(
+                    "SELECT value, ts FROM query_cache WHERE kind = ? AND key = ?",
+                    (self.kind, key)
+                ).fetchone()
+                if row is None:
+                    return None
+                entry = (json.loads(row[0]), row[1])
+
+            if now - entry[1] > self.ttl:
+                self._lru.pop(key, None)
+                return None
+
+            self._put(key, entry)
+            return entry[0]
+
+    def set(self, query: str, value: Any):
+        """写入缓存"""
+        key = self.make_key(query)
+        entry = (value, int(time.time()))
+        with self._lock:
+            self._put(key, entry)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_cache (kind, key, value, ts) VALUES (?, ?, ?, ?)",
+                (self.kind, key, json.dumps(value, ensure_ascii=False), entry[1])
+            )
+            self._conn.commit()
+
+    def _put(self, key: str, entry: Tuple[Any, int]):
+        """放入 LRU 并淘汰最久未使用的条目（调用方持有锁）"""
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+
+# kind -> 缓存实例
+_caches: Dict[str, QueryCache] = {}
+_caches_lock = threading.Lock()
+
+
+def _get_cache(kind: str) -> QueryCache:
+    """延迟创建指定用途的缓存实例（双重检查加锁，并发首次调用时只创建一个）"""
+    cache = _caches.get(kind)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(kind)
+            if cache is None:
+                cache = _caches[kind] = QueryCache(
+                    os.path.join(Config.CHECKPOINT_DIR, "query_cache.db"),
+                    kind=kind,
+                    maxsize=Config.DECIDE_CACHE_SIZE,
+                    ttl=Config.DECIDE_CACHE_TTL
+                )
+    return cache
+
+
+def get_decide_cache() -> QueryCache:
+    """decide_search 路由结果缓存：值为 [search_type, complexity]"""
+    return _get_cache("decide")
+
+
+def get_rewrite_cache() -> QueryCache:
+    """expand_query 查询扩展结果缓存：值为扩展后的查询列表"""
+    return _get_cache("rewrite")
+
+
+def get_reflect_cache() -> QueryCache:
+    """reflect_on_results 评估结果缓存（key 为问题 + 完整检索结果）：值为 [result, reason, refined_query]"""
+    return _get_cache("reflect")
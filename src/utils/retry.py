@@ -5,11 +5,22 @@
 1. API 调用失败重试
 2. 超时处理
 3. 降级策略
+
+retry_with_backoff / CircuitBreaker 同时支持普通函数和 async 函数：
+被装饰的是协程函数时，退避等待使用 asyncio.sleep，不阻塞事件循环中的其他任务
 """
+import asyncio
 import time
 import functools
+import inspect
+import logging
+import threading
 from typing import Callable, Any, Optional, Type, Tuple
 
+# 重试 / 熔断日志走 logging 而不是 print：Multi-Query 并发重试时不必每条都抢占并刷新 stdout，
+# 应用可按需调整级别或重定向；未配置 logging 时 WARNING 仍会输出到 stderr
+logger = logging.getLogger(__name__)
+
 
 def retry_with_backoff(
     max_retries: int = 3,
@@ -35,32 +46,47 @@ def retry_with_backoff(
         def call_api():
             ...
     """
+    def next_delay(e: Exception, attempt: int) -> Optional[float]:
+        """记录一次失败，返回下次重试前的等待时间；已达最大次数时返回 None"""
+        if attempt >= max_retries:
+            logger.warning("  ❌ 达到最大重试次数 (%d)，放弃: %r", max_retries, e)
+            return None
+        delay = min(
+            base_delay * (exponential_base ** attempt),
+            max_delay
+        )
+        logger.warning("  ⚠️ 重试 %d/%d，等待 %.1fs... (%r)", attempt + 1, max_retries, delay, e)
+
+        if on_retry:
+            on_retry(e, attempt + 1)
+        return delay
+
     def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs) -> Any:
+                for attempt in range(max_retries + 1):
+                    try:
+                        return await func(*args, **kwargs)
+                    except exceptions as e:
+                        delay = next_delay(e, attempt)
+                        if delay is None:
+                            raise
+                        # 让出事件循环：并发任务各自退避，互不阻塞
+                        await asyncio.sleep(delay)
+
+            return async_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs) -> Any:
-            last_exception = None
-
             for attempt in range(max_retries + 1):
                 try:
                     return func(*args, **kwargs)
                 except exceptions as e:
-                    last_exception = e
-
-                    if attempt < max_retries:
-                        delay = min(
-                            base_delay * (exponential_base ** attempt),
-                            max_delay
-                        )
-                        print(f"  ⚠️ 重试 {attempt + 1}/{max_retries}，等待 {delay:.1f}s...")
-
-                        if on_retry:
-                            on_retry(e, attempt + 1)
-
-                        time.sleep(delay)
-                    else:
-                        print(f"  ❌ 达到最大重试次数 ({max_retries})，放弃")
-
-            raise last_exception
+                    delay = next_delay(e, attempt)
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
 
         return wrapper
     return decorator
@@ -121,44 +147,70 @@ class CircuitBreaker:
         self.failure_count = 0
         self.last_failure_time = 0
         self.state = "closed"  # closed, open, half-open
+        # 状态读写都很短且不跨 await，用线程锁即可同时保护多线程和协程的并发调用
+        self._lock = threading.Lock()
 
-    def __call__(self, func: Callable) -> Callable:
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            # 检查熔断器状态
+    def _before_call(self):
+        """检查熔断器状态，开启中则直接拒绝调用"""
+        with self._lock:
             if self.state == "open":
                 if time.time() - self.last_failure_time >= self.recovery_timeout:
                     self.state = "half-open"
-                    print("  🔄 熔断器进入半开状态，尝试恢复...")
+                    logger.warning("  🔄 熔断器进入半开状态，尝试恢复...")
                 else:
                     raise CircuitBreakerOpen(
                         f"熔断器开启中，请等待 {self.recovery_timeout - (time.time() - self.last_failure_time):.0f}s"
                     )
 
-            try:
-                result = func(*args, **kwargs)
-                # 调用成功，重置计数器
-                self.last_failure_time = 0
-                self.failure_count = 0
-                self.state = "closed"
-                return result
+    def _on_success(self):
+        # 调用成功，重置计数器
+        with self._lock:
+            self.last_failure_time = 0
+            self.failure_count = 0
+            self.state = "closed"
+
+    def _on_failure(self):
+        with self._lock:
+            self.failure_count += 1
+            self.last_failure_time = time.time()
 
-            except self.expected_exceptions as e:
-                self.failure_count += 1
-                self.last_failure_time = time.time()
+            if self.failure_count >= self.failure_threshold:
+                self.state = "open"
+                logger.warning("  🔴 熔断器开启！连续失败 %d 次", self.failure_count)
+
+    def __call__(self, func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                self._before_call()
+                try:
+                    result = await func(*args, **kwargs)
+                except self.expected_exceptions:
+                    self._on_failure()
+                    raise
+                self._on_success()
+                return result
 
-                if self.failure_count >= self.failure_threshold:
-                    self.state = "open"
-                    print(f"  🔴 熔断器开启！连续失败 {self.failure_count} 次")
+            return async_wrapper
 
-                raise e
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self._before_call()
+            try:
+                result = func(*args, **kwargs)
+            except self.expected_exceptions:
+                self._on_failure()
+                raise
+            self._on_success()
+            return result
 
         return wrapper
 
     def reset(self):
         """手动重置熔断器"""
-        self.failure_count = 0
-        self.state = "closed"
+        with self._lock:
+            self.failure_count = 0
+            self.state = "closed"
 
 
 class CircuitBreakerOpen(Exception):
@@ -172,8 +224,7 @@ class CircuitBreakerOpen(Exception):
 llm_retry = retry_with_backoff(
     max_retries=3,
     base_delay=2.0,
-    exceptions=(Exception,),  # 可以替换为具体的 API 异常
-    on_retry=lambda e, n: print(f"  ⚠️ LLM 调用失败: {e}")
+    exceptions=(Exception,)  # 可以替换为具体的 API 异常
 )
 
 # 搜索 API 重试
@@ -181,14 +232,12 @@ search_retry = retry_with_backoff(
     max_retries=2,
     base_delay=1.0,
     max_delay=10.0,
-    exceptions=(Exception,),
-    on_retry=lambda e, n: print(f"  ⚠️ 搜索失败: {e}")
+    exceptions=(Exception,)
 )
 
 # 向量库操作重试
 vector_retry = retry_with_backoff(
     max_retries=2,
     base_delay=0.5,
-    exceptions=(Exception,),
-    on_retry=lambda e, n: print(f"  ⚠️ 向量操作失败: {e}")
+    exceptions=(Exception,)
 )
@@ -106,21 +106,23 @@ class CircuitBreaker():
         return wrapper
 
 
-breaker = CircuitBreaker(recovery_timeout = 2)
-
-@breaker
-def say_hello(name = "zhansan"):
-    print(name+" over")
-    num = 1/0
-
-for i in range(5):
-    try:
-        say_hello()
-    except Exception as e:
-        print("出错了")
-
-    if i == 3:
-        time.sleep(2.5)
-
-# say_hello = safe_call(say_hello,default="出错了，请检查")
-# print(say_hello)
\ No newline at end of file
+if __name__ == "__main__":
+    # 演示：仅直接运行本文件时执行，被导入时不触发异常和 sleep
+    breaker = CircuitBreaker(recovery_timeout = 2)
+
+    @breaker
+    def say_hello(name = "zhansan"):
+        print(name+" over")
+        num = 1/0
+
+    for i in range(5):
+        try:
+            say_hello()
+        except Exception as e:
+            print("出错了")
+
+        if i == 3:
+            time.sleep(2.5)
+
+    # say_hello = safe_call(say_hello,default="出错了，请检查")
+    # print(say_hello)
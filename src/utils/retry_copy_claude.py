@@ -52,22 +52,24 @@ class CircuitBreaker():
         return wrapper
 
 
-breaker = CircuitBreaker(recovery_timeout=2)
+if __name__ == "__main__":
+    # 演示：仅直接运行本文件时执行，被导入时不触发异常和 sleep
+    breaker = CircuitBreaker(recovery_timeout=2)
 
 
-@breaker
-def say_hello(name="zhansan"):
-    print(f"    执行 say_hello({name})")
-    num = 1 / 0
+    @breaker
+    def say_hello(name="zhansan"):
+        print(f"    执行 say_hello({name})")
+        num = 1 / 0
 
 
-for i in range(5):
-    print(f"\n===== 第 {i + 1} 次调用 =====")
-    try:
-        say_hello()
-    except Exception as e:
-        print(f"💥 外层捕获异常: {type(e).__name__}")
+    for i in range(5):
+        print(f"\n===== 第 {i + 1} 次调用 =====")
+        try:
+            say_hello()
+        except Exception as e:
+            print(f"💥 外层捕获异常: {type(e).__name__}")
 
-    if i == 3:
-        print("😴 睡眠 2.5 秒...")
-        time.sleep(2.5)
\ No newline at end of file
+        if i == 3:
+            print("😴 睡眠 2.5 秒...")
+            time.sleep(2.5)
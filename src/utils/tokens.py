@@ -0,0 +1,36 @@
+"""
+Token 计数
+
+评估上下文截断、对话历史裁剪都需要按 token 估算长度。
+统一使用 tiktoken 的 cl100k_base 编码（延迟加载）；tiktoken 不可用
+（未安装 / 离线无法下载词表）时按字符数近似，中文场景下偏保守。
+"""
+from typing import List
+
+from langchain_core.messages import BaseMessage
+
+_tokenizer = None
+
+
+def get_tokenizer():
+    """获取全局 token 编码器，不可用时返回 False"""
+    global _tokenizer
+    if _tokenizer is None:
+        try:
+            import tiktoken
+            _tokenizer = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _tokenizer = False
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    """估算文本的 token 数"""
+    tok = get_tokenizer()
+    return len(tok.encode(text)) if tok else len(text)
+
+
+def count_message_tokens(messages: List[BaseMessage]) -> int:
+    """估算消息列表的 token 数（可直接作为 trim_messages 的 token_counter）"""
+    # 每条消息额外计入少量角色 / 分隔符开销
+    return sum(count_tokens(str(m.content)) + 4 for m in messages)
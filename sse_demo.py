@@ -9,43 +9,48 @@ SSE（Server-Sent Events）最简Demo
 
 你会看到数据一条一条推送出来！
 """
+import asyncio
+import os
 import time
-import json
+import orjson
 from fastapi import FastAPI
 from fastapi.responses import StreamingResponse
 import uvicorn
 
 app = FastAPI()
 
+# 模拟 AI 处理的5个步骤（模块级常量，所有请求共用）
+STEPS = [
+    "🤔 正在理解你的问题...",
+    "🔍 正在搜索相关资料...",
+    "📚 正在阅读文档...",
+    "🧠 正在思考答案...",
+    "✍️ 正在组织语言...",
+]
 
-def event_generator():
+
+async def event_generator():
     """
-    这是一个生成器函数
+    这是一个异步生成器函数
     每次 yield 会向客户端推送一条数据
+
+    等待用 await asyncio.sleep：同步生成器会被放进线程池逐条迭代，每推送一条都要在线程间切换一次
     """
-    
-    # 模拟 AI 处理的5个步骤
-    steps = [
-        "🤔 正在理解你的问题...",
-        "🔍 正在搜索相关资料...",
-        "📚 正在阅读文档...",
-        "🧠 正在思考答案...",
-        "✍️ 正在组织语言...",
-    ]
-    
+
     # 逐个推送进度
-    for i, step in enumerate(steps):
+    for i, step in enumerate(STEPS):
         # SSE 格式固定：event: 事件名\ndata: 数据\n\n
+        # orjson 直接输出 UTF-8 字节（中文不转义），StreamingResponse 无需再 encode
         data = {"step": step, "progress": (i + 1) * 20}
-        yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
-        time.sleep(1)  # 每秒推送一条
+        yield b"data: " + orjson.dumps(data) + b"\n\n"
+        await asyncio.sleep(1)  # 每秒推送一条
     
     # 推送最终答案
     answer = "RAG 是 Retrieval-Augmented Generation 的缩写，即检索增强生成。它结合了搜索和生成，让 AI 能够基于真实资料回答问题。"
-    yield f"data: {json.dumps({'answer': answer}, ensure_ascii=False)}\n\n"
+    yield b"data: " + orjson.dumps({"answer": answer}) + b"\n\n"
     
     # 推送完成信号
-    yield f"data: {json.dumps({'done': True})}\n\n"
+    yield b"data: " + orjson.dumps({"done": True}) + b"\n\n"
 
 
 @app.get("/stream")
@@ -84,4 +89,8 @@ if __name__ == "__main__":
     print("     → 每秒推送一条数据")
     print("\n" + "=" * 60)
     
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # loop / http 默认为 "auto"：安装了 uvloop、httptools（uvicorn[standard]）时自动使用
+    # 多个 worker 进程共用同一个监听 socket，由内核把连接分给各自独立的事件循环；
+    # 多进程模式下 app 必须以导入字符串的形式传入。worker 数可用 SSE_WORKERS 环境变量调整
+    workers = int(os.getenv("SSE_WORKERS", os.cpu_count() or 1))
+    uvicorn.run("sse_demo:app", host="0.0.0.0", port=8000, workers=workers)
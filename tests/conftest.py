@@ -0,0 +1,23 @@
+"""
+pytest 公共配置
+
+@pytest.mark.integration 标记的测试会真实调用 LLM / 搜索 API（需要 API Key、网络，且每次运行要花数秒到数十秒），
+默认跳过；设置环境变量 RUN_INTEGRATION=1 时才执行：
+    RUN_INTEGRATION=1 python -m pytest tests
+"""
+import os
+
+import pytest
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "integration: 需要真实 LLM / 搜索 API 的集成测试")
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.getenv("RUN_INTEGRATION") == "1":
+        return
+    skip = pytest.mark.skip(reason="集成测试，设置 RUN_INTEGRATION=1 后运行")
+    for item in items:
+        if "integration" in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,16 @@
+import numpy as np
+
+from src.rag.embed_cache import EmbedCache
+
+
+def test_embed_cache_round_trips_float16_vectors(tmp_path):
+    """写入后可批量取回（float16 存储，取回为 float32），未写入的键不返回"""
+    cache = EmbedCache(str(tmp_path / "embed_cache.sqlite"))
+    vectors = np.random.rand(2, 8).astype(np.float32)
+
+    cache.put_many(["m:a", "m:b"], vectors)
+    found = cache.get_many(["m:a", "m:b", "m:c"])
+
+    assert set(found) == {"m:a", "m:b"}
+    assert found["m:a"].dtype == np.float32
+    np.testing.assert_allclose(found["m:b"], vectors[1], atol=1e-3)
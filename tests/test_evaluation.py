@@ -0,0 +1,98 @@
+import asyncio
+
+from src.evaluation import _score_cache
+from src.evaluation._score_cache import ScoreCache, cached_score, make_key
+
+
+def test_make_key_is_stable_and_metric_scoped():
+    """相同输入得到相同 key，不同指标互不串用"""
+    key1 = make_key("faithfulness", "答案", ["上下文1", "上下文2"])
+    key2 = make_key("faithfulness", "答案", ["上下文1", "上下文2"])
+    key3 = make_key("context_recall", "答案", ["上下文1", "上下文2"])
+
+    assert key1 == key2
+    assert key1 != key3
+
+
+def test_cached_score_skips_repeated_calls(tmp_path, monkeypatch):
+    """第二次评估相同样本时直接命中缓存"""
+    monkeypatch.setattr(_score_cache, "_cache", ScoreCache(str(tmp_path / "eval_cache.db")))
+
+    class FakeEvaluator:
+        calls = 0
+
+        @cached_score("faithfulness")
+        async def evaluate(self, answer, contexts, expected_answer=None):
+            FakeEvaluator.calls += 1
+            return 0.8
+
+    evaluator = FakeEvaluator()
+    assert asyncio.run(evaluator.evaluate("答案", ["上下文"])) == 0.8
+    assert asyncio.run(evaluator.evaluate(answer="答案", contexts=["上下文"])) == 0.8
+    assert FakeEvaluator.calls == 1
+
+
+def test_cached_score_is_scoped_to_judge_config(tmp_path, monkeypatch):
+    """评判温度或评估标准变化后不复用旧分数"""
+    monkeypatch.setattr(_score_cache, "_cache", ScoreCache(str(tmp_path / "eval_cache.db")))
+
+    class FakeJudge:
+        model = "qwen-plus"
+        temperature = 0.7
+
+    def make_evaluator(prompt):
+        class FakeEvaluator:
+            calls = 0
+            batcher = FakeJudge()
+
+            @cached_score("faithfulness", prompt)
+            async def evaluate(self, answer, contexts):
+                FakeEvaluator.calls += 1
+                return 0.8
+        return FakeEvaluator
+
+    Evaluator = make_evaluator("标准 A")
+    evaluator = Evaluator()
+    asyncio.run(evaluator.evaluate("答案", ["上下文"]))
+    evaluator.batcher = FakeJudge()
+    evaluator.batcher.temperature = 0.0
+    asyncio.run(evaluator.evaluate("答案", ["上下文"]))
+    assert Evaluator.calls == 2
+
+    Other = make_evaluator("标准 B")
+    asyncio.run(Other().evaluate("答案", ["上下文"]))
+    assert Other.calls == 1
+
+
+def test_fallback_scores_are_not_cached(tmp_path, monkeypatch):
+    """评判输出无法解析时返回兜底分数，但不写入缓存，下次运行重新评判"""
+    from types import SimpleNamespace
+    from src.evaluation.rag_evaluator import RAGEvaluator
+
+    monkeypatch.setattr(_score_cache, "_cache", ScoreCache(str(tmp_path / "eval_cache.db")))
+    replies = iter(['{"faithfulness": 0.9, "answer_rel', '{"faithfulness": 0.9, "answer_relevancy": 0.8, '
+                    '"context_precision": 0.7, "context_recall": 0.6}'])
+
+    async def process_batched(prompt, **params):
+        return next(replies)
+
+    evaluator = RAGEvaluator.__new__(RAGEvaluator)
+    evaluator.batcher = SimpleNamespace(model="qwen-plus", temperature=0.7, process_batched=process_batched)
+
+    args = ("问题", "答案", ["上下文"], "标准答案")
+    first = asyncio.run(evaluator.evaluate_all(*args))
+    assert first["answer_relevancy"] == 0.5
+    second = asyncio.run(evaluator.evaluate_all(*args))
+    assert second["answer_relevancy"] == 0.8
+    # 解析成功的结果才写入缓存
+    assert asyncio.run(evaluator.evaluate_all(*args)) == second
+
+
+def test_parse_score_tolerates_surrounding_text():
+    """评判输出带前后缀时仍能解析出分数，解析失败才返回 0.5"""
+    from src.evaluation.rag_evaluator import _parse_score
+
+    assert _parse_score("0.8") == 0.8
+    assert _parse_score("分数：0.85。") == 0.85
+    assert _parse_score("1") == 1.0
+    assert _parse_score("无法评估") == 0.5
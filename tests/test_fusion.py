@@ -0,0 +1,17 @@
+import numpy as np
+
+from src.rag.fusion import mmr_select
+
+
+def test_mmr_select_prefers_diverse_candidates():
+    """前两个候选几乎相同时，第二个名额让给不相似的候选"""
+    sims = np.array([
+        [1.0, 0.99, 0.1],
+        [0.99, 1.0, 0.1],
+        [0.1, 0.1, 1.0],
+    ])
+    scores = np.array([1.0, 0.95, 0.6])
+
+    assert list(mmr_select(sims, scores, 2, 0.5)) == [0, 2]
+    # lam=1 时只看相关度
+    assert list(mmr_select(sims, scores, 2, 1.0)) == [0, 1]
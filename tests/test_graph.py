@@ -2,6 +2,9 @@ import pytest
 from src.graph import graph
 from src.state import AgentState
 
+# 整个 Graph 端到端运行，会真实调用 LLM
+pytestmark = pytest.mark.integration
+
 
 def test_search_decision():
     """测试搜索判断"""
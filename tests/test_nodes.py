@@ -0,0 +1,201 @@
+from src.nodes import _rule_classify
+
+
+def test_rule_classify_short_circuits_obvious_queries(monkeypatch):
+    """算式、寒暄无需搜索；带时效词或年份的问题走网络搜索，长问题的复杂度交给 LLM"""
+    from types import SimpleNamespace
+    from src import nodes
+
+    monkeypatch.setattr(nodes, "get_rag_manager", lambda: SimpleNamespace(count=lambda: 0))
+    assert _rule_classify("1 + 2 * (3 - 4)") == ("NONE", "SIMPLE")
+    assert _rule_classify("你好！") == ("NONE", "SIMPLE")
+    assert _rule_classify("Hello") == ("NONE", "SIMPLE")
+    # 纯数字不是算式
+    assert _rule_classify("2025") == ("WEB", "SIMPLE")
+    assert _rule_classify("今天北京天气怎么样") == ("WEB", "SIMPLE")
+    assert _rule_classify("2024年奥运会在哪举办？") == ("WEB", None)
+    assert _rule_classify("北京 天气") == ("WEB", "SIMPLE")
+    assert _rule_classify("  RAG 原理 ") == ("WEB", "SIMPLE")
+
+
+def test_rule_classify_short_query_uses_knowledge_base(monkeypatch):
+    """知识库非空时，短关键词查询和时效性问题走混合检索而不是只搜网络"""
+    from types import SimpleNamespace
+    from src import nodes
+
+    monkeypatch.setattr(nodes, "get_rag_manager", lambda: SimpleNamespace(count=lambda: 3))
+    assert _rule_classify("项目代号 北极星") == ("HYBRID", "SIMPLE")
+    assert _rule_classify("今天北京天气怎么样") == ("HYBRID", "SIMPLE")
+    assert _rule_classify("2023年报营收是多少") == ("HYBRID", "SIMPLE")
+
+
+def test_decide_search_keeps_llm_complexity_for_time_sensitive_questions(tmp_path, monkeypatch):
+    """时效性长问题的搜索类型由规则确定，复杂度仍由 LLM 判断"""
+    import dataclasses
+    from types import SimpleNamespace
+    from src import nodes
+    from src.utils.query_cache import QueryCache
+
+    monkeypatch.setattr(nodes, "get_rag_manager", lambda: SimpleNamespace(count=lambda: 0))
+    monkeypatch.setattr(nodes, "get_decide_cache", lambda: QueryCache(str(tmp_path / "q.db"), kind="decide"))
+    monkeypatch.setattr(nodes, "_classify_query", lambda query: ("LOCAL", "COMPLEX"))
+    monkeypatch.setattr(nodes, "Config", dataclasses.replace(
+        nodes.Config, USE_SEMANTIC_CACHE=False, SPECULATIVE_EXPAND=False
+    ))
+
+    state = nodes.decide_search({"current_query": "分析2024年以来数字经济对中亚国家的影响"})
+
+    assert state["search_type"] == "web"
+    assert state["use_multi_query"] is True
+
+
+def test_rule_classify_falls_back_to_llm():
+    """无法高置信判断的问题返回 None，交给 LLM"""
+    assert _rule_classify("Python 如何定义函数？") is None
+    assert _rule_classify("RAG 是什么？") is None
+    assert _rule_classify("分析数字经济对中亚国家的影响") is None
+    assert _rule_classify("911") is None
+
+
+def test_rule_classify_short_questions_go_to_llm(monkeypatch):
+    """短的问句或生成类请求不走关键词快速路径（可能无需搜索或应查本地知识库）"""
+    from types import SimpleNamespace
+    from src import nodes
+
+    monkeypatch.setattr(nodes, "get_rag_manager", lambda: SimpleNamespace(count=lambda: 0))
+    assert _rule_classify("写一首关于秋天的诗") is None
+    assert _rule_classify("什么是向量数据库") is None
+    assert _rule_classify("RAG 是什么") is None
+    assert _rule_classify("翻译 hello world") is None
+    assert _rule_classify("how to embed") is None
+
+
+def test_stream_labeled_lines_parses_and_stops_early(monkeypatch):
+    """逐行解析 KEY: value（兼容加粗、全角冒号），拿到所有字段后不再读取后续输出"""
+    from types import SimpleNamespace
+    from src import nodes
+
+    consumed = []
+
+    class FakeLLM:
+        def stream(self, messages, config=None):
+            for piece in ["**TYPE**: hyb", "rid\nCOMPLEXITY：", "COMPLEX\n", "后面的解释", "不应被读取"]:
+                consumed.append(piece)
+                yield SimpleNamespace(content=piece)
+
+    monkeypatch.setattr(nodes, "get_llm", lambda task="answer": FakeLLM())
+
+    fields = nodes._stream_labeled_lines([], ("TYPE", "COMPLEXITY"), "classify")
+
+    assert fields == {"TYPE": "hybrid", "COMPLEXITY": "COMPLEX"}
+    assert len(consumed) == 3
+
+
+def test_dedup_web_hits_keeps_first_occurrence_in_order():
+    """多个查询返回的网络结果按 URL 去重，保留首次出现的条目且不打乱顺序"""
+    from src.nodes import _dedup_web_hits
+
+    batch = [
+        {"results": [{"url": "b", "content": "1"}, {"url": "a", "content": "2"}]},
+        [{"url": "a", "content": "3"}, {"link": "c", "content": "4"}],
+        {"results": [], "answer": "即时答案"},
+    ]
+
+    hits = _dedup_web_hits(batch)
+
+    assert [h["content"] for h in hits] == ["1", "2", "4", "即时答案"]
+    assert _dedup_web_hits([]) == []
+
+
+def test_top_contexts_orders_by_score():
+    """多个子查询合并后的本地结果按分数取前 k 条，同分保持原顺序"""
+    from src.nodes import _top_contexts
+
+    contexts = [{"content": c, "score": s} for c, s in [("a", 0.1), ("b", 0.9), ("c", 0.5), ("d", 0.9)]]
+    assert [ctx["content"] for ctx in _top_contexts(contexts, 3)] == ["b", "d", "c"]
+    assert _top_contexts([], 5) == []
+
+
+def test_bounded_history_summarizes_every_dropped_message(monkeypatch):
+    """被裁掉的消息要么已合并进摘要，要么仍在 prompt 中，一次裁掉多轮时也不丢失"""
+    import dataclasses
+
+    from langchain_core.messages import AIMessage, HumanMessage
+    from src import nodes
+
+    merged = []
+
+    def fake_summarize(summary, messages):
+        merged.extend(messages)
+        return f"{summary}+{len(messages)}"
+
+    monkeypatch.setattr(nodes, "_summarize_history", fake_summarize)
+    monkeypatch.setattr(nodes, "Config", dataclasses.replace(nodes.Config, MAX_HISTORY_TOKENS=50, HISTORY_SUMMARY_EVERY=2))
+
+    history = []
+    for i in range(20):
+        history += [HumanMessage(content=f"问题{i}"), AIMessage(content=f"回答{i}")]
+    state = {"messages": history}
+
+    trimmed, summary, upto = nodes._bounded_history(state)
+    kept = [m for m in trimmed if isinstance(m, (HumanMessage, AIMessage))]
+    assert upto > 0 and merged == history[:upto]
+    assert kept == history[upto:]
+
+    # 再追加一轮：只裁掉 1 轮（未攒够），新裁掉的消息留在 prompt 中而不是丢失
+    state.update(messages=history + [HumanMessage(content="问题20"), AIMessage(content="回答20")],
+                 history_summary=summary, history_summarized_upto=upto)
+    trimmed, _, upto2 = nodes._bounded_history(state)
+    assert upto2 == upto
+    assert [m for m in trimmed if isinstance(m, (HumanMessage, AIMessage))] == state["messages"][upto:]
+
+
+def test_reflect_rejudges_appended_refine_results(tmp_path, monkeypatch):
+    """改进搜索把结果追加到末尾后，反思节点重新评估，而不是命中上一轮的缓存"""
+    import numpy as np
+    from src import nodes
+    from src.rag.semantic_cache import SemanticCache
+    from src.utils.query_cache import QueryCache
+
+    verdicts = iter([
+        ["insufficient", "缺少数据", "RAG 论文 2020"],
+        ["sufficient", "已覆盖", ""],
+    ])
+    calls = []
+
+    def fake_reflect(reflect_input):
+        calls.append(reflect_input)
+        return next(verdicts)
+
+    monkeypatch.setattr(nodes, "_reflect", fake_reflect)
+    monkeypatch.setattr(nodes, "get_reflect_cache", lambda: QueryCache(str(tmp_path / "q.db"), kind="reflect"))
+    decision_cache = SemanticCache(str(tmp_path / "s.db"), table="decision_cache")
+    monkeypatch.setattr(nodes, "get_decision_cache", lambda: decision_cache)
+    # 单个问题总是得到同一向量（语义缓存按问题必然命中）；改进查询之间互不相似
+    monkeypatch.setattr(nodes, "embed_query", lambda text: (
+        np.eye(len(text), 4, dtype=np.float32) if isinstance(text, list) else np.ones(4, dtype=np.float32) / 2
+    ))
+
+    state = {"current_query": "RAG 是谁提出的", "search_results": "网页" * 2000, "loop_count": 0}
+    state = nodes.reflect_on_results(state)
+    assert state["reflection_result"] == "insufficient"
+
+    state["search_results"] += "\n\n--- 改进搜索结果 ---\nLewis et al. 2020"
+    state = nodes.reflect_on_results(state)
+
+    assert len(calls) == 2
+    assert "Lewis et al. 2020" in calls[1]
+    assert state["reflection_result"] == "sufficient"
+    assert not state["refine_converged"]
+
+
+def test_semantic_cache_key_separates_dates_and_numbers():
+    """只差日期或数字的问题向量几乎相同，不能共用检索结果；换种说法的问题仍可共用"""
+    from src.rag.semantic_cache import _config_hash
+
+    def key(query):
+        return _config_hash("search_web", {"search_type": "web", "current_query": query}, False)
+
+    assert key("今天北京天气") != key("明天北京天气")
+    assert key("2024年诺贝尔文学奖") != key("2025年诺贝尔文学奖")
+    assert key("什么是 RAG") == key("RAG 是什么")
@@ -1,7 +1,11 @@
 import os
+import pytest
 from dotenv import load_dotenv
 load_dotenv()
 from src.tools import create_search_tool
+
+
+@pytest.mark.integration
 def test_create_search_tool():
     query = "2025年诺贝尔物理学奖得主是谁"
 